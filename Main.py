@@ -3,39 +3,84 @@ import threading
 import signal
 from concurrent.futures import ThreadPoolExecutor
 
+import state
+import services
+from services import supervisor
 from utils import (
     is_tesseract_installed,
-    check_resolution,
     wait_for_aces,
     handle_focus_loss,
     log
 )
-from detection import start_detection_thread, stop_detection_thread
-from server import start_server
+from server import start_server, SERVER_PORT
 from discord_rpc import start_discord_rpc
-import rangefinder_logic
+from session_recorder import start_recorder, stop_recorder
+from event_feed import start_event_feed
+from memory_budget import start_memory_watchdog
+from screen_layout import layout
 
 shutdown_event = threading.Event()
 
-def initialize_services():
-    log("Starting services: detection, Discord RPC, rangefinder, minimap tracking, web server...", level="INFO", tag="PROCESS")
-
-    start_detection_thread()
-    start_discord_rpc()
+def load_pipeline():
+    """Import the detection and rangefinder modules (cv2, mss, pytesseract): the slow part of startup."""
+    import detection
+    import rangefinder_logic
+    return detection, rangefinder_logic
+
+def _probe(executor, name, func):
+    """Run func in the background and record the outcome under `name` in services."""
+    def run():
+        try:
+            result = func()
+        except Exception as e:
+            services.mark_failed(name, str(e))
+            log(f"Startup of {name} failed: {e}", level="ERROR", tag="PROCESS")
+            raise
+        if result is False:
+            services.mark_failed(name, "unavailable")
+        else:
+            services.mark_ready(name)
+        return result
+    return executor.submit(run)
 
-    rangefinder_thread = threading.Thread(target=rangefinder_logic.start_rangefinder, daemon=True)
-    rangefinder_thread.start()
+def initialize_services():
+    """
+    Bring the web UI up first, then everything else as its dependencies become ready.
+    Tesseract, screen layout, Discord and the heavy imports are probed concurrently while we wait for the game.
+    """
+    start_recorder()
+    start_event_feed()
+    start_memory_watchdog()
+    threading.Thread(target=start_server, name="web-server", daemon=True).start()
+    log(f"Dashboard at http://localhost:{SERVER_PORT} (services still starting).", level="INFO", tag="PROCESS")
+
+    executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="startup")
+    tesseract = _probe(executor, "tesseract", is_tesseract_installed)
+    _probe(executor, "screen", layout.refresh)
+    _probe(executor, "discord", start_discord_rpc)
+    pipeline = _probe(executor, "rangefinder", load_pipeline)
+    executor.shutdown(wait=False)
+
+    if not tesseract.result():
+        log("Tesseract is not installed. Please install it and ensure it's in your PATH.", level="ERROR", tag="PROCESS")
+        sys.exit(1)
 
-    # Start web server
-    start_server()
+    state.game_state = "Waiting for aces.exe"
+    wait_for_aces()
 
-    return rangefinder_thread
+    detection, rangefinder_logic = pipeline.result()
+    log("Starting services: detection, rangefinder, minimap tracking...", level="INFO", tag="PROCESS")
+    rangefinder_logic.start_rangefinder()
+    detection.start_detection_thread()
+    services.mark_ready("detection")
+    return detection
 
 
 def cleanup():
     log("Shutting down all services...", level="INFO", tag="PROCESS")
     shutdown_event.set()
-    stop_detection_thread()
+    supervisor.stop_all()
+    stop_recorder()
     log("All services stopped.", level="INFO", tag="PROCESS")
 
 
@@ -49,20 +94,12 @@ def main():
     signal.signal(signal.SIGINT, signal_handler)
     signal.signal(signal.SIGTERM, signal_handler)
 
-    check_resolution()
-
-    if not is_tesseract_installed():
-        log("Tesseract is not installed. Please install it and ensure it's in your PATH.", level="ERROR", tag="PROCESS")
-        sys.exit(1)
-
-    wait_for_aces()
-
-    rangefinder_thread = initialize_services()
+    detection = initialize_services()
 
     try:
-        handle_focus_loss(stop_detection_thread, start_detection_thread)
+        handle_focus_loss(detection.stop_detection_thread, detection.start_detection_thread)
     except KeyboardInterrupt:
         signal_handler(None, None)
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -2,7 +2,8 @@ import time
 from PIL import Image
 import numpy as np
 import pyautogui
-from scipy.ndimage import label, center_of_mass
+
+from blob_detection import find_blobs
 
 # Define minimap region size
 MINIMAP_REGION_WIDTH = 500
@@ -32,15 +33,8 @@ def detect_enemy_in_region(image):
     return enemy_mask
 
 def find_clusters(mask, min_size=10):
-    labeled_array, num_features = label(mask)
-    centroids = []
-    for i in range(1, num_features + 1):
-        cluster_mask = labeled_array == i
-        cluster_size = np.sum(cluster_mask)
-        if cluster_size >= min_size:
-            centroid = center_of_mass(mask, labeled_array, i)
-            centroids.append(centroid)
-    return centroids
+    """Return (row, col) centroids of connected clusters with at least min_size pixels."""
+    return [(blob.centroid[1], blob.centroid[0]) for blob in find_blobs(mask, min_area=min_size)]
 
 if __name__ == "__main__":
     screen_width, screen_height = pyautogui.size()
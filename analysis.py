@@ -1,10 +1,42 @@
 # analysis.py
 from utils import fuzzy_contains
 from state import stats
+from session_recorder import record
 
-def analyze_text(extracted_text):
-    """Analyze the extracted text for hit/kill events and update stats."""
-    text = extracted_text.lower()
+# OCR confidence (0-100) required of the word a fragment is found in.
+# Short fragments match noise easily, so they need a confident read.
+SHORT_FRAGMENT_LENGTH = 3
+SHORT_FRAGMENT_MIN_CONF = 75
+FRAGMENT_MIN_CONF = 40
+
+def confident_contains(words, fragments):
+    """
+    Return True if any fragment is found in an OCR word read with enough confidence.
+    Punctuation-only fragments (e.g. "-") must be a whole word, so "T-34" does not match "-".
+    """
+    for fragment in fragments:
+        required = SHORT_FRAGMENT_MIN_CONF if len(fragment) <= SHORT_FRAGMENT_LENGTH else FRAGMENT_MIN_CONF
+        whole_word = not any(ch.isalnum() for ch in fragment)
+        for word in words:
+            if word.conf < required:
+                continue
+            text = word.text.lower()
+            if (text == fragment) if whole_word else (fragment in text):
+                return True
+    return False
+
+def _matcher(extracted_text, words):
+    if words is None:
+        text = extracted_text.lower()
+        return lambda fragments: fuzzy_contains(text, fragments)
+    return lambda fragments: confident_contains(words, fragments)
+
+def detect_events(extracted_text, words=None):
+    """
+    Return (description, stat keys) pairs for the hit/kill events found in the extracted text.
+    When OCR words with confidences are given, fragments only count in confidently read words.
+    """
+    contains = _matcher(extracted_text, words)
     events = []
 
     fire_fragments = ["fire"]
@@ -17,49 +49,44 @@ def analyze_text(extracted_text):
     extended_ammo_fragments = ["ammo", "amme", "amm"]
     fuel_fragments = ["fuel"]
 
-    if fuzzy_contains(text, fire_fragments):
-        events.append("Enemy set on fire")
-        stats["fires"] += 1
-    if fuzzy_contains(text, crew_fragments):
-        events.append("Enemy Crew knocked out")
-        stats["kills"] += 1
-    if fuzzy_contains(text, crit_fragments):
-        events.append("Enemy Critical Hit")
-        stats["crits"] += 1
-    elif fuzzy_contains(text, hit_fragments):
-        events.append("Enemy Hit")
-        stats["hits"] += 1
-    if fuzzy_contains(text, ricochet_fragments):
-        events.append("Ricochet")
-        stats["ricochets"] += 1
-    if fuzzy_contains(text, non_penetration_fragments):
-        events.append("Non-penetration")
-        stats["non_penetrations"] += 1
-    if fuzzy_contains(text, explosion_fragments):
-        if fuzzy_contains(text, extended_ammo_fragments) and fuzzy_contains(text, fuel_fragments):
-            events.append("Enemy killed by ammunition and fuel explosion")
-            stats["ammo_explosions"] += 1
-            stats["fuel_explosions"] += 1
-            stats["kills"] += 1
-        elif fuzzy_contains(text, extended_ammo_fragments):
-            events.append("Enemy killed by ammunition explosion")
-            stats["ammo_explosions"] += 1
-            stats["kills"] += 1
-        elif fuzzy_contains(text, fuel_fragments):
-            events.append("Enemy killed by fuel explosion")
-            stats["fuel_explosions"] += 1
-            stats["kills"] += 1
+    if contains(fire_fragments):
+        events.append(("Enemy set on fire", ["fires"]))
+    if contains(crew_fragments):
+        events.append(("Enemy Crew knocked out", ["kills"]))
+    if contains(crit_fragments):
+        events.append(("Enemy Critical Hit", ["crits"]))
+    elif contains(hit_fragments):
+        events.append(("Enemy Hit", ["hits"]))
+    if contains(ricochet_fragments):
+        events.append(("Ricochet", ["ricochets"]))
+    if contains(non_penetration_fragments):
+        events.append(("Non-penetration", ["non_penetrations"]))
+    if contains(explosion_fragments):
+        if contains(extended_ammo_fragments) and contains(fuel_fragments):
+            events.append(("Enemy killed by ammunition and fuel explosion", ["ammo_explosions", "fuel_explosions", "kills"]))
+        elif contains(extended_ammo_fragments):
+            events.append(("Enemy killed by ammunition explosion", ["ammo_explosions", "kills"]))
+        elif contains(fuel_fragments):
+            events.append(("Enemy killed by fuel explosion", ["fuel_explosions", "kills"]))
         else:
-            events.append("Enemy killed by unspecified explosion")
-            stats["unknown_events"] += 1
+            events.append(("Enemy killed by unspecified explosion", ["unknown_events"]))
+    return events
+
+def analyze_text(extracted_text, words=None):
+    """Analyze the extracted text for hit/kill events and update stats."""
+    events = detect_events(extracted_text, words)
+    for description, counters in events:
+        for counter in counters:
+            stats[counter] += 1
+        record("hit", event=description, counters=counters)
 
     if not events:
-        events.append("No significant events detected")
-    return "; ".join(events)
+        return "No significant events detected"
+    return "; ".join(description for description, _ in events)
 
-def analyze_modules_text(extracted_text):
+def analyze_modules_text(extracted_text, words=None):
     """Analyze the extracted text for modules and return a summary string."""
-    text = extracted_text.lower()
+    contains = _matcher(extracted_text, words)
     modules_detected = []
     module_fragments = {
         "Track": ["track", "tra"],
@@ -81,10 +108,10 @@ def analyze_modules_text(extracted_text):
     }
     for module, fragments in module_fragments.items():
         if module == "Ammo":
-            if any(fuzzy_contains(text, [frag]) for frag in fragments):
+            if any(contains([frag]) for frag in fragments):
                 modules_detected.append(module)
         else:
-            if all(fuzzy_contains(text, [frag]) for frag in fragments):
+            if all(contains([frag]) for frag in fragments):
                 modules_detected.append(module)
     if not modules_detected:
         modules_detected.append("No significant modules detected")
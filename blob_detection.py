@@ -0,0 +1,52 @@
+# blob_detection.py
+from collections import namedtuple
+
+import cv2
+import numpy as np
+
+# centroid is (x, y) in sub-pixel image coordinates; bbox is (left, top, width, height).
+Blob = namedtuple("Blob", ["centroid", "area", "bbox"])
+
+def find_blobs(mask, min_area=1, max_area=None, max_aspect=None, min_fill=None, connectivity=8):
+    """
+    Split a binary mask into connected components in a single O(pixels) pass.
+
+    Components are filtered by pixel area, bounding-box aspect ratio (long side / short side)
+    and fill ratio (area / bbox area), and returned largest first.
+    """
+    mask_u8 = mask.view(np.uint8) if mask.dtype == bool else mask
+    num_labels, _, stats, centroids = cv2.connectedComponentsWithStats(mask_u8, connectivity=connectivity)
+    if num_labels <= 1:
+        return []
+
+    # Row 0 is the background component.
+    stats = stats[1:]
+    centroids = centroids[1:]
+    areas = stats[:, cv2.CC_STAT_AREA]
+    widths = stats[:, cv2.CC_STAT_WIDTH]
+    heights = stats[:, cv2.CC_STAT_HEIGHT]
+
+    keep = areas >= min_area
+    if max_area is not None:
+        keep &= areas <= max_area
+    if max_aspect is not None:
+        long_side = np.maximum(widths, heights)
+        short_side = np.minimum(widths, heights)
+        keep &= long_side <= max_aspect * short_side
+    if min_fill is not None:
+        keep &= areas >= min_fill * widths * heights
+
+    blobs = []
+    for i in np.flatnonzero(keep)[np.argsort(-areas[keep], kind="stable")]:
+        left, top, width, height, area = (int(v) for v in stats[i])
+        blobs.append(Blob((float(centroids[i][0]), float(centroids[i][1])), area, (left, top, width, height)))
+    return blobs
+
+def blob_circle(blob, max_radius=None):
+    """Return an integer (center, radius) marker circle enclosing the blob's bounding box."""
+    left, top, width, height = blob.bbox
+    center = (int(round(blob.centroid[0])), int(round(blob.centroid[1])))
+    radius = int(np.ceil(np.hypot(width, height) / 2))
+    if max_radius is not None and radius > max_radius:
+        radius = max_radius
+    return center, radius
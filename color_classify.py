@@ -0,0 +1,254 @@
+# color_classify.py
+"""
+Colour classification backends.
+
+Every colour mask in the pipeline (minimap player/ping/enemy markers, OCR region masks) is
+produced through one of two operations:
+
+    near(image, targets, tolerance, out)   pixels within Euclidean `tolerance` of any target colour
+    in_ranges(image, bounds, out)          pixels inside any per-channel (lower, upper) box
+
+Both return a uint8 mask (0/255) written into `out` when given. Several implementations exist;
+backend() benchmarks them on this CPU the first time it is called and keeps the fastest one
+that agrees with the NumPy reference.
+"""
+import threading
+import time
+
+import cv2
+import numpy as np
+
+from utils import log
+from memory_budget import ShapePool
+
+try:
+    import numba
+except ImportError:
+    numba = None
+
+# Force a backend by name ("numpy", "opencv", "numba"); None benchmarks at startup.
+COLOR_BACKEND = None
+# Benchmark frame (the minimap capture size) and repetitions per backend
+BENCH_SHAPE = (432, 432)
+BENCH_REPEATS = 5
+# Scratch arrays kept per thread and backend (a handful per frame size)
+SCRATCH_CAPACITY = 16
+
+class _Scratch:
+    """Per-thread scratch arrays keyed by (purpose, shape, dtype), capped per thread."""
+
+    def __init__(self):
+        self._local = threading.local()
+
+    def get(self, name, shape, dtype):
+        buffers = getattr(self._local, "buffers", None)
+        if buffers is None:
+            buffers = self._local.buffers = ShapePool(lambda key: np.empty(key[1], dtype=key[2]), SCRATCH_CAPACITY)
+        return buffers.get((name, shape, dtype))
+
+def _output(image, out):
+    return np.empty(image.shape[:2], dtype=np.uint8) if out is None else out
+
+class NumpyBackend:
+    """Reference implementation: int32 squared distances and boolean comparisons."""
+    name = "numpy"
+
+    def __init__(self):
+        self.scratch = _Scratch()
+
+    def near(self, image, targets, tolerance, out=None):
+        out = _output(image, out)
+        h, w = image.shape[:2]
+        diff = self.scratch.get("diff", (h, w, 3), np.int32)
+        dist = self.scratch.get("dist", (h, w), np.int32)
+        hit = self.scratch.get("hit", (h, w), bool)
+        acc = self.scratch.get("acc", (h, w), bool)
+        acc.fill(False)
+        tol_sq = tolerance * tolerance
+        for target in targets:
+            np.subtract(image, np.asarray(target, dtype=np.int32), out=diff, dtype=np.int32)
+            np.multiply(diff, diff, out=diff)
+            np.sum(diff, axis=2, out=dist)
+            np.less(dist, tol_sq, out=hit)
+            np.logical_or(acc, hit, out=acc)
+        np.multiply(acc, 255, out=out, casting="unsafe")
+        return out
+
+    def in_ranges(self, image, bounds, out=None):
+        out = _output(image, out)
+        h, w = image.shape[:2]
+        above = self.scratch.get("above", (h, w, 3), bool)
+        below = self.scratch.get("below", (h, w, 3), bool)
+        inside = self.scratch.get("inside", (h, w), bool)
+        acc = self.scratch.get("acc", (h, w), bool)
+        acc.fill(False)
+        for lower, upper in bounds:
+            np.greater_equal(image, lower, out=above)
+            np.less_equal(image, upper, out=below)
+            np.logical_and(above, below, out=above)
+            np.all(above, axis=2, out=inside)
+            np.logical_or(acc, inside, out=acc)
+        np.multiply(acc, 255, out=out, casting="unsafe")
+        return out
+
+class OpenCVBackend:
+    """
+    OpenCV's SIMD kernels on uint8/uint16 data: absdiff, a squaring LUT, a channel-sum
+    transform and compare for distances; inRange for boxes.
+    """
+    name = "opencv"
+    # Squares of 0..255 as uint16, so the LUT output keeps the input's channel layout.
+    SQUARES = (np.arange(256, dtype=np.uint32) ** 2).clip(max=65535).astype(np.uint16)
+    CHANNEL_SUM = np.ones((1, 3), dtype=np.float32)
+
+    def __init__(self):
+        self.scratch = _Scratch()
+
+    def near(self, image, targets, tolerance, out=None):
+        out = _output(image, out)
+        h, w = image.shape[:2]
+        diff = self.scratch.get("diff", (h, w, 3), np.uint8)
+        squared = self.scratch.get("squared", (h, w, 3), np.uint16)
+        dist = self.scratch.get("dist", (h, w), np.uint16)
+        hit = self.scratch.get("hit", (h, w), np.uint8)
+        out.fill(0)
+        tol_sq = float(tolerance * tolerance)
+        for target in targets:
+            cv2.absdiff(image, tuple(float(v) for v in target) + (0.0,), dst=diff)
+            cv2.LUT(diff, self.SQUARES, dst=squared)
+            # uint16 saturates at 65535, which is beyond any tolerance we compare against.
+            cv2.transform(squared, self.CHANNEL_SUM, dst=dist)
+            cv2.compare(dist, tol_sq, cv2.CMP_LT, dst=hit)
+            cv2.bitwise_or(out, hit, dst=out)
+        return out
+
+    def in_ranges(self, image, bounds, out=None):
+        out = _output(image, out)
+        hit = self.scratch.get("hit", image.shape[:2], np.uint8)
+        out.fill(0)
+        for lower, upper in bounds:
+            cv2.inRange(image, np.asarray(lower, dtype=np.uint8), np.asarray(upper, dtype=np.uint8), dst=hit)
+            cv2.bitwise_or(out, hit, dst=out)
+        return out
+
+if numba is not None:
+    @numba.njit(cache=True, nogil=True)
+    def _numba_near(image, targets, tol_sq, out):
+        h, w = out.shape
+        n = targets.shape[0]
+        for y in range(h):
+            for x in range(w):
+                value = 0
+                for t in range(n):
+                    d0 = np.int32(image[y, x, 0]) - targets[t, 0]
+                    d1 = np.int32(image[y, x, 1]) - targets[t, 1]
+                    d2 = np.int32(image[y, x, 2]) - targets[t, 2]
+                    if d0 * d0 + d1 * d1 + d2 * d2 < tol_sq:
+                        value = 255
+                        break
+                out[y, x] = value
+
+    @numba.njit(cache=True, nogil=True)
+    def _numba_in_ranges(image, lowers, uppers, out):
+        h, w = out.shape
+        n = lowers.shape[0]
+        for y in range(h):
+            for x in range(w):
+                value = 0
+                for b in range(n):
+                    if (lowers[b, 0] <= image[y, x, 0] <= uppers[b, 0] and
+                            lowers[b, 1] <= image[y, x, 1] <= uppers[b, 1] and
+                            lowers[b, 2] <= image[y, x, 2] <= uppers[b, 2]):
+                        value = 255
+                        break
+                out[y, x] = value
+
+class NumbaBackend:
+    """Single pass per pixel with early exit on the first matching colour (needs numba)."""
+    name = "numba"
+
+    def near(self, image, targets, tolerance, out=None):
+        out = _output(image, out)
+        _numba_near(np.ascontiguousarray(image), np.asarray(targets, dtype=np.int32).reshape(-1, 3),
+                    tolerance * tolerance, out)
+        return out
+
+    def in_ranges(self, image, bounds, out=None):
+        out = _output(image, out)
+        lowers = np.array([lower for lower, _ in bounds], dtype=np.uint8).reshape(-1, 3)
+        uppers = np.array([upper for _, upper in bounds], dtype=np.uint8).reshape(-1, 3)
+        _numba_in_ranges(np.ascontiguousarray(image), lowers, uppers, out)
+        return out
+
+def available_backends():
+    backends = [NumpyBackend(), OpenCVBackend()]
+    if numba is not None:
+        backends.append(NumbaBackend())
+    return backends
+
+def _bench_case():
+    """A frame and workload shaped like the minimap masks (many near targets, a few boxes)."""
+    rng = np.random.default_rng(0)
+    image = rng.integers(0, 256, size=BENCH_SHAPE + (3,), dtype=np.uint8)
+    targets = rng.integers(0, 256, size=(24, 3), dtype=np.uint8)
+    # Plant exact target pixels so the masks are not trivially empty.
+    image[::7, ::7] = targets[0]
+    bounds = [(np.clip(c.astype(np.int16) - 59, 0, 255).astype(np.uint8),
+               np.clip(c.astype(np.int16) + 59, 0, 255).astype(np.uint8)) for c in targets[:3]]
+    return image, targets, bounds
+
+def benchmark(backends=None, repeats=BENCH_REPEATS):
+    """Return {backend name: seconds per near+in_ranges pass} for backends that match the reference."""
+    image, targets, bounds = _bench_case()
+    reference = NumpyBackend()
+    expected_near = reference.near(image, targets, 4).copy()
+    expected_ranges = reference.in_ranges(image, bounds).copy()
+    out = np.empty(image.shape[:2], dtype=np.uint8)
+    timings = {}
+    for candidate in backends or available_backends():
+        try:
+            # The first call warms up caches (and compiles numba kernels).
+            if not np.array_equal(candidate.near(image, targets, 4, out), expected_near):
+                raise ValueError("near() disagrees with the NumPy reference")
+            if not np.array_equal(candidate.in_ranges(image, bounds, out), expected_ranges):
+                raise ValueError("in_ranges() disagrees with the NumPy reference")
+            best = float("inf")
+            for _ in range(repeats):
+                start = time.perf_counter()
+                candidate.near(image, targets, 4, out)
+                candidate.in_ranges(image, bounds, out)
+                best = min(best, time.perf_counter() - start)
+            timings[candidate.name] = best
+        except Exception as e:
+            log(f"Colour backend {candidate.name} rejected: {e}", level="WARN", tag="PROCESS")
+    return timings
+
+_backend = None
+_backend_lock = threading.Lock()
+
+def backend():
+    """The colour backend for this process, picked by benchmark (or COLOR_BACKEND) on first use."""
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                candidates = {b.name: b for b in available_backends()}
+                if COLOR_BACKEND in candidates:
+                    _backend = candidates[COLOR_BACKEND]
+                else:
+                    timings = benchmark(list(candidates.values()))
+                    name = min(timings, key=timings.get) if timings else "numpy"
+                    _backend = candidates[name]
+                    summary = ", ".join(f"{n} {t * 1000:.2f} ms" for n, t in sorted(timings.items(), key=lambda i: i[1]))
+                    log(f"Colour classification backend: {name} ({summary})", level="INFO", tag="PROCESS")
+    return _backend
+
+def near(image, targets, tolerance, out=None):
+    return backend().near(image, targets, tolerance, out)
+
+def in_ranges(image, bounds, out=None):
+    return backend().in_ranges(image, bounds, out)
+
+if __name__ == "__main__":
+    for name, seconds in sorted(benchmark().items(), key=lambda i: i[1]):
+        print(f"{name:8s} {seconds * 1000:.3f} ms")
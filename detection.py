@@ -1,58 +1,33 @@
 # detection.py
 import time
-import threading
-import pyautogui
 import os
-import pytesseract
+from PIL import Image
 
 import state
+from screen_layout import layout
 from utils import log, fuzzy_contains, is_aces_running, is_aces_in_focus
-from image_processing import (
-    extract_text_from_image,
-    extract_battle_text_from_image,
-    extract_gear_text_from_image,
-    extract_modules_text_from_image,
-    preprocess_image_for_colors,
-    preprocess_image_for_gear,
-)
+from image_processing import BAD_FRAME_CONFIDENCE
+from ocr_pipeline import PIPELINES, ocr_region, extract_modules_result_from_image
 from analysis import analyze_text, analyze_modules_text
+from session_recorder import record
+from ocr_consensus import LineConsensus
+from feed_lines import FeedLineReader
 
-from rangefinder_logic import ocr_map_name, OCR_REGION, map_configs
+import services
+from services import supervisor
 
-REGION_WIDTH = 450
-REGION_HEIGHT = 50
-BATTLE_REGION_WIDTH = 200
-BATTLE_REGION_HEIGHT = 65
-GEAR_REGION_WIDTH = 250
-GEAR_REGION_HEIGHT = 100
-MODULE_REGION_WIDTH = 200
-MODULE_REGION_HEIGHT = 300
-MODULE_OFFSET_DOWN = 20
-
-STAT_REGION = (40, 77, 300, 35)
-MAIN_MENU_REGION = (300, 878, 1020, 20)
-
-_stop_event = threading.Event()
-_detection_thread = None
-_statistics_thread = None
-_main_menu_thread = None
+# Splits the kill feed into lines and OCRs only lines it has not seen recently
+_feed_reader = FeedLineReader()
+# Fuses kill-feed reads across frames so each feed line is counted exactly once
+_feed_consensus = LineConsensus()
+# Gear preview screenshots are saved once per match (reset on "To Battle!")
+_gear_logged = False
 
 
 def detection_loop():
-    screen_width, screen_height = pyautogui.size()
-
-    # Define screen regions based on screen size
-    region_left = screen_width - REGION_WIDTH
-    region_top = 0
-
-    battle_left = (screen_width - BATTLE_REGION_WIDTH) // 2
-    battle_top = 0
-
-    gear_left = 0
-    gear_top = screen_height - GEAR_REGION_HEIGHT
-
-    module_left = screen_width - MODULE_REGION_WIDTH
-    module_top = REGION_HEIGHT + MODULE_OFFSET_DOWN
+    global _gear_logged
+    # Regions come from screen_layout; pick up a move or resize made while we were stopped.
+    layout.refresh()
 
     # Create the screenshots folder if it does not exist
     screenshot_folder = os.path.join("static", "screenshots")
@@ -63,56 +38,60 @@ def detection_loop():
     last_detection_time = time.time()
     prev_state = state.game_state
 
-    if not hasattr(detection_loop, "gear_logged"):
-        detection_loop.gear_logged = False
-
-    while not _stop_event.is_set():
+    while services.tick():
         if not is_aces_in_focus():
             if state.game_state != "Game Not In Focus":
                 log("aces.exe is out of focus. Pausing detection.", level="INFO", tag="DETECTION")
             state.game_state = "Game Not In Focus"
-            time.sleep(2)
+            services.sleep(2)
             continue
 
         if not is_aces_running():
             log("aces.exe not found. Pausing detection until process is available.", level="WARN", tag="PROCESS")
             state.game_state = "Waiting for aces.exe"
-            while not is_aces_running() and not _stop_event.is_set():
-                time.sleep(2)
+            while not is_aces_running() and services.sleep(2):
+                pass
             log("aces.exe detected again. Resuming detection.", level="INFO", tag="PROCESS")
             last_detection_time = time.time()
             continue
 
+        # Regions would grab the wrong pixels (minimized, off-screen, blank capture): skip the OCR.
+        if not layout.valid():
+            last_detection_time = time.time()
+            services.sleep(1)
+            continue
+
         # Capture battle region and extract text
-        battle_screenshot = pyautogui.screenshot(region=(battle_left, battle_top, BATTLE_REGION_WIDTH, BATTLE_REGION_HEIGHT))
-        battle_text = extract_battle_text_from_image(battle_screenshot).lower()
+        battle_screenshot = layout.grab("battle")
+        battle_text = ocr_region("battle", battle_screenshot).text.lower()
 
         if "to battle" in battle_text:
             last_battle_time = time.time()
             last_detection_time = time.time()
             log("Detected 'To Battle!' — assuming Main Menu.", tag="BATTLE")
             state.game_state = "In Menu"
-            state.stats["kills"] = 0
             state.last_event_result = ""
-            detection_loop.gear_logged = False
+            _feed_consensus.reset()
+            _feed_reader.reset()
+            _gear_logged = False
         else:
             if state.game_state not in ["In Game", "Game Not In Focus"]:
                 state.game_state = "Unknown"
 
         # Capture gear region and process gear OCR
-        gear_screenshot = pyautogui.screenshot(region=(0, screen_height - GEAR_REGION_HEIGHT, GEAR_REGION_WIDTH, GEAR_REGION_HEIGHT))
-        gear_text = extract_gear_text_from_image(gear_screenshot).lower()
+        gear_screenshot = layout.grab("gear")
+        gear_text = ocr_region("gear", gear_screenshot).text.lower()
 
         keywords = ["gear", "rpm", "spd", "km/h"]
         if any(keyword in gear_text for keyword in keywords):
             last_detection_time = time.time()
-            if not detection_loop.gear_logged:
+            if not _gear_logged:
                 raw_gear_filename = f"gear_raw_{int(time.time())}.png"
                 raw_gear_filepath = os.path.join(screenshot_folder, raw_gear_filename)
                 gear_screenshot.save(raw_gear_filepath)
                 raw_gear_link = f"http://localhost:5000/static/screenshots/{raw_gear_filename}"
 
-                processed_gear = preprocess_image_for_gear(gear_screenshot)
+                processed_gear = Image.fromarray(PIPELINES["gear"].run(gear_screenshot))
                 proc_gear_filename = f"gear_proc_{int(time.time())}.png"
                 proc_gear_filepath = os.path.join(screenshot_folder, proc_gear_filename)
                 processed_gear.save(proc_gear_filepath)
@@ -120,13 +99,15 @@ def detection_loop():
 
                 log(f"In-Game detected. Gear info preview (raw): {raw_gear_link}", tag="GEAR")
                 log(f"In-Game detected. Gear info preview (processed): {proc_gear_link}", tag="GEAR")
-                detection_loop.gear_logged = True
+                _gear_logged = True
         else:
             log("Gear info not detected in OCR output, skipping gear logging.", level="WARN", tag="GEAR")
 
         if time.time() - last_detection_time > 20:
             state.game_state = "Game Not In Focus"
-            time.sleep(1)
+            services.sleep(1)
+            if state.game_state != prev_state:
+                record("state", state=state.game_state, previous=prev_state)
             prev_state = state.game_state
             continue
 
@@ -134,32 +115,44 @@ def detection_loop():
         if last_battle_time is None or (current_time - last_battle_time > 10):
             if fuzzy_contains(gear_text, ["gear", "rpm", "spd", "km/h", "n"]):
                 state.game_state = "In Game"
-                screenshot = pyautogui.screenshot(region=(region_left, 0, REGION_WIDTH, REGION_HEIGHT))
-                extracted_text = extract_text_from_image(screenshot)
-                result = analyze_text(extracted_text)
-                state.last_event_result = result
-                state.last_event_timestamp = time.time()
-
-                main_menu_screenshot = pyautogui.screenshot(region=MAIN_MENU_REGION)
-                main_menu_text = pytesseract.image_to_string(main_menu_screenshot, lang="eng").strip()
+                screenshot = layout.grab("feed")
+                feed_result = _feed_reader.read(screenshot, confirmed=_feed_consensus.is_confirmed)
+                extracted_text = feed_result.text
+                if feed_result.words and feed_result.confidence < BAD_FRAME_CONFIDENCE:
+                    log(f"Discarding low-confidence feed read ({feed_result.confidence:.0f}): {extracted_text!r}",
+                        level="DEBUG", tag="OCR")
+                    new_lines = []
+                else:
+                    # Only feed lines confirmed over several frames are analyzed, each exactly once.
+                    new_lines = _feed_consensus.add(feed_result)
+                results = [r for r in (analyze_text(line.text, line.words) for line in new_lines)
+                           if "no significant events detected" not in r.lower()]
+                result = "; ".join(results) if results else "No significant events detected"
+                if results:
+                    state.last_event_result = result
+                    state.last_event_timestamp = time.time()
+
+                main_menu_screenshot = layout.grab("main_menu")
+                main_menu_text = ocr_region("main_menu", main_menu_screenshot).text.strip()
                 main_menu_keywords = ["usa", "germany", "ussr", "great britain", "japan", "china", "italy", "france", "sweden", "israel"]
                 if any(keyword in main_menu_text.lower() for keyword in main_menu_keywords):
                     log("Main Menu keywords detected in main menu region. Setting game state to In Menu.", level="INFO", tag="MAIN_MENU")
                     state.game_state = "In Menu"
 
-                if "no significant events detected" not in result.lower():
+                if results:
                     raw_filename = f"event_raw_{int(time.time())}.png"
                     raw_filepath = os.path.join(screenshot_folder, raw_filename)
                     screenshot.save(raw_filepath)
                     raw_link = f"http://localhost:5000/static/screenshots/{raw_filename}"
 
-                    processed_image = preprocess_image_for_colors(screenshot)
+                    processed_image = Image.fromarray(PIPELINES["feed_line"].run(screenshot))
                     proc_filename = f"event_proc_{int(time.time())}.png"
                     proc_filepath = os.path.join(screenshot_folder, proc_filename)
                     processed_image.save(proc_filepath)
                     proc_link = f"http://localhost:5000/static/screenshots/{proc_filename}"
 
                     log(f"Hit/Kill Region Text Detected:\n{extracted_text}", tag="REGION")
+                    log(f"Confirmed Feed Lines: {[f'{line.text} ({line.confidence:.0f}%)' for line in new_lines]}", tag="REGION")
                     log(f"Analysis Result: {result}", tag="ANALYSIS")
                     log("***** EVENT DETECTED *****", tag="EVENT")
                     log("-" * 60, tag="EVENT")
@@ -168,24 +161,27 @@ def detection_loop():
 
                     state.last_raw_event_snapshot = raw_link
                     state.last_processed_event_snapshot = proc_link
-                    module_screenshot = pyautogui.screenshot(region=(module_left, REGION_HEIGHT + MODULE_OFFSET_DOWN, MODULE_REGION_WIDTH, MODULE_REGION_HEIGHT))
-                    modules_extracted_text = extract_modules_text_from_image(module_screenshot)
-                    log(f"Module Region Raw Text:\n{modules_extracted_text}", tag="MODULE")
-                    modules_result = analyze_modules_text(modules_extracted_text)
+                    module_screenshot = layout.grab("modules")
+                    modules_ocr = extract_modules_result_from_image(module_screenshot)
+                    modules_extracted_text = modules_ocr.text
+                    log(f"Module Region Raw Text ({modules_ocr.confidence:.0f}%):\n{modules_extracted_text}", tag="MODULE")
+                    modules_result = analyze_modules_text(modules_extracted_text, modules_ocr.words)
                     log(f"Modules Analysis Result: {modules_result}", tag="MODULE")
                     state.last_modules_result = modules_result
+                    if "no significant modules detected" not in modules_result.lower():
+                        record("modules", modules=modules_result.split("; "))
                     state.last_modules_timestamp = time.time()
-                    time.sleep(4)
-                else:
-                    time.sleep(0.5)
+                services.sleep(0.5)
             else:
                 log("Gear info not detected, skipping hit/kill detection.", level="WARN", tag="GEAR")
                 state.game_state = "Unknown"
-                time.sleep(0.5)
+                services.sleep(0.5)
         else:
             log("Waiting due to recent 'To Battle!' detection...", level="INFO", tag="BATTLE")
-            time.sleep(0.5)
+            services.sleep(0.5)
 
+        if state.game_state != prev_state:
+            record("state", state=state.game_state, previous=prev_state)
         prev_state = state.game_state
 
 def statistics_check_loop():
@@ -196,22 +192,22 @@ def statistics_check_loop():
     """
     stats_screenshot_folder = os.path.join("static", "screenshots")
     prev_stats_state = None
-    while not _stop_event.is_set():
-        if is_aces_in_focus():
-            stat_screenshot = pyautogui.screenshot(region=STAT_REGION)
-            stat_filename = f"stats_{int(time.time())}.png"
-            stat_filepath = os.path.join(stats_screenshot_folder, stat_filename)
-            stat_screenshot.save(stat_filepath)
-            stat_text = pytesseract.image_to_string(stat_screenshot, lang="eng").strip()
+    while services.tick():
+        if is_aces_in_focus() and layout.valid():
+            stat_screenshot = layout.grab("stats")
+            stat_text = ocr_region("stats", stat_screenshot).text.strip()
             new_state = any(keyword.lower() in stat_text.lower() for keyword in ["conditions", "time", "left"])
             if prev_stats_state is None or new_state != prev_stats_state:
+                # Only the screenshots linked from the log are written to disk.
+                stat_filename = f"stats_{int(time.time())}.png"
+                stat_screenshot.save(os.path.join(stats_screenshot_folder, stat_filename))
                 state.statistics_open = new_state
                 if new_state:
                     log(f"Statistics detected. Screenshot URL: http://localhost:5000/static/screenshots/{stat_filename}", tag="STATS")
                 else:
                     log(f"Statistics no longer detected. Screenshot URL: http://localhost:5000/static/screenshots/{stat_filename}", tag="STATS")
                 prev_stats_state = new_state
-        time.sleep(2)
+        services.sleep(2)
 
 def main_menu_check_loop():
     """
@@ -223,15 +219,14 @@ def main_menu_check_loop():
     main_menu_screenshot_folder = os.path.join("static", "screenshots")
     main_menu_keywords = ["usa", "germany", "ussr", "great britain", "japan", "china", "italy", "france", "sweden", "israel"]
     prev_main_menu_state = None
-    while not _stop_event.is_set():
-        if is_aces_in_focus():
-            main_menu_screenshot = pyautogui.screenshot(region=MAIN_MENU_REGION)
-            main_menu_filename = f"main_menu_{int(time.time())}.png"
-            main_menu_filepath = os.path.join(main_menu_screenshot_folder, main_menu_filename)
-            main_menu_screenshot.save(main_menu_filepath)
-            main_menu_text = pytesseract.image_to_string(main_menu_screenshot, lang="eng").strip()
+    while services.tick():
+        if is_aces_in_focus() and layout.valid():
+            main_menu_screenshot = layout.grab("main_menu")
+            main_menu_text = ocr_region("main_menu", main_menu_screenshot).text.strip()
             new_state = any(keyword in main_menu_text.lower() for keyword in main_menu_keywords)
             if prev_main_menu_state is None or new_state != prev_main_menu_state:
+                main_menu_filename = f"main_menu_{int(time.time())}.png"
+                main_menu_screenshot.save(os.path.join(main_menu_screenshot_folder, main_menu_filename))
                 state.main_menu_open = new_state
                 if new_state:
                     log(f"Main Menu detected. Screenshot URL: http://localhost:5000/static/screenshots/{main_menu_filename}", tag="MAIN_MENU")
@@ -239,66 +234,21 @@ def main_menu_check_loop():
                 else:
                     log(f"Main Menu no longer detected. Screenshot URL: http://localhost:5000/static/screenshots/{main_menu_filename}", tag="MAIN_MENU")
                 prev_main_menu_state = new_state
-        time.sleep(2)
-
-def ocr_detection_loop():
-    global current_map, valid_map_detected, active_config, grid_offset_x, grid_offset_y, ocr_paused, cell_size_locked
-    while True:
-        if state.statistics_open:
-            log("Statistics open; pausing minimap name detection.", level="INFO", tag="OCR")
-            time.sleep(2)
-            continue
-        if state.main_menu_open:
-            log("Main Menu detected; pausing minimap name detection.", level="INFO", tag="OCR")
-            time.sleep(2)
-            continue
-
-        if state.game_state == "In Menu":
-            if valid_map_detected:
-                log("To Battle text detected; clearing active configuration.", level="INFO", tag="RANGE")
-                valid_map_detected = False
-                active_config = None
-                current_map = None
-                cell_size_locked = False
-            if not ocr_paused:
-                ocr_paused = True
-            time.sleep(2)
-            continue
-        else:
-            if ocr_paused:
-                log("Game in focus; resuming OCR detection.", level="INFO", tag="OCR")
-                ocr_paused = False
+        services.sleep(2)
 
-        if is_aces_in_focus():
-            log("Game in focus; running OCR to detect map name...", level="INFO", tag="OCR")
-            map_text = ocr_map_name(OCR_REGION)
-            log(f"OCR Result: {map_text}", level="DEBUG", tag="OCR")
-            for map_name in map_configs.keys():
-                if map_name.lower() in map_text.lower():
-                    current_map = map_name
-                    valid_map_detected = True
-                    active_config = map_configs[map_name]
-                    grid_offset_x, grid_offset_y = active_config.get("offset", (0, 0))
-                    log(f"Detected map: {current_map}", level="INFO", tag="OCR")
-                    break
-            if not valid_map_detected:
-                log("Map name not recognized. Retrying in 2 seconds...", level="WARN", tag="OCR")
-        time.sleep(2)
+DETECTION_WORKERS = ("detection", "statistics", "main_menu")
+supervisor.register("detection", detection_loop)
+supervisor.register("statistics", statistics_check_loop)
+supervisor.register("main_menu", main_menu_check_loop)
 
 def start_detection_thread():
-    """Start the detection loop, statistics check, and main menu check in separate daemon threads."""
-    global _detection_thread, _statistics_thread, _main_menu_thread
-    _stop_event.clear()
-    _detection_thread = threading.Thread(target=detection_loop, daemon=True)
-    _detection_thread.start()
-    _statistics_thread = threading.Thread(target=statistics_check_loop, daemon=True)
-    _statistics_thread.start()
-    _main_menu_thread = threading.Thread(target=main_menu_check_loop, daemon=True)
-    _main_menu_thread.start()
+    """Start the detection loop, statistics check and main menu check (no-op for any still running)."""
+    for name in DETECTION_WORKERS:
+        supervisor.start(name)
 
 def stop_detection_thread():
-    """Signal the detection loops (statistics and main menu checks) to stop."""
-    _stop_event.set()
+    """Stop the detection loops and wait for their threads to exit."""
+    supervisor.stop_all(DETECTION_WORKERS)
 
 def main():
     start_detection_thread()
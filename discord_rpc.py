@@ -1,62 +1,175 @@
 # discord_rpc.py
-import time
+import os
 import threading
-from pypresence import Presence
+import time
+
+from dotenv import load_dotenv
+
 import state
+import services
+from services import supervisor
 from utils import log
-from dotenv import load_dotenv
-import os
+from match_stats import aggregator
+from session_recorder import subscribe
+
+# Discord accepts about 5 presence updates per 20 s; stay under that.
+MIN_UPDATE_INTERVAL = 4.0
+# Changes arriving within this window are sent as one update
+COALESCE_S = 0.5
+# Re-check the presence this often even without events (e.g. focus changes that are not recorded)
+IDLE_CHECK_S = 5.0
+# Reconnect delay doubles per failed attempt up to RECONNECT_MAX
+RECONNECT_BASE = 2.0
+RECONNECT_MAX = 60.0
+
+BLANK_STATE = "\u200b\u200b"
+
+def build_presence():
+    """The presence to show for the current game state. Reads shared state only."""
+    current_state = state.game_state
+    if current_state == "In Game":
+        details = f"In-Game (Kills: {aggregator.current_count('kills')})"
+    elif current_state == "In Menu":
+        details = "In Main Menu"
+    elif current_state == "Game Not In Focus":
+        details = "Idle"
+    else:
+        details = current_state
+
+    event_text = BLANK_STATE
+    if current_state != "In Menu":
+        result = state.last_event_result
+        if result and result.lower().strip() != "no significant events detected":
+            event_text = result
+    return {"details": details, "state": event_text}
 
-load_dotenv()
-DISCORD_CLIENT_ID = os.getenv("DISCORD_CLIENT_ID")
-
-if not DISCORD_CLIENT_ID:
-    log("Discord Client ID is missing! Set it in the .env file.", level="ERROR", tag="DISCORD")
-    exit(1)
-
-def discord_presence_loop():
-    rpc = Presence(DISCORD_CLIENT_ID)
-    try:
-        rpc.connect()
-    except Exception as e:
-        log(f"Failed to connect to Discord RPC: {e}", level="ERROR", tag="DISCORD")
-        return
-    log("Connected to Discord RPC", tag="DISCORD")
-    start_time = time.time()
-    while True:
+class FakePresence:
+    """Offline stand-in for pypresence.Presence; records updates and can simulate a dropped pipe."""
+
+    def __init__(self, client_id=None, fail_after=None):
+        self.client_id = client_id
+        self.connected = False
+        self.updates = []
+        self.fail_after = fail_after
+
+    def connect(self):
+        self.connected = True
+
+    def update(self, **presence):
+        if not self.connected:
+            raise ConnectionError("not connected")
+        if self.fail_after is not None and len(self.updates) >= self.fail_after:
+            self.connected = False
+            self.fail_after = None
+            raise ConnectionError("pipe closed")
+        self.updates.append((time.time(), presence))
+        log(f"[fake IPC] presence update: {presence}", level="DEBUG", tag="DISCORD")
+
+    def close(self):
+        self.connected = False
+
+class PresencePublisher:
+    """
+    Publishes Discord presence from session events.
+
+    Events only mark the presence dirty; the publisher waits COALESCE_S for bursts to settle,
+    sends the result only if it differs from what Discord already shows, never faster than
+    MIN_UPDATE_INTERVAL, and reconnects with backoff when the IPC pipe breaks.
+    """
+
+    def __init__(self, client_factory):
+        self.client_factory = client_factory
+        self.client = None
+        self.start_time = time.time()
+        self.last_sent = None
+        self.last_send_time = 0.0
+        self.updates_sent = 0
+        self.updates_skipped = 0
+        self._dirty = threading.Event()
+
+    def notify(self, *_):
+        """Session event subscriber: something the presence may depend on changed."""
+        self._dirty.set()
+
+    def _connect(self):
+        attempt = 0
+        while self.client is None:
+            try:
+                # Constructing the client can fail too (pypresence needs an event loop on some versions).
+                client = self.client_factory()
+                client.connect()
+            except Exception as e:
+                attempt += 1
+                delay = min(RECONNECT_MAX, RECONNECT_BASE * 2 ** (attempt - 1))
+                log(f"Failed to connect to Discord RPC ({e}); retrying in {delay:g}s.", level="WARN", tag="DISCORD")
+                if not services.sleep(delay):
+                    return False
+                continue
+            self.client = client
+            # A fresh connection shows nothing yet: publish right away.
+            self.last_sent = None
+            self._dirty.set()
+            log("Connected to Discord RPC", tag="DISCORD")
+        return True
+
+    def publish(self):
+        """Send the current presence if it changed; returns True if an update was sent."""
+        presence = build_presence()
+        if presence == self.last_sent:
+            self.updates_skipped += 1
+            return False
+        wait = self.last_send_time + MIN_UPDATE_INTERVAL - time.time()
+        if wait > 0 and not services.sleep(wait):
+            return False
+        # Whatever changed while we were rate limited goes out in this same update.
+        presence = build_presence()
         try:
-            current_state = state.game_state
-            if current_state == "In Game":
-                details = f"In-Game (Kills: {state.stats['kills']})"
-            elif current_state == "In Menu":
-                details = "In Main Menu"
-                state.stats["kills"] = 0
-                state.last_event_result = ""
-            elif current_state == "Game Not In Focus":
-                details = "Idle"
-            elif current_state == "Unknown":
-                details = "Unknown"
-            else:
-                details = current_state
-
-            if current_state == "In Menu":
-                event_text = "\u200b\u200b"
-            else:
-                if state.last_event_result and state.last_event_result.lower().strip() != "no significant events detected":
-                    event_text = state.last_event_result
-                else:
-                    event_text = "\u200b\u200b"
-
-            rpc.update(
-                details=details,
-                state=event_text,
-                large_image="wtlogo",
-                large_text="War Thunder",
-                start=start_time
-            )
+            self.client.update(large_image="wtlogo", large_text="War Thunder", start=self.start_time, **presence)
         except Exception as e:
-            log(f"Error updating Discord RPC: {e}", level="ERROR", tag="DISCORD")
-        time.sleep(1)
+            log(f"Discord RPC update failed ({e}); reconnecting.", level="WARN", tag="DISCORD")
+            try:
+                self.client.close()
+            except Exception:
+                pass
+            self.client = None
+            return False
+        self.last_sent = presence
+        self.last_send_time = time.time()
+        self.updates_sent += 1
+        return True
+
+    def run(self):
+        while services.tick():
+            if not self._connect():
+                break
+            if self._dirty.wait(IDLE_CHECK_S):
+                # Let a burst of events settle before reading state.
+                if not services.sleep(COALESCE_S):
+                    break
+            self._dirty.clear()
+            self.publish()
+        if self.client is not None:
+            self.client.close()
+
+def _presence_factory(client_id):
+    if client_id == "fake":
+        return lambda: FakePresence(client_id)
+    # pypresence is only needed once Discord RPC actually starts.
+    from pypresence import Presence
+    return lambda: Presence(client_id)
 
 def start_discord_rpc():
-    threading.Thread(target=discord_presence_loop, daemon=True).start()
\ No newline at end of file
+    """
+    Start the presence publisher; without a DISCORD_CLIENT_ID the rest of the app runs without it.
+    DISCORD_CLIENT_ID=fake uses an offline fake IPC endpoint that only logs the updates.
+    """
+    load_dotenv()
+    client_id = os.getenv("DISCORD_CLIENT_ID")
+    if not client_id:
+        log("Discord Client ID is missing! Set it in the .env file. Discord RPC disabled.", level="ERROR", tag="DISCORD")
+        return False
+    publisher = PresencePublisher(_presence_factory(client_id))
+    subscribe(publisher.notify)
+    supervisor.register("discord", publisher.run)
+    supervisor.start("discord")
+    return True
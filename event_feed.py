@@ -0,0 +1,155 @@
+# event_feed.py
+"""
+Streaming feed of session events for overlays and bots.
+
+Every event passed to session_recorder.record() gets a sequence number and is kept in a ring
+buffer of EVENT_FEED_SIZE events. GET /events streams them as newline-delimited JSON, or as
+Server-Sent Events when the client asks for text/event-stream (or passes format=sse):
+
+    /events?since=<id>           resume after the last event id the client has seen
+                                 (SSE clients resume automatically through Last-Event-ID)
+    /events?type=hit,map         only these event types
+    /events?tag=kind:enemy       only events whose field has this value (repeatable; all must match)
+    /events?follow=0             return what is buffered and close instead of streaming
+
+Each event is {"id", "seq", "ts", "type", "fields"}. The id is "<boot>-<seq>": sequence numbers
+start over when the app restarts, so an id from an earlier run (a different boot) replays this
+run's buffer after a {"type": "reset"} record. A bare sequence number is also accepted for since;
+it can only be recognized as stale when it is newer than anything this run has seen. If events
+after `since` were already dropped from the buffer, a {"type": "gap", "missed": n} record comes
+first.
+"""
+import json
+import os
+import threading
+import time
+from collections import deque
+from itertools import islice
+
+from flask import Blueprint, Response, request
+
+from session_recorder import subscribe
+
+# Events kept for resuming clients
+EVENT_FEED_SIZE = 5000
+# Idle streams send a keep-alive this often so proxies and clients notice dead connections
+KEEPALIVE_S = 15.0
+# Concurrent streams allowed; each holds one web server thread
+MAX_STREAMS = 4
+# Tells event ids of this run from those of earlier runs, whose sequence numbers overlap
+BOOT_ID = f"{os.getpid():x}{int(time.time()):x}"
+
+events_bp = Blueprint("events", __name__)
+
+class EventFeed:
+    """Ring buffer of sequenced events with blocking waits for new ones."""
+
+    def __init__(self, size=EVENT_FEED_SIZE):
+        self._events = deque(maxlen=size)
+        self._cond = threading.Condition()
+        self.last_seq = 0
+
+    def publish(self, timestamp, event_type, fields):
+        """session_recorder subscriber: O(1), never blocks the detection threads for long."""
+        with self._cond:
+            self.last_seq += 1
+            self._events.append({"id": f"{BOOT_ID}-{self.last_seq}", "seq": self.last_seq, "ts": round(timestamp, 3), "type": event_type,
+                                 "fields": dict(fields)})
+            self._cond.notify_all()
+
+    def after(self, seq):
+        """(events with a sequence number above seq, how many of those were already dropped)."""
+        with self._cond:
+            if not self._events:
+                return [], 0
+            first = self._events[0]["seq"]
+            start = max(seq + 1 - first, 0)
+            return list(islice(self._events, start, None)), max(first - seq - 1, 0)
+
+    def wait(self, seq, timeout):
+        """Block until an event above seq exists or timeout passes; returns True if one does."""
+        with self._cond:
+            return self._cond.wait_for(lambda: self.last_seq > seq, timeout)
+
+feed = EventFeed()
+_streams = threading.BoundedSemaphore(MAX_STREAMS)
+
+def start_event_feed():
+    """Start collecting recorded events for /events."""
+    subscribe(feed.publish)
+
+def _matcher(types, tags):
+    def matches(event):
+        if types and event["type"] not in types:
+            return False
+        fields = event["fields"]
+        return all(str(fields.get(name)) == value for name, value in tags)
+    return matches
+
+def _parse_since(value):
+    """(sequence number, stale) for a since / Last-Event-ID value; stale means it is from another run."""
+    boot, _, seq = value.rpartition("-")
+    try:
+        seq = max(int(seq), 0)
+    except ValueError:
+        return 0, False
+    if boot:
+        return (0, True) if boot != BOOT_ID else (seq, False)
+    return seq, seq > feed.last_seq
+
+def _parse_request():
+    since, stale = _parse_since(request.args.get("since", request.headers.get("Last-Event-ID", "0")))
+    types = {t.strip() for value in request.args.getlist("type") for t in value.split(",") if t.strip()}
+    tags = [tuple(tag.split(":", 1)) for tag in request.args.getlist("tag") if ":" in tag]
+    sse = request.args.get("format") == "sse" or (
+        request.args.get("format") != "ndjson" and "text/event-stream" in request.headers.get("Accept", ""))
+    follow = request.args.get("follow", "1").lower() not in ("0", "false", "no")
+    return since, stale, types, tags, sse, follow
+
+def _encode(record, sse):
+    data = json.dumps(record, separators=(",", ":"), default=str)
+    if not sse:
+        return data + "\n"
+    if "id" in record:
+        return f"id: {record['id']}\nevent: {record['type']}\ndata: {data}\n\n"
+    return f"event: {record['type']}\ndata: {data}\n\n"
+
+def _stream(since, stale, matches, sse, follow):
+    if stale:
+        # The client saw events from an earlier run; sequence numbers started over.
+        yield _encode({"type": "reset", "boot": BOOT_ID, "last_seq": feed.last_seq}, sse)
+        since = 0
+    events, missed = feed.after(since)
+    if missed and since:
+        yield _encode({"type": "gap", "missed": missed}, sse)
+    while True:
+        for event in events:
+            since = event["seq"]
+            if matches(event):
+                yield _encode(event, sse)
+        if not follow:
+            return
+        deadline = time.time() + KEEPALIVE_S
+        while not feed.wait(since, max(deadline - time.time(), 0)):
+            yield ": keep-alive\n\n" if sse else "\n"
+            deadline = time.time() + KEEPALIVE_S
+        events, missed = feed.after(since)
+        if missed:
+            yield _encode({"type": "gap", "missed": missed}, sse)
+
+@events_bp.route("/events")
+def events_endpoint():
+    since, stale, types, tags, sse, follow = _parse_request()
+    mimetype = "text/event-stream" if sse else "application/x-ndjson"
+    matches = _matcher(types, tags)
+    if not follow:
+        return Response("".join(_stream(since, stale, matches, sse, False)), mimetype=mimetype)
+    if not _streams.acquire(blocking=False):
+        return Response(json.dumps({"error": f"at most {MAX_STREAMS} event streams at a time"}),
+                        status=503, mimetype="application/json", headers={"Retry-After": "5"})
+
+    response = Response(_stream(since, stale, matches, sse, True), mimetype=mimetype,
+                        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+    # The server closes the response when the client disconnects, even if streaming never started.
+    response.call_on_close(_streams.release)
+    return response
@@ -0,0 +1,120 @@
+# feed_lines.py
+"""
+Kill-feed line segmentation.
+
+The kill feed is a stack of coloured text lines. Rather than OCR the whole region as one block
+(which lets fragments of neighbouring lines mix), the feed colour mask is projected onto the
+vertical axis: rows with enough text pixels form line bands. Each band is hashed from its mask
+pixels, and only bands not seen in the last RECENT_S seconds are OCR'd, one line at a time.
+Lines that merely scrolled up reuse their earlier read, but only once cross-frame consensus has
+confirmed that read: until then every frame OCRs the line again, so a reused copy of one
+misread never votes for itself.
+"""
+import hashlib
+import time
+
+import numpy as np
+from PIL import Image
+
+import color_classify
+from image_processing import KILL_FEED_RANGES, OcrLine, OcrResult, ocr_with_retry, preprocess_image_for_grayscale_threshold
+from ocr_pipeline import PIPELINES
+
+# A row is part of a text line when at least this many of its pixels match a feed colour
+MIN_ROW_PIXELS = 2
+# Blank gaps up to this many rows inside a band (dots, accents) do not split it
+MERGE_GAP = 2
+# Bands shorter than this are noise; taller ones are two touching lines and are cut at the emptiest row
+MIN_LINE_HEIGHT = 5
+MAX_LINE_HEIGHT = 24
+# Rows added above and below a band so descenders and ascenders are not clipped
+LINE_PAD = 2
+# A line whose hash was seen this recently reuses that read (once confirmed) instead of running OCR again
+RECENT_S = 10.0
+
+def segment_lines(mask, min_row_pixels=MIN_ROW_PIXELS, merge_gap=MERGE_GAP):
+    """(top, bottom) row spans of the text lines in a 0/255 mask, top to bottom; bottom is exclusive."""
+    profile = np.count_nonzero(mask, axis=1)
+    rows = np.flatnonzero(profile >= min_row_pixels)
+    if rows.size == 0:
+        return []
+    # Split the text rows wherever the gap to the next text row is larger than merge_gap.
+    breaks = np.flatnonzero(np.diff(rows) > merge_gap + 1)
+    starts = np.concatenate(([rows[0]], rows[breaks + 1]))
+    ends = np.concatenate((rows[breaks], [rows[-1]])) + 1
+    spans = []
+    for top, bottom in zip(starts.tolist(), ends.tolist()):
+        height = bottom - top
+        if height < MIN_LINE_HEIGHT:
+            continue
+        if height > MAX_LINE_HEIGHT:
+            # Two lines without a blank row between them: cut at the emptiest row near the middle.
+            middle = top + height // 4 + int(np.argmin(profile[top + height // 4:bottom - height // 4]))
+            spans.extend([(top, middle), (middle, bottom)])
+        else:
+            spans.append((top, bottom))
+    height = mask.shape[0]
+    return [(max(top - LINE_PAD, 0), min(bottom + LINE_PAD, height)) for top, bottom in spans]
+
+def line_hash(mask, top, bottom):
+    """Hash of a line's mask pixels, independent of its vertical position in the feed."""
+    band = mask[top:bottom]
+    columns = np.flatnonzero(band.any(axis=0))
+    if columns.size:
+        band = band[:, columns[0]:columns[-1] + 1]
+    digest = hashlib.blake2b(digest_size=12)
+    digest.update(str(band.shape).encode())
+    digest.update(np.ascontiguousarray(band).tobytes())
+    return digest.digest()
+
+def _as_line(result):
+    """Fold a single-line OCR result into one OcrLine (Tesseract may still split it)."""
+    words = sorted(result.words, key=lambda w: w.box[0])
+    return OcrLine(" ".join(w.text for w in words), words) if words else None
+
+class FeedLineReader:
+    """Reads the kill feed line by line, running OCR only for lines it has not seen recently."""
+
+    def __init__(self, recent_s=RECENT_S):
+        self.recent_s = recent_s
+        self._recent = {}
+        self._mask = None
+        self.lines_seen = 0
+        self.lines_ocred = 0
+
+    def read(self, image, timestamp=None, confirmed=None):
+        """
+        OcrResult with one OcrLine per readable feed line, top to bottom. A cached read is reused
+        only if confirmed(line) is true (pass LineConsensus.is_confirmed); otherwise it is OCR'd again.
+        """
+        timestamp = time.time() if timestamp is None else timestamp
+        arr = np.ascontiguousarray(np.asarray(image)[:, :, :3])
+        if self._mask is None or self._mask.shape != arr.shape[:2]:
+            self._mask = np.empty(arr.shape[:2], dtype=np.uint8)
+        mask = color_classify.in_ranges(arr, KILL_FEED_RANGES, out=self._mask)
+        for key in [k for k, (_, seen) in self._recent.items() if timestamp - seen > self.recent_s]:
+            del self._recent[key]
+
+        lines = []
+        for top, bottom in segment_lines(mask):
+            self.lines_seen += 1
+            key = line_hash(mask, top, bottom)
+            cached = self._recent.get(key)
+            if cached is not None and (cached[0] is None or (confirmed is not None and confirmed(cached[0]))):
+                line = cached[0]
+            else:
+                self.lines_ocred += 1
+                result = ocr_with_retry(Image.fromarray(arr[top:bottom]),
+                                        [PIPELINES["feed_line"], preprocess_image_for_grayscale_threshold])
+                line = _as_line(result)
+            self._recent[key] = (line, timestamp)
+            if line is not None:
+                lines.append(line)
+        return OcrResult(lines, preprocess="feed_line")
+
+    def reset(self):
+        self._recent = {}
+
+    def stats(self):
+        return {"lines_seen": self.lines_seen, "lines_ocred": self.lines_ocred,
+                "reuse_rate": round(1 - self.lines_ocred / self.lines_seen, 3) if self.lines_seen else None}
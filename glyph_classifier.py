@@ -0,0 +1,319 @@
+# glyph_classifier.py
+"""
+Optional in-process recognizer for the HUD font.
+
+The HUD draws a small fixed font in a few colours, so a single text line can be read without
+Tesseract: the binarized output of a region pipeline is split into glyphs by connected
+components (pieces overlapping horizontally, like the dot of an "i", are merged), each glyph is
+cropped to the line height and resized to a GLYPH_SIZE bitmap, and the nearest template in the
+model by cosine similarity gives its character. Gaps wider than SPACE_GAP line heights are word
+breaks.
+
+A high score alone does not mean the glyph is known: a character missing from the training
+fixtures ("C" with only "G" templates) still lands close to a similar one. So a glyph is only
+accepted when its best character beats the best template of any other character by the model's
+min_margin; a read with any glyph under it returns None and the caller falls back to Tesseract.
+
+The model is trained offline from the labelled OCR fixtures (fixtures/ocr/<region>/*.png + .txt)
+of pipelines with "glyphs": True and saved as a compressed NumPy archive. Every HOLDOUT_EVERY-th
+crop is held out. min_margin is set just above the largest margin of a held-out misread and of
+every training glyph classified with its own character removed from the model (a stand-in for
+characters the fixtures never show); the held-out accuracy with that margin is printed before
+the final model is built from all crops:
+
+    python glyph_classifier.py train [fixtures_dir]
+
+Without a model file every read goes to Tesseract as before.
+"""
+import os
+import sys
+import threading
+
+import cv2
+import numpy as np
+
+from utils import log
+from image_processing import OcrLine, OcrResult, OcrWord
+
+GLYPH_MODEL_PATH = os.path.join("models", "glyphs.npz")
+# Normalized glyph bitmap (width, height)
+GLYPH_SIZE = (10, 16)
+# Reads with any glyph whose best character beats the runner-up character by less than this many
+# points (cosine similarity x 100) go to Tesseract; train() raises it to cover held-out misreads
+MIN_MARGIN = 5.0
+# Added to the largest held-out misread margin when train() sets a model's min_margin
+MARGIN_SLACK = 1.0
+# Every this-many-th labelled crop of a region is held out to calibrate min_margin
+HOLDOUT_EVERY = 5
+# A horizontal gap wider than this many line heights separates words
+SPACE_GAP = 0.35
+# Components smaller than this many pixels are noise
+MIN_GLYPH_AREA = 4
+# Pieces overlapping horizontally by at least this fraction of the narrower one form one glyph
+MERGE_OVERLAP = 0.5
+# More glyphs than this is not a single HUD line; leave it to Tesseract
+MAX_GLYPHS = 80
+# Training keeps at most this many templates per character
+MAX_TEMPLATES = 40
+
+def text_mask(processed):
+    """Text-white binary image from a pipeline output (dark text on a light background)."""
+    _, binary = cv2.threshold(processed, 127, 255, cv2.THRESH_BINARY_INV)
+    return binary
+
+def segment_glyphs(binary):
+    """Bounding boxes (x, y, width, height) of the glyphs in a text-white binary image, left to right."""
+    count, _, stats, _ = cv2.connectedComponentsWithStats(binary, connectivity=8)
+    boxes = sorted(tuple(int(v) for v in stats[i, :4]) for i in range(1, count)
+                   if stats[i, cv2.CC_STAT_AREA] >= MIN_GLYPH_AREA)
+    glyphs = []
+    for x, y, w, h in boxes:
+        if glyphs:
+            gx, gy, gw, gh = glyphs[-1]
+            overlap = min(gx + gw, x + w) - max(gx, x)
+            if overlap >= MERGE_OVERLAP * min(w, gw):
+                left, top = min(gx, x), min(gy, y)
+                glyphs[-1] = (left, top, max(gx + gw, x + w) - left, max(gy + gh, y + h) - top)
+                continue
+        glyphs.append((x, y, w, h))
+    return glyphs
+
+def glyph_features(binary, glyphs):
+    """(n, features) float32 matrix of L2-normalized glyph bitmaps, cropped to the line's height."""
+    top = min(y for _, y, _, _ in glyphs)
+    bottom = max(y + h for _, y, _, h in glyphs)
+    features = np.empty((len(glyphs), GLYPH_SIZE[0] * GLYPH_SIZE[1]), dtype=np.float32)
+    for i, (x, _, w, _) in enumerate(glyphs):
+        # Keeping the line's vertical extent lets ".", "-" and "'" differ by position, not just shape.
+        cell = cv2.resize(binary[top:bottom, x:x + w], GLYPH_SIZE, interpolation=cv2.INTER_AREA)
+        features[i] = cell.reshape(-1)
+    norms = np.linalg.norm(features, axis=1, keepdims=True)
+    np.divide(features, np.maximum(norms, 1e-6), out=features)
+    return features
+
+class GlyphModel:
+    """Nearest-template classifier over normalized glyph bitmaps."""
+
+    def __init__(self, features, labels, min_margin=MIN_MARGIN):
+        self.features = np.asarray(features, dtype=np.float32)
+        self.labels = np.asarray(labels)
+        self.min_margin = float(min_margin)
+        self._allowed = {}
+
+    @classmethod
+    def load(cls, path=GLYPH_MODEL_PATH):
+        with np.load(path) as data:
+            min_margin = float(data["min_margin"]) if "min_margin" in data.files else MIN_MARGIN
+            return cls(data["features"], data["labels"], min_margin)
+
+    def save(self, path=GLYPH_MODEL_PATH):
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        np.savez_compressed(path, features=self.features.astype(np.float16), labels=self.labels,
+                            min_margin=np.float32(self.min_margin))
+
+    def _templates(self, whitelist):
+        if not whitelist:
+            return self.features, self.labels
+        if whitelist not in self._allowed:
+            keep = np.isin(self.labels, list(whitelist))
+            self._allowed[whitelist] = (self.features[keep], self.labels[keep])
+        return self._allowed[whitelist]
+
+    def classify(self, binary, glyphs, whitelist=None):
+        """(characters, confidences, margins) for segmented glyphs; scores are cosine similarity x 100."""
+        features, labels = self._templates(whitelist)
+        scores = glyph_features(binary, glyphs) @ features.T
+        best = scores.argmax(axis=1)
+        rows = np.arange(len(glyphs))
+        chars = labels[best]
+        confidences = 100.0 * scores[rows, best]
+        # Runner-up: the best template of any other character (with one character there is none).
+        others = np.where(labels[None, :] == chars[:, None], -np.inf, scores)
+        runner_up = 100.0 * others.max(axis=1) if len(set(labels.tolist())) > 1 else np.full(len(glyphs), -np.inf)
+        return chars, confidences, confidences - runner_up
+
+    def read(self, processed, whitelist=None, preprocess=None):
+        """OcrResult for one text line in a pipeline output, or None when unsure."""
+        binary = text_mask(processed)
+        glyphs = segment_glyphs(binary)
+        if not glyphs:
+            return OcrResult(preprocess=preprocess)
+        _, labels = self._templates(whitelist)
+        if len(glyphs) > MAX_GLYPHS or not len(labels):
+            return None
+        chars, confidences, margins = self.classify(binary, glyphs, whitelist)
+        if margins.min() < self.min_margin:
+            return None
+
+        line_height = max(y + h for _, y, _, h in glyphs) - min(y for _, y, _, _ in glyphs)
+        words, current = [], []
+        for i, glyph in enumerate(glyphs):
+            if current and glyph[0] - (glyphs[i - 1][0] + glyphs[i - 1][2]) > SPACE_GAP * line_height:
+                words.append(current)
+                current = []
+            current.append(i)
+        words.append(current)
+
+        ocr_words = []
+        for indices in words:
+            left = glyphs[indices[0]][0]
+            right = glyphs[indices[-1]][0] + glyphs[indices[-1]][2]
+            top = min(glyphs[i][1] for i in indices)
+            bottom = max(glyphs[i][1] + glyphs[i][3] for i in indices)
+            text = "".join(str(chars[i]) for i in indices)
+            ocr_words.append(OcrWord(text, float(confidences[indices].min()), (left, top, right - left, bottom - top)))
+        return OcrResult([OcrLine(" ".join(w.text for w in ocr_words), ocr_words)], preprocess)
+
+_model = None
+_model_loaded = False
+_model_lock = threading.Lock()
+
+def model():
+    """The trained GlyphModel, or None if GLYPH_MODEL_PATH does not exist (loaded once)."""
+    global _model, _model_loaded
+    if not _model_loaded:
+        with _model_lock:
+            if not _model_loaded:
+                if os.path.exists(GLYPH_MODEL_PATH):
+                    try:
+                        _model = GlyphModel.load(GLYPH_MODEL_PATH)
+                        log(f"Glyph classifier loaded: {len(_model.labels)} templates, "
+                            f"{len(set(_model.labels.tolist()))} characters", level="INFO", tag="OCR")
+                    except Exception as e:
+                        log(f"Could not load glyph model {GLYPH_MODEL_PATH}: {e}", level="WARN", tag="OCR")
+                _model_loaded = True
+    return _model
+
+def read(processed, whitelist=None, preprocess=None):
+    """Read a pipeline output with the glyph model; None when there is no model or it is unsure."""
+    glyph_model = model()
+    if glyph_model is None:
+        return None
+    return glyph_model.read(processed, whitelist, preprocess)
+
+def _labelled_crops(fixtures_dir):
+    """Yield (region, pipeline, expected text, processed, binary, glyphs) for each labelled crop of the glyph-enabled pipelines."""
+    from ocr_pipeline import PIPELINES
+    for name, pipeline in PIPELINES.items():
+        region_dir = os.path.join(fixtures_dir, name)
+        if not pipeline.glyphs or not os.path.isdir(region_dir):
+            continue
+        for filename in sorted(os.listdir(region_dir)):
+            stem, ext = os.path.splitext(filename)
+            label_path = os.path.join(region_dir, stem + ".txt")
+            if ext.lower() != ".png" or not os.path.exists(label_path):
+                continue
+            with open(label_path, "r", encoding="utf-8") as f:
+                expected = f.read().strip()
+            image = cv2.cvtColor(cv2.imread(os.path.join(region_dir, filename)), cv2.COLOR_BGR2RGB)
+            processed = pipeline.run(image)
+            binary = text_mask(processed)
+            yield name, pipeline, expected, processed, binary, segment_glyphs(binary)
+
+def _build(crops):
+    """GlyphModel from crops that segment into exactly one glyph per character, and {region: used, skipped}."""
+    templates = {}
+    report = {}
+    for name, _, expected, _, binary, glyphs in crops:
+        row = report.setdefault(name, {"used": 0, "skipped": 0})
+        chars = [c for c in expected if not c.isspace()]
+        # Only crops that segment into exactly one glyph per character can be labelled.
+        if not glyphs or len(glyphs) != len(chars):
+            row["skipped"] += 1
+            continue
+        row["used"] += 1
+        for char, feature in zip(chars, glyph_features(binary, glyphs)):
+            bucket = templates.setdefault(char, [])
+            if len(bucket) < MAX_TEMPLATES:
+                bucket.append(feature)
+    if not templates:
+        return None, report
+    labels = [char for char, features in sorted(templates.items()) for _ in features]
+    features = np.stack([f for _, bucket in sorted(templates.items()) for f in bucket])
+    return GlyphModel(features, np.array(labels)), report
+
+def _unknown_margins(model, crops):
+    """Margins training glyphs get when their own character is missing from the model."""
+    margins = []
+    for _, _, expected, _, binary, glyphs in crops:
+        chars = [c for c in expected if not c.isspace()]
+        if not glyphs or len(glyphs) != len(chars):
+            continue
+        scores = glyph_features(binary, glyphs) @ model.features.T
+        own = model.labels[None, :] == np.array(chars)[:, None]
+        scores[own] = -np.inf
+        best = model.labels[scores.argmax(axis=1)]
+        runner_up = np.where(model.labels[None, :] == best[:, None], -np.inf, scores).max(axis=1)
+        found = np.isfinite(runner_up)
+        margins += (100.0 * (scores.max(axis=1) - runner_up))[found].tolist()
+    return margins
+
+def _calibrate(model, kept, held_out):
+    """Set model.min_margin from the training and held-out crops; returns the held-out accuracy with that margin."""
+    wrong_margins = _unknown_margins(model, kept)
+    unknown = len(wrong_margins)
+    for _, pipeline, expected, _, binary, glyphs in held_out:
+        chars = [c for c in expected if not c.isspace()]
+        if glyphs and len(glyphs) == len(chars) and len(glyphs) <= MAX_GLYPHS:
+            predicted, _, margins = model.classify(binary, glyphs, pipeline.whitelist)
+            wrong_margins += [m for p, c, m in zip(predicted.tolist(), chars, margins.tolist()) if p != c]
+    if wrong_margins:
+        model.min_margin = max(MIN_MARGIN, max(wrong_margins) + MARGIN_SLACK)
+
+    counts = {"crops": 0, "correct": 0, "rejected": 0, "wrong": 0}
+    for _, pipeline, expected, processed, _, _ in held_out:
+        counts["crops"] += 1
+        result = model.read(processed, pipeline.whitelist)
+        if result is None:
+            counts["rejected"] += 1
+        elif result.text.split() == expected.split():
+            counts["correct"] += 1
+        else:
+            counts["wrong"] += 1
+    counts["glyph_errors_before_margin"] = len(wrong_margins) - unknown
+    return counts
+
+def train(fixtures_dir=None):
+    """
+    Build a GlyphModel from labelled fixtures of the glyph-enabled pipelines, with min_margin
+    calibrated on held-out crops; returns (model, report, held-out accuracy).
+    """
+    from ocr_pipeline import FIXTURES_DIR
+    crops = list(_labelled_crops(fixtures_dir or FIXTURES_DIR))
+    counters = {}
+    held_out, kept = [], []
+    for crop in crops:
+        counters[crop[0]] = counters.get(crop[0], 0) + 1
+        (held_out if counters[crop[0]] % HOLDOUT_EVERY == 0 else kept).append(crop)
+
+    accuracy = None
+    partial, _ = _build(kept)
+    if partial is not None and held_out:
+        accuracy = _calibrate(partial, kept, held_out)
+    model, report = _build(crops)
+    if model is not None and partial is not None:
+        model.min_margin = partial.min_margin
+    return model, report, accuracy
+
+if __name__ == "__main__":
+    if len(sys.argv) >= 2 and sys.argv[1] == "train":
+        trained, summary, held_out = train(sys.argv[2] if len(sys.argv) > 2 else None)
+        for region, row in summary.items():
+            print(f"{region:10s} used {row['used']:4d}  skipped {row['skipped']:4d} (glyph count != label length)")
+        if held_out:
+            n = held_out["crops"]
+            print(f"Held out {n} crops (every {HOLDOUT_EVERY}th): {held_out['correct']} read correctly "
+                  f"({held_out['correct'] / n:.1%}), {held_out['rejected']} left to Tesseract, "
+                  f"{held_out['wrong']} misread ({held_out['glyph_errors_before_margin']} held-out glyph errors "
+                  f"before applying the margin)")
+        elif trained is not None:
+            print(f"Too few fixtures to hold any out; using the default margin of {MIN_MARGIN:g}.")
+        if trained is None:
+            print("No usable fixtures; model not written.")
+        else:
+            trained.save()
+            print(f"Wrote {GLYPH_MODEL_PATH}: {len(trained.labels)} templates, {len(set(trained.labels.tolist()))} characters, "
+                  f"min margin {trained.min_margin:.1f}")
+    else:
+        print(__doc__)
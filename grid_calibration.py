@@ -0,0 +1,156 @@
+# grid_calibration.py
+import math
+import threading
+import time
+
+import cv2
+import numpy as np
+
+from utils import log
+
+# Plausible minimap grid periods (pixels) at the 432x432 capture
+MIN_PERIOD = 35
+MAX_PERIOD = 90
+# Normalized autocorrelation needed to accept a fit
+MIN_CONFIDENCE = 0.3
+# Peaks within this fraction of the strongest one are treated as the fundamental (skips harmonics)
+HARMONIC_RATIO = 0.8
+# Search window (pixels) around the cached period for incremental refits
+REFIT_WINDOW = 3
+
+def line_profile(gray, axis):
+    """
+    Collapse the minimap onto one axis and high-pass it so grid lines become spikes.
+    axis=0 gives the column profile (vertical lines), axis=1 the row profile (horizontal lines).
+    """
+    profile = gray.mean(axis=axis, dtype=np.float32)
+    smooth = cv2.blur(profile.reshape(1, -1), (9, 1)).ravel()
+    profile = np.abs(profile - smooth)
+    return profile - profile.mean()
+
+def _autocorrelation(profile, min_lag, max_lag):
+    n = profile.shape[0]
+    energy = float(np.dot(profile, profile))
+    if energy <= 0:
+        return None
+    max_lag = min(max_lag, n // 2)
+    acf = np.zeros(max_lag + 2, dtype=np.float64)
+    for lag in range(max(1, min_lag - 1), max_lag + 2):
+        if lag >= n:
+            break
+        # Normalize by overlap length so long lags aren't penalized.
+        acf[lag] = np.dot(profile[:-lag], profile[lag:]) / (n - lag) * n / energy
+    return acf
+
+def estimate_period(profile, min_period=MIN_PERIOD, max_period=MAX_PERIOD):
+    """Return (sub-pixel period, confidence) from the profile's autocorrelation, or (None, 0.0)."""
+    acf = _autocorrelation(profile, min_period, max_period)
+    if acf is None:
+        return None, 0.0
+    hi = min(max_period, acf.shape[0] - 2)
+    if hi < min_period:
+        return None, 0.0
+    window = acf[min_period:hi + 1]
+    best = float(window.max())
+    if best <= 0:
+        return None, 0.0
+
+    # The first local maximum close to the best one is the fundamental period.
+    lag = min_period + int(np.argmax(window))
+    for candidate in range(min_period, hi + 1):
+        if acf[candidate] >= HARMONIC_RATIO * best and acf[candidate] >= acf[candidate - 1] and acf[candidate] >= acf[candidate + 1]:
+            lag = candidate
+            break
+
+    # Parabolic interpolation around the integer peak.
+    y0, y1, y2 = acf[lag - 1], acf[lag], acf[lag + 1]
+    denom = y0 - 2 * y1 + y2
+    shift = 0.5 * (y0 - y2) / denom if denom < 0 else 0.0
+    return lag + float(np.clip(shift, -0.5, 0.5)), min(float(acf[lag]), 1.0)
+
+def estimate_phase(profile, period):
+    """Return the sub-pixel position of the first grid line, in [0, period)."""
+    x = np.arange(profile.shape[0], dtype=np.float64)
+    weights = np.clip(profile, 0, None)
+    angle = np.angle(np.sum(weights * np.exp(-2j * math.pi * x / period)))
+    return (-angle * period / (2 * math.pi)) % period
+
+def fit_grid(image, min_period=MIN_PERIOD, max_period=MAX_PERIOD):
+    """
+    Fit the minimap grid from a BGR (or grayscale) capture.
+    Returns {"cell_block", "offset", "confidence"} with sub-pixel values, or None when no grid is found.
+    """
+    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY) if image.ndim == 3 else image
+    col_profile = line_profile(gray, axis=0)
+    row_profile = line_profile(gray, axis=1)
+    period_x, conf_x = estimate_period(col_profile, min_period, max_period)
+    period_y, conf_y = estimate_period(row_profile, min_period, max_period)
+    if period_x is None or period_y is None:
+        return None
+
+    # Minimap cells are square, so both axes share one period.
+    period = (period_x * conf_x + period_y * conf_y) / (conf_x + conf_y)
+    confidence = min(conf_x, conf_y)
+    if confidence < MIN_CONFIDENCE:
+        return None
+
+    offset = []
+    for profile in (col_profile, row_profile):
+        phase = estimate_phase(profile, period)
+        # Keep offsets small and signed, like the hand-tuned configs.
+        if phase > period / 2:
+            phase -= period
+        offset.append(round(float(phase), 2))
+    return {"cell_block": round(period, 3), "offset": offset, "confidence": round(confidence, 3)}
+
+class GridCalibrator:
+    """Caches one grid fit per map and refits only when the cached fit stops matching (e.g. zoom changes)."""
+
+    def __init__(self, recheck_interval=5.0):
+        self.recheck_interval = recheck_interval
+        self._fits = {}
+        self._last_check = {}
+        self._lock = threading.Lock()
+
+    def get(self, map_name):
+        with self._lock:
+            fit = self._fits.get(map_name)
+            return dict(fit) if fit else None
+
+    def forget(self, map_name=None):
+        with self._lock:
+            if map_name is None:
+                self._fits.clear()
+                self._last_check.clear()
+            else:
+                self._fits.pop(map_name, None)
+                self._last_check.pop(map_name, None)
+
+    def update(self, map_name, image, force=False):
+        """
+        Return the grid fit for `map_name`, refitting from `image` when needed.
+        A cached fit is re-validated at most every `recheck_interval` seconds; a narrow search
+        around the cached period is tried before falling back to a full search.
+        """
+        now = time.time()
+        with self._lock:
+            cached = self._fits.get(map_name)
+            if cached and not force and now - self._last_check.get(map_name, 0) < self.recheck_interval:
+                return dict(cached)
+            self._last_check[map_name] = now
+
+        fit = None
+        if cached and not force:
+            period = cached["cell_block"]
+            fit = fit_grid(image, max(2, int(period) - REFIT_WINDOW), int(math.ceil(period)) + REFIT_WINDOW)
+        if fit is None:
+            fit = fit_grid(image)
+        if fit is None:
+            return dict(cached) if cached else None
+
+        with self._lock:
+            if cached is None or abs(cached["cell_block"] - fit["cell_block"]) > 0.5:
+                log(f"Grid calibrated for {map_name}: cell_block={fit['cell_block']}, offset={fit['offset']}, "
+                    f"confidence={fit['confidence']}", level="INFO", tag="RANGE")
+            self._fits[map_name] = fit
+        return dict(fit)
@@ -1,94 +1,108 @@
 # image_processing.py
-import numpy as np
-from PIL import Image, ImageOps
+from collections import namedtuple
+
+from PIL import Image
 import pytesseract
-from pytesseract import TesseractError
+from pytesseract import TesseractError, Output
 
+import ocr_cache
 from utils import log
 
-def preprocess_image_for_colors(image):
-    """
-    Process the image for the hit/kill region using masking and inversion.
-    (This is your original color filtering method.)
-    """
-    np_image = np.array(image)
-    red_channel = np_image[:, :, 0]
-    green_channel = np_image[:, :, 1]
-    blue_channel = np_image[:, :, 2]
-    red_mask = (red_channel > 120) & (green_channel < 70) & (blue_channel < 100)
-    yellow_green_mask = (red_channel > 190) & (green_channel > 180) & (blue_channel < 60)
-    e4ac03_mask = (red_channel > 220) & (green_channel > 160) & (blue_channel < 50)
-    mask_90ca03 = ((red_channel > 130) & (red_channel < 160) &
-                   (green_channel > 190) & (green_channel < 220) &
-                   (blue_channel > 0) & (blue_channel < 50))
-    combined_mask = red_mask | yellow_green_mask | e4ac03_mask | mask_90ca03
-    filtered_image = np.zeros_like(np_image)
-    filtered_image[combined_mask] = [255, 255, 255]
-    filtered_image[~combined_mask] = [0, 0, 0]
-    processed_image = Image.fromarray(filtered_image).convert("L")
-    return ImageOps.invert(processed_image)
-
-def preprocess_image_for_modules(image):
-    """
-    Process the modules region using masking and inversion.
-    """
-    np_image = np.array(image)
-    red_channel = np_image[:, :, 0]
-    green_channel = np_image[:, :, 1]
-    blue_channel = np_image[:, :, 2]
-    red_only_mask = (red_channel > 180) & (green_channel < 80) & (blue_channel < 80)
-    filtered_image = np.zeros_like(np_image)
-    filtered_image[red_only_mask] = [255, 255, 255]
-    filtered_image[~red_only_mask] = [0, 0, 0]
-    processed_image = Image.fromarray(filtered_image).convert("L")
-    return ImageOps.invert(processed_image)
-
-def preprocess_image_for_gear(image):
+# Mean word confidence (0-100) below which a region is re-OCR'd with the next preprocessing
+RETRY_CONFIDENCE = 60
+# Results still below this after every retry are treated as bad frames
+BAD_FRAME_CONFIDENCE = 30
+
+# Colour ranges are inclusive RGB (lower, upper) boxes.
+KILL_FEED_RANGES = [
+    ((121, 0, 0), (255, 69, 99)),       # red
+    ((191, 181, 0), (255, 255, 59)),    # yellow-green
+    ((221, 161, 0), (255, 255, 49)),    # e4ac03
+    ((131, 191, 1), (159, 219, 49)),    # 90ca03
+]
+MODULE_RANGES = [
+    ((181, 0, 0), (255, 79, 79)),       # red module names
+]
+
+OcrWord = namedtuple("OcrWord", ["text", "conf", "box"])
+
+class OcrLine(namedtuple("OcrLine", ["text", "words"])):
+    """One recognized text line with its words (text, conf, box)."""
+    __slots__ = ()
+
+    @property
+    def confidence(self):
+        return sum(w.conf for w in self.words) / len(self.words) if self.words else 0.0
+
+class OcrResult:
+    """Words, boxes and confidences from pytesseract.image_to_data, grouped into lines."""
+
+    def __init__(self, lines=None, preprocess=None):
+        self.lines = lines or []
+        self.preprocess = preprocess
+
+    @classmethod
+    def from_data(cls, data, preprocess=None):
+        lines = {}
+        for i, word in enumerate(data["text"]):
+            conf = float(data["conf"][i])
+            if conf < 0 or not word.strip():
+                continue
+            key = (data["block_num"][i], data["par_num"][i], data["line_num"][i])
+            box = (data["left"][i], data["top"][i], data["width"][i], data["height"][i])
+            lines.setdefault(key, []).append(OcrWord(word.strip(), conf, box))
+        return cls([OcrLine(" ".join(w.text for w in words), words) for _, words in sorted(lines.items())], preprocess)
+
+    @property
+    def words(self):
+        return [w for line in self.lines for w in line.words]
+
+    @property
+    def text(self):
+        return "\n".join(line.text for line in self.lines)
+
+    @property
+    def confidence(self):
+        words = self.words
+        return sum(w.conf for w in words) / len(words) if words else 0.0
+
+    def __str__(self):
+        return self.text
+
+def ocr_image(image, config=r'--oem 3 --psm 6', lang='eng', preprocess=None):
     """
-    Process the gear region image by simply converting it to grayscale.
-    No masking, thresholding, or inversion is applied.
-    This ensures that the gear region is processed "raw" (aside from grayscale conversion).
+    Run Tesseract on an image and return an OcrResult with per-word confidences.
+    Crops seen before (this session or an earlier one) are answered from ocr_cache.
     """
-    return image.convert("L")
-
-def extract_text_from_image(image):
-    """Extract text from the hit/kill region after processing for colors."""
-    processed_image = preprocess_image_for_colors(image)
-    try:
-        custom_config = r'--oem 3 --psm 6'
-        return pytesseract.image_to_string(processed_image, lang='eng', config=custom_config)
-    except TesseractError as e:
-        log(f"Tesseract error in color region: {e}", level="ERROR", tag="OCR")
-        return ""
-
-def extract_battle_text_from_image(image):
-    """Extract text from the battle region without additional processing."""
-    try:
-        custom_config = r'--oem 3 --psm 6'
-        return pytesseract.image_to_string(image, lang='eng', config=custom_config)
-    except TesseractError as e:
-        log(f"Tesseract error in battle region: {e}", level="ERROR", tag="OCR")
-        return ""
-
-def extract_gear_text_from_image(image):
+    def run():
+        data = pytesseract.image_to_data(image, lang=lang, config=config, output_type=Output.DICT)
+        return OcrResult.from_data(data, preprocess)
+    return ocr_cache.cached_ocr(image, config, lang, preprocess, run)
+
+def ocr_with_retry(image, preprocessors, config=r'--oem 3 --psm 6', lang='eng', min_confidence=RETRY_CONFIDENCE):
     """
-    Extract text from the gear region.
-    This function uses the gear-specific preprocessing, which simply converts the image to grayscale.
+    OCR the image with each preprocessing in turn until one reaches min_confidence.
+    A preprocessor with its own `ocr` method (an ocr_pipeline.RegionPipeline) reads the image itself,
+    with its own settings. Returns the most confident OcrResult (empty if every attempt failed).
     """
-    processed_image = preprocess_image_for_gear(image)
-    try:
-        custom_config = r'--oem 3 --psm 6'
-        return pytesseract.image_to_string(processed_image, lang='eng', config=custom_config)
-    except TesseractError as e:
-        log(f"Tesseract error in gear region: {e}", level="ERROR", tag="OCR")
-        return ""
-
-def extract_modules_text_from_image(image):
-    """Extract text from the modules region after processing for modules."""
-    processed_image = preprocess_image_for_modules(image)
-    try:
-        custom_config = r'--oem 3 --psm 6'
-        return pytesseract.image_to_string(processed_image, lang='eng', config=custom_config)
-    except TesseractError as e:
-        log(f"Tesseract error in modules region: {e}", level="ERROR", tag="OCR")
-        return ""
\ No newline at end of file
+    best = OcrResult()
+    for preprocess in preprocessors:
+        try:
+            own_ocr = getattr(preprocess, "ocr", None)
+            if own_ocr is not None:
+                result = own_ocr(image, lang=lang)
+            else:
+                result = ocr_image(preprocess(image), config=config, lang=lang, preprocess=preprocess.__name__)
+        except TesseractError as e:
+            log(f"Tesseract error with {preprocess.__name__}: {e}", level="ERROR", tag="OCR")
+            continue
+        if result.confidence > best.confidence:
+            best = result
+        if best.confidence >= min_confidence:
+            break
+    return best
+
+def preprocess_image_for_grayscale_threshold(image):
+    """Fallback without color masking: grayscale, 2x upscale and a fixed inverted threshold."""
+    gray = image.convert("L").resize((image.width * 2, image.height * 2), Image.BICUBIC)
+    return gray.point(lambda v: 0 if v > 150 else 255)
@@ -0,0 +1,151 @@
+# map_config_store.py
+import json
+import os
+import re
+import tempfile
+import threading
+import time
+
+from utils import log
+
+def normalize_map_name(name):
+    """Lowercase, drop punctuation and collapse whitespace so OCR output and config keys compare equal."""
+    return " ".join(re.sub(r"[^\w]+", " ", name.lower()).split())
+
+class MapConfigStore:
+    """
+    Map configurations backed by map_configs.json.
+
+    The file is re-read when its mtime changes and the new configs and index are swapped in
+    atomically. Lookups go through a normalized name -> map name index that also covers the
+    optional "aliases" list of each entry (e.g. localized map names).
+    """
+
+    def __init__(self, path, poll_interval=1.0):
+        self.path = path
+        self.poll_interval = poll_interval
+        self._lock = threading.Lock()
+        self._mtime = None
+        self._last_poll = 0.0
+        # (configs, index, max_words) is replaced as a whole so readers never see a half-built state.
+        # The file is first read on first use, not at construction (i.e. not at import time).
+        self._snapshot = None
+        self._watcher = None
+
+    @staticmethod
+    def _build_index(configs):
+        index = {}
+        for map_name, config in configs.items():
+            for name in [map_name] + list(config.get("aliases", [])):
+                key = normalize_map_name(name)
+                if key:
+                    index[key] = map_name
+        max_words = max((len(key.split()) for key in index), default=0)
+        return index, max_words
+
+    def reload(self):
+        """Re-read the file; on a parse error the previous configuration stays active."""
+        try:
+            mtime = os.path.getmtime(self.path)
+            with open(self.path, "r", encoding="utf-8") as f:
+                configs = json.load(f)
+        except (OSError, ValueError) as e:
+            log(f"Failed to load map configs from {self.path}: {e}", level="ERROR", tag="RANGE")
+            if self._snapshot is None:
+                self._snapshot = ({}, {}, 0)
+            return False
+        index, max_words = self._build_index(configs)
+        with self._lock:
+            self._snapshot = (configs, index, max_words)
+            self._mtime = mtime
+        return True
+
+    def maybe_reload(self):
+        """Reload if the file changed on disk; cheap enough to call from any loop."""
+        now = time.time()
+        if now - self._last_poll < self.poll_interval:
+            return False
+        self._last_poll = now
+        try:
+            mtime = os.path.getmtime(self.path)
+        except OSError:
+            return False
+        if mtime == self._mtime:
+            return False
+        if self.reload():
+            log(f"Reloaded map configs ({len(self.configs)} maps).", level="INFO", tag="RANGE")
+            return True
+        return False
+
+    def _current(self):
+        if self._snapshot is None:
+            self.reload()
+        return self._snapshot
+
+    def _watch_loop(self):
+        while True:
+            self.maybe_reload()
+            time.sleep(self.poll_interval)
+
+    def start_watching(self):
+        if self._watcher is None:
+            self._watcher = threading.Thread(target=self._watch_loop, name="map-config-watcher", daemon=True)
+            self._watcher.start()
+
+    @property
+    def configs(self):
+        return self._current()[0]
+
+    def names(self):
+        return list(self._current()[0].keys())
+
+    def __contains__(self, map_name):
+        return map_name in self._current()[0]
+
+    def get(self, name):
+        """Return (map_name, config) for a map name or alias, or (None, None)."""
+        configs, index, _ = self._current()
+        map_name = index.get(normalize_map_name(name))
+        if map_name is None:
+            return None, None
+        return map_name, configs[map_name]
+
+    def lookup(self, text):
+        """
+        Find a known map name inside free OCR text.
+        Checks word windows of the text against the index (longest first), so the cost depends on
+        the text length rather than the number of configured maps.
+        """
+        configs, index, max_words = self._current()
+        words = normalize_map_name(text).split()
+        for size in range(min(max_words, len(words)), 0, -1):
+            for start in range(len(words) - size + 1):
+                map_name = index.get(" ".join(words[start:start + size]))
+                if map_name is not None:
+                    return map_name, configs[map_name]
+        return None, None
+
+    def update(self, map_name, **fields):
+        """Merge fields into a map's config (creating it if needed) and persist the file atomically."""
+        self._current()
+        with self._lock:
+            configs = {name: dict(config) for name, config in self._snapshot[0].items()}
+            configs.setdefault(map_name, {}).update(fields)
+            directory = os.path.dirname(os.path.abspath(self.path))
+            fd, tmp_path = tempfile.mkstemp(prefix=".map_configs_", suffix=".json", dir=directory)
+            try:
+                with os.fdopen(fd, "w", encoding="utf-8") as f:
+                    json.dump(configs, f, indent=2)
+                os.replace(tmp_path, self.path)
+            except OSError:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+                raise
+            index, max_words = self._build_index(configs)
+            self._snapshot = (configs, index, max_words)
+            self._mtime = os.path.getmtime(self.path)
+        return configs[map_name]
+
+# Map configurations, reloaded from the JSON file whenever it changes on disk.
+CONFIGS_PATH = os.path.join(os.path.dirname(__file__), "map_configs.json")
+config_store = MapConfigStore(CONFIGS_PATH)
@@ -0,0 +1,112 @@
+# match_stats.py
+import threading
+import time
+from collections import Counter, deque
+
+from session_recorder import subscribe
+
+# Size of the rolling "last N matches" window
+ROLLING_MATCHES = 10
+# Finished match summaries kept for the /stats API
+RECENT_MATCHES = 50
+# Event types that are context rather than countable events
+UNCOUNTED_TYPES = {"state", "map", "range"}
+
+def _new_match(number, start, map_name):
+    return {"number": number, "map": map_name, "start": start, "end": None, "counts": Counter()}
+
+def _summary(match):
+    end = match["end"] if match["end"] is not None else time.time()
+    return {
+        "number": match["number"],
+        "map": match["map"],
+        "start": match["start"],
+        "end": match["end"],
+        "duration_s": round(end - match["start"], 1),
+        "counts": dict(match["counts"]),
+    }
+
+class MatchAggregator:
+    """
+    Splits the session event stream into matches and keeps incremental rollups.
+
+    A match starts when the game state becomes "In Game" and ends when it returns to "In Menu".
+    Every event updates the current match, its map, the session and the rolling window in O(1).
+    """
+
+    def __init__(self, rolling=ROLLING_MATCHES):
+        self._lock = threading.Lock()
+        self.version = 0
+        self.current = None
+        self.match_count = 0
+        self.current_map = None
+        self.session = Counter()
+        self.per_map = {}
+        self.recent = deque(maxlen=RECENT_MATCHES)
+        self.rolling_window = deque()
+        self.rolling_size = rolling
+        self.rolling = Counter()
+
+    def _map_rollup(self, map_name):
+        key = map_name or "Unknown"
+        if key not in self.per_map:
+            self.per_map[key] = {"matches": 0, "counts": Counter()}
+        return self.per_map[key]
+
+    def _finish_match(self, timestamp):
+        match = self.current
+        match["end"] = timestamp
+        self._map_rollup(match["map"])["matches"] += 1
+        self.recent.append(_summary(match))
+        self.rolling_window.append(match["counts"])
+        self.rolling.update(match["counts"])
+        if len(self.rolling_window) > self.rolling_size:
+            self.rolling.subtract(self.rolling_window.popleft())
+        self.current = None
+
+    def on_event(self, timestamp, event_type, fields):
+        with self._lock:
+            self.version += 1
+            if event_type == "state":
+                new_state = fields.get("state")
+                if new_state == "In Game" and self.current is None:
+                    self.match_count += 1
+                    self.current = _new_match(self.match_count, timestamp, self.current_map)
+                elif new_state == "In Menu" and self.current is not None:
+                    self._finish_match(timestamp)
+                return
+            if event_type == "map":
+                self.current_map = fields.get("map")
+                if self.current is not None:
+                    self.current["map"] = self.current_map
+                return
+            if event_type in UNCOUNTED_TYPES:
+                return
+
+            keys = fields.get("counters") or [event_type]
+            map_counts = self._map_rollup(self.current["map"] if self.current else self.current_map)["counts"]
+            for key in keys:
+                self.session[key] += 1
+                map_counts[key] += 1
+                if self.current is not None:
+                    self.current["counts"][key] += 1
+
+    def current_count(self, key):
+        """Count of `key` in the current match (0 outside a match)."""
+        with self._lock:
+            return self.current["counts"][key] if self.current is not None else 0
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "current_match": _summary(self.current) if self.current is not None else None,
+                "session": {"matches": self.match_count, "counts": dict(self.session)},
+                "per_map": {name: {"matches": rollup["matches"], "counts": dict(rollup["counts"])}
+                            for name, rollup in self.per_map.items()},
+                "rolling": {"matches": len(self.rolling_window),
+                            "counts": {k: v for k, v in self.rolling.items() if v}},
+                "recent_matches": list(self.recent),
+            }
+
+aggregator = MatchAggregator()
+subscribe(aggregator.on_event)
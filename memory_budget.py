@@ -0,0 +1,195 @@
+# memory_budget.py
+"""
+Memory and disk budget for long (8-12 h) sessions.
+
+- ShapePool: size-capped LRU for scratch buffers keyed by shape, used wherever buffers are
+  allocated per input size (OCR pipelines, colour classification).
+- SCREENSHOT_CAPS: screenshot directories are pruned to their newest files.
+- The "memory" worker samples process RSS every RSS_SAMPLE_S and warns when it keeps rising
+  faster than RSS_GROWTH_ALERT_MB_H over the last RSS_TREND_WINDOW samples.
+- With tracemalloc on (WT_TRACEMALLOC=1, or /debug/memory?trace=start) it also snapshots
+  allocations every SNAPSHOT_INTERVAL; /debug/memory reports the top allocation sites and
+  what grew since the previous snapshot.
+"""
+import os
+import threading
+import time
+import tracemalloc
+from collections import OrderedDict, deque
+
+import services
+from services import supervisor
+from utils import log
+
+# Scratch buffers kept per pool before the least recently used shape is dropped
+POOL_CAPACITY = 8
+# directory -> newest files kept
+SCREENSHOT_CAPS = {
+    os.path.join("static", "screenshots"): 200,
+    os.path.join("static", "screenshots", "minimap_ocr"): 50,
+    os.path.join("static", "screenshots", "grid"): 50,
+}
+# Files the dashboards always link to; never pruned
+PRUNE_KEEP = {"tracked_target.png"}
+PRUNE_INTERVAL = 60.0
+# RSS sampling and trend alerting
+RSS_SAMPLE_S = 60.0
+RSS_HISTORY = 720
+RSS_TREND_WINDOW = 60
+RSS_GROWTH_ALERT_MB_H = 50.0
+ALERT_INTERVAL = 1800.0
+# tracemalloc
+SNAPSHOT_INTERVAL = 300.0
+TRACE_FRAMES = 1
+TOP_ALLOCATIONS = 15
+
+class ShapePool:
+    """LRU of buffers created by factory(key), holding at most `capacity` of them. Not thread safe."""
+
+    def __init__(self, factory, capacity=POOL_CAPACITY):
+        self.factory = factory
+        self.capacity = capacity
+        self.evictions = 0
+        self._items = OrderedDict()
+
+    def get(self, key):
+        item = self._items.get(key)
+        if item is None:
+            item = self._items[key] = self.factory(key)
+            if len(self._items) > self.capacity:
+                self._items.popitem(last=False)
+                self.evictions += 1
+        else:
+            self._items.move_to_end(key)
+        return item
+
+    def __len__(self):
+        return len(self._items)
+
+def prune_directory(directory, max_files, keep=PRUNE_KEEP):
+    """Delete all but the newest max_files files in directory; returns how many were removed."""
+    try:
+        entries = [e for e in os.scandir(directory) if e.is_file() and e.name not in keep]
+    except FileNotFoundError:
+        return 0
+    if len(entries) <= max_files:
+        return 0
+    entries.sort(key=lambda e: e.stat().st_mtime)
+    removed = 0
+    for entry in entries[:len(entries) - max_files]:
+        try:
+            os.remove(entry.path)
+            removed += 1
+        except OSError as e:
+            log(f"Error deleting {entry.path}: {e}", level="ERROR", tag="PROCESS")
+    return removed
+
+def rss_bytes():
+    import psutil
+    return psutil.Process().memory_info().rss
+
+def _slope_mb_per_hour(samples):
+    """Least-squares slope of (timestamp, rss) samples in MB/hour."""
+    n = len(samples)
+    mean_t = sum(t for t, _ in samples) / n
+    mean_r = sum(r for _, r in samples) / n
+    var_t = sum((t - mean_t) ** 2 for t, _ in samples)
+    if var_t == 0:
+        return 0.0
+    cov = sum((t - mean_t) * (r - mean_r) for t, r in samples)
+    return cov / var_t * 3600 / (1024 * 1024)
+
+class MemoryWatchdog:
+    def __init__(self):
+        self.rss = deque(maxlen=RSS_HISTORY)
+        self.last_alert = 0.0
+        self.alerting = False
+        self.pruned = 0
+        self._snapshots = deque(maxlen=2)
+        self._lock = threading.Lock()
+
+    def trend(self):
+        samples = list(self.rss)[-RSS_TREND_WINDOW:]
+        return _slope_mb_per_hour(samples) if len(samples) >= 3 else None
+
+    def sample(self, now=None):
+        now = time.time() if now is None else now
+        self.rss.append((now, rss_bytes()))
+        slope = self.trend()
+        # Only a full window rising steadily counts; warm-up growth in the first hour is expected.
+        self.alerting = (slope is not None and len(self.rss) >= RSS_TREND_WINDOW
+                         and slope > RSS_GROWTH_ALERT_MB_H)
+        if self.alerting and now - self.last_alert >= ALERT_INTERVAL:
+            self.last_alert = now
+            log(f"Memory keeps growing: RSS {self.rss[-1][1] / 2 ** 20:.0f} MB, +{slope:.0f} MB/h over the last "
+                f"{RSS_TREND_WINDOW} samples. See /debug/memory.", level="WARN", tag="PROCESS")
+
+    def prune(self):
+        for directory, max_files in SCREENSHOT_CAPS.items():
+            self.pruned += prune_directory(directory, max_files)
+
+    def snapshot(self):
+        if tracemalloc.is_tracing():
+            with self._lock:
+                self._snapshots.append(tracemalloc.take_snapshot().filter_traces(
+                    [tracemalloc.Filter(False, tracemalloc.__file__)]))
+
+    def run(self):
+        next_rss = next_prune = next_snapshot = 0.0
+        while services.tick():
+            now = time.time()
+            if now >= next_rss:
+                self.sample(now)
+                next_rss = now + RSS_SAMPLE_S
+            if now >= next_prune:
+                self.prune()
+                next_prune = now + PRUNE_INTERVAL
+            if now >= next_snapshot:
+                self.snapshot()
+                next_snapshot = now + SNAPSHOT_INTERVAL
+            services.sleep(min(next_rss, next_prune, next_snapshot) - time.time())
+
+    def report(self, top=TOP_ALLOCATIONS):
+        """RSS history and trend, plus the top allocation sites when tracemalloc is on."""
+        samples = list(self.rss)
+        body = {
+            "rss_mb": round(samples[-1][1] / 2 ** 20, 1) if samples else None,
+            "rss_start_mb": round(samples[0][1] / 2 ** 20, 1) if samples else None,
+            "trend_mb_per_hour": None if self.trend() is None else round(self.trend(), 1),
+            "alerting": self.alerting,
+            "rss_history_mb": [[round(t), round(r / 2 ** 20, 1)] for t, r in samples[-RSS_TREND_WINDOW:]],
+            "screenshots_pruned": self.pruned,
+            "tracemalloc": tracemalloc.is_tracing(),
+        }
+        with self._lock:
+            snapshots = list(self._snapshots)
+        if snapshots:
+            latest = snapshots[-1]
+            body["top_allocations"] = [
+                {"site": str(stat.traceback[0]), "size_kb": round(stat.size / 1024, 1), "count": stat.count}
+                for stat in latest.statistics("lineno")[:top]]
+            if len(snapshots) == 2:
+                body["growth_since_previous"] = [
+                    {"site": str(stat.traceback[0]), "size_diff_kb": round(stat.size_diff / 1024, 1),
+                     "count_diff": stat.count_diff}
+                    for stat in latest.compare_to(snapshots[0], "lineno")[:top] if stat.size_diff > 0]
+        return body
+
+    def set_tracing(self, enabled):
+        if enabled and not tracemalloc.is_tracing():
+            tracemalloc.start(TRACE_FRAMES)
+            log("tracemalloc started.", level="INFO", tag="PROCESS")
+        elif not enabled and tracemalloc.is_tracing():
+            tracemalloc.stop()
+            with self._lock:
+                self._snapshots.clear()
+            log("tracemalloc stopped.", level="INFO", tag="PROCESS")
+        self.snapshot()
+
+watchdog = MemoryWatchdog()
+
+def start_memory_watchdog():
+    if os.getenv("WT_TRACEMALLOC") == "1":
+        watchdog.set_tracing(True)
+    supervisor.register("memory", watchdog.run)
+    supervisor.start("memory")
@@ -0,0 +1,220 @@
+# ocr_cache.py
+"""
+Persistent OCR result cache.
+
+Most crops the pipeline OCRs are static and come back every session: map-name banners,
+"To Battle!", the country tabs, the Statistics header, an empty kill feed. ocr_image() looks
+each preprocessed crop up here before running Tesseract. Results live in an SQLite file keyed by
+a perceptual hash of the crop plus the Tesseract config and language, so warm starts skip OCR.
+
+The hash downsamples the crop to at most HASH_WIDTH pixels wide and keeps HASH_LEVELS grey
+levels, so one-pixel anti-aliasing noise still hits while different text does not.
+Entries are evicted least recently used first once MAX_ENTRIES or MAX_BYTES is exceeded.
+
+    python ocr_cache.py stats | clear
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import sys
+import threading
+import time
+
+from utils import log
+
+OCR_CACHE_PATH = os.path.join("cache", "ocr.sqlite3")
+# Set to False to always run Tesseract
+OCR_CACHE_ENABLED = True
+MAX_ENTRIES = 20000
+MAX_BYTES = 32 * 1024 * 1024
+# Perceptual hash resolution: crops are area-downsampled to this width and quantized to HASH_LEVELS greys
+HASH_WIDTH = 160
+HASH_LEVELS = 8
+# last_used is written back at most this often per entry, to keep hits read-mostly
+TOUCH_INTERVAL = 60.0
+# Seconds between warnings about a failing store (locked, full or unreadable database)
+ERROR_LOG_INTERVAL = 60.0
+
+def image_key(image, config, lang):
+    """Perceptual hash of a (preprocessed) crop combined with the OCR settings."""
+    # Imported here so the web server can report cache stats without loading OpenCV.
+    import cv2
+    import numpy as np
+    arr = np.asarray(image)
+    if arr.dtype == bool:
+        arr = arr.view(np.uint8) * 255
+    if arr.ndim == 3:
+        arr = cv2.cvtColor(np.ascontiguousarray(arr[:, :, :3]), cv2.COLOR_RGB2GRAY)
+    height, width = arr.shape
+    if width > HASH_WIDTH:
+        height = max(1, round(height * HASH_WIDTH / width))
+        arr = cv2.resize(arr, (HASH_WIDTH, height), interpolation=cv2.INTER_AREA)
+    quantized = (arr.astype(np.uint16) * HASH_LEVELS // 256).astype(np.uint8)
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(f"{config}|{lang}|{quantized.shape}".encode())
+    digest.update(quantized.tobytes())
+    return digest.digest()
+
+def _dump(result):
+    return json.dumps([[line.text, [[w.text, w.conf, list(w.box)] for w in line.words]] for line in result.lines],
+                      separators=(",", ":"))
+
+def _load(blob, preprocess):
+    from image_processing import OcrLine, OcrResult, OcrWord
+    lines = [OcrLine(text, [OcrWord(w[0], w[1], tuple(w[2])) for w in words]) for text, words in json.loads(blob)]
+    return OcrResult(lines, preprocess)
+
+class OcrCache:
+    """SQLite-backed LRU of OCR results. Thread safe; one connection shared under a lock."""
+
+    def __init__(self, path=OCR_CACHE_PATH, max_entries=MAX_ENTRIES, max_bytes=MAX_BYTES):
+        self.path = path
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.errors = 0
+        self._last_error_log = 0.0
+        self._conn = None
+        self._failed = False
+        self._lock = threading.Lock()
+        self._touched = {}
+
+    def _connection(self):
+        if self._conn is None and not self._failed:
+            try:
+                if os.path.dirname(self.path):
+                    os.makedirs(os.path.dirname(self.path), exist_ok=True)
+                conn = sqlite3.connect(self.path, check_same_thread=False)
+                conn.execute("PRAGMA journal_mode=WAL")
+                conn.execute("PRAGMA synchronous=NORMAL")
+                conn.execute("CREATE TABLE IF NOT EXISTS ocr (key BLOB PRIMARY KEY, result TEXT NOT NULL, "
+                             "size INTEGER NOT NULL, hits INTEGER NOT NULL DEFAULT 0, last_used REAL NOT NULL)")
+                conn.execute("CREATE INDEX IF NOT EXISTS ocr_last_used ON ocr (last_used)")
+                conn.commit()
+                self._conn = conn
+            except sqlite3.Error as e:
+                self._failed = True
+                log(f"OCR cache unavailable ({e}); running without it.", level="WARN", tag="OCR")
+        return self._conn
+
+    def _error(self, conn, operation, e):
+        """A store error never reaches the OCR caller: undo the transaction and carry on without the cache."""
+        self.errors += 1
+        try:
+            conn.rollback()
+        except sqlite3.Error:
+            pass
+        now = time.time()
+        if now - self._last_error_log >= ERROR_LOG_INTERVAL:
+            self._last_error_log = now
+            log(f"OCR cache {operation} failed ({e}); running Tesseract instead. {self.errors} errors so far.",
+                level="WARN", tag="OCR")
+
+    def get(self, key, preprocess=None):
+        """Cached OcrResult for key, or None (also when the store cannot be read)."""
+        with self._lock:
+            conn = self._connection()
+            if conn is None:
+                return None
+            try:
+                row = conn.execute("SELECT result FROM ocr WHERE key = ?", (key,)).fetchone()
+                if row is not None:
+                    now = time.time()
+                    if now - self._touched.get(key, 0.0) >= TOUCH_INTERVAL:
+                        self._touched[key] = now
+                        conn.execute("UPDATE ocr SET hits = hits + 1, last_used = ? WHERE key = ?", (now, key))
+                        conn.commit()
+            except sqlite3.Error as e:
+                self._error(conn, "lookup", e)
+                row = None
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+        return _load(row[0], preprocess)
+
+    def put(self, key, result):
+        """Store a result; a store that cannot be written is skipped."""
+        blob = _dump(result)
+        with self._lock:
+            conn = self._connection()
+            if conn is None:
+                return
+            now = time.time()
+            try:
+                conn.execute("INSERT OR REPLACE INTO ocr (key, result, size, hits, last_used) VALUES (?, ?, ?, 0, ?)",
+                             (key, blob, len(key) + len(blob), now))
+                self._evict(conn)
+                conn.commit()
+                self._touched[key] = now
+            except sqlite3.Error as e:
+                self._error(conn, "write", e)
+
+    def _evict(self, conn):
+        count, total = conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM ocr").fetchone()
+        if count <= self.max_entries and total <= self.max_bytes:
+            return
+        # Drop the least recently used tenth beyond the caps in one statement, so eviction is rare.
+        excess = max(count - self.max_entries, 0)
+        if total > self.max_bytes:
+            excess = max(excess, int(count * (total - self.max_bytes) / total) + 1)
+        excess += self.max_entries // 10
+        cursor = conn.execute("DELETE FROM ocr WHERE key IN (SELECT key FROM ocr ORDER BY last_used LIMIT ?)", (excess,))
+        self.evictions += cursor.rowcount
+        self._touched.clear()
+
+    def clear(self):
+        with self._lock:
+            conn = self._connection()
+            if conn is not None:
+                conn.execute("DELETE FROM ocr")
+                conn.commit()
+                conn.execute("VACUUM")
+            self._touched.clear()
+
+    def stats(self):
+        """Hit rate for this run plus the size of the persistent store."""
+        with self._lock:
+            conn = self._connection()
+            count = total = None
+            if conn is not None:
+                try:
+                    count, total = conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM ocr").fetchone()
+                except sqlite3.Error as e:
+                    self._error(conn, "stats", e)
+        lookups = self.hits + self.misses
+        return {
+            "enabled": OCR_CACHE_ENABLED and conn is not None,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else None,
+            "evictions": self.evictions,
+            "errors": self.errors,
+            "entries": count,
+            "bytes": total,
+        }
+
+cache = OcrCache()
+
+def cached_ocr(image, config, lang, preprocess, run):
+    """Return run() for this crop and config, from the cache when it has been OCR'd before."""
+    if not OCR_CACHE_ENABLED:
+        return run()
+    key = image_key(image, config, lang)
+    result = cache.get(key, preprocess)
+    if result is None:
+        result = run()
+        cache.put(key, result)
+    return result
+
+if __name__ == "__main__":
+    command = sys.argv[1] if len(sys.argv) > 1 else "stats"
+    if command == "clear":
+        cache.clear()
+        print(f"Cleared {OCR_CACHE_PATH}")
+    else:
+        for name, value in cache.stats().items():
+            print(f"{name:10s} {value}")
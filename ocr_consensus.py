@@ -0,0 +1,109 @@
+# ocr_consensus.py
+import re
+import time
+from collections import Counter, deque
+from difflib import SequenceMatcher
+
+# Frames a line must be read in (within WINDOW_S) before it is emitted
+MIN_VOTES = 2
+WINDOW_S = 2.0
+# A line not seen for this long is forgotten, so the same text later counts as a new event
+LINE_TTL = 6.0
+# Reads at least this similar are treated as the same on-screen line
+SIMILARITY = 0.8
+# Lines shorter than this (after normalization) are OCR noise
+MIN_LINE_LENGTH = 3
+# OCR lines (with confidences) below this mean word confidence do not vote
+MIN_LINE_CONFIDENCE = 40
+
+def normalize_line(text):
+    """Lowercase and strip everything but letters, digits and single spaces."""
+    return " ".join(re.sub(r"[^a-z0-9]+", " ", text.lower()).split())
+
+class LineConsensus:
+    """
+    Fuses OCR reads of a scrolling text region (e.g. the kill feed) across frames.
+
+    Each distinct on-screen line becomes a cluster of similar reads. A cluster is emitted exactly
+    once, when it has been read in MIN_VOTES frames within WINDOW_S; the emitted read is the most
+    common one (for OcrResult input, its most confident OcrLine). Clusters expire LINE_TTL seconds
+    after their last read.
+    """
+
+    def __init__(self, min_votes=MIN_VOTES, window_s=WINDOW_S, ttl=LINE_TTL, similarity=SIMILARITY,
+                 min_confidence=MIN_LINE_CONFIDENCE):
+        self.min_votes = min_votes
+        self.window_s = window_s
+        self.ttl = ttl
+        self.similarity = similarity
+        self.min_confidence = min_confidence
+        self._clusters = {}
+
+    def _match(self, line):
+        if line in self._clusters:
+            return self._clusters[line]
+        best, best_ratio = None, self.similarity
+        for key, cluster in self._clusters.items():
+            ratio = SequenceMatcher(None, line, key).ratio()
+            if ratio >= best_ratio:
+                best, best_ratio = cluster, ratio
+        return best
+
+    def is_confirmed(self, read):
+        """
+        Whether a read (a string or an OcrLine) can be repeated without adding a false vote: it
+        belongs to a line that was already emitted, or it would not vote at all.
+        """
+        if hasattr(read, "words"):
+            if read.confidence < self.min_confidence:
+                return True
+            read = read.text
+        line = normalize_line(read)
+        if len(line) < MIN_LINE_LENGTH:
+            return True
+        cluster = self._match(line)
+        return cluster is not None and cluster["emitted"]
+
+    def add(self, text, timestamp=None):
+        """
+        Feed one frame's OCR output (a string or an OcrResult); return the reads that reached
+        consensus in this frame (normalized strings, or OcrLine objects for OcrResult input).
+        """
+        timestamp = time.time() if timestamp is None else timestamp
+        for key in [k for k, c in self._clusters.items() if timestamp - c["last_seen"] > self.ttl]:
+            del self._clusters[key]
+
+        emitted = []
+        seen = set()
+        if hasattr(text, "lines"):
+            reads = [(line.text, line) for line in text.lines if line.confidence >= self.min_confidence]
+        else:
+            reads = [(raw_line, None) for raw_line in text.splitlines()]
+        for raw_line, ocr_line in reads:
+            line = normalize_line(raw_line)
+            if len(line) < MIN_LINE_LENGTH:
+                continue
+            cluster = self._match(line)
+            if cluster is None:
+                cluster = {"variants": Counter(), "best": {}, "votes": deque(), "last_seen": timestamp, "emitted": False}
+                self._clusters[line] = cluster
+            if id(cluster) in seen:
+                continue
+            seen.add(id(cluster))
+            cluster["variants"][line] += 1
+            if ocr_line is not None:
+                best = cluster["best"].get(line)
+                if best is None or ocr_line.confidence > best.confidence:
+                    cluster["best"][line] = ocr_line
+            cluster["last_seen"] = timestamp
+            cluster["votes"].append(timestamp)
+            while cluster["votes"] and timestamp - cluster["votes"][0] > self.window_s:
+                cluster["votes"].popleft()
+            if not cluster["emitted"] and len(cluster["votes"]) >= self.min_votes:
+                cluster["emitted"] = True
+                variant = cluster["variants"].most_common(1)[0][0]
+                emitted.append(cluster["best"].get(variant, variant))
+        return emitted
+
+    def reset(self):
+        self._clusters = {}
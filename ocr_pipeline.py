@@ -0,0 +1,280 @@
+# ocr_pipeline.py
+"""
+Declarative per-region OCR preprocessing.
+
+Each HUD region is described once in REGION_PIPELINES as data:
+crop -> colour mask (or grayscale) -> integer upscale -> morphology -> binarize -> pad,
+plus the Tesseract page segmentation mode and character whitelist for that region.
+RegionPipeline compiles a spec into an OpenCV pipeline that reuses its buffers between calls.
+
+    python ocr_pipeline.py bench [fixtures_dir]
+
+benchmarks every pipeline against labelled crops in fixtures_dir/<region>/<name>.png with the
+expected text in <name>.txt, and compares it to plain Tesseract on the grayscale crop.
+"""
+import os
+import sys
+import threading
+import time
+from difflib import SequenceMatcher
+
+import cv2
+import numpy as np
+import pytesseract
+from pytesseract import TesseractError
+
+import color_classify
+import glyph_classifier
+from utils import log
+from memory_budget import ShapePool
+from image_processing import OcrResult, ocr_image, KILL_FEED_RANGES, MODULE_RANGES
+
+FIXTURES_DIR = os.path.join("fixtures", "ocr")
+
+# Spec keys (all optional):
+#   crop      (left, top, width, height) inside the captured region
+#   mask      {"ranges": [(lo, hi), ...]} and/or {"near": rgb, "tolerance": t}; text becomes white
+#             (without a mask the region is converted to grayscale)
+#   scale     integer upscale factor (nearest for masks, cubic for grayscale)
+#   morph     (op, kernel size) with op in MORPH_OPS
+#   binarize  "invert" (masks) or "otsu" (grayscale, background forced to white)
+#   pad       white border in pixels
+#   psm       Tesseract page segmentation mode; whitelist restricts the characters Tesseract may output
+#   glyphs    single-line region read by glyph_classifier first when a model is trained (Tesseract when it is unsure)
+REGION_PIPELINES = {
+    # One kill-feed line cut out by feed_lines.segment_lines
+    "feed_line": {
+        "mask": {"ranges": KILL_FEED_RANGES},
+        "scale": 3,
+        "morph": ("close", 2),
+        "binarize": "invert",
+        "pad": 10,
+        "psm": 7,
+        "glyphs": True,
+    },
+    "modules": {
+        "mask": {"ranges": MODULE_RANGES},
+        "scale": 2,
+        "morph": ("close", 2),
+        "binarize": "invert",
+        "pad": 10,
+        "psm": 6,
+    },
+    "battle": {
+        "scale": 2,
+        "binarize": "otsu",
+        "pad": 10,
+        "psm": 7,
+        "glyphs": True,
+    },
+    "gear": {
+        "scale": 2,
+        "binarize": "otsu",
+        "pad": 10,
+        "psm": 6,
+    },
+    "map_name": {
+        "mask": {"near": (230, 206, 120), "tolerance": 60},
+        "scale": 3,
+        "morph": ("close", 2),
+        "binarize": "invert",
+        "pad": 10,
+        "psm": 7,
+    },
+    "stats": {
+        "scale": 2,
+        "binarize": "otsu",
+        "pad": 10,
+        "psm": 7,
+        "glyphs": True,
+    },
+    "main_menu": {
+        "scale": 2,
+        "binarize": "otsu",
+        "pad": 10,
+        "psm": 7,
+        "glyphs": True,
+    },
+}
+
+MORPH_OPS = {"close": cv2.MORPH_CLOSE, "open": cv2.MORPH_OPEN, "dilate": cv2.MORPH_DILATE, "erode": cv2.MORPH_ERODE}
+
+class _Buffers:
+    def __init__(self, height, width, scale, pad):
+        sh, sw = height * scale, width * scale
+        self.mask = np.empty((height, width), dtype=np.uint8)
+        self.tmp = np.empty((height, width), dtype=np.uint8)
+        self.scaled = np.empty((sh, sw), dtype=np.uint8)
+        self.morph = np.empty((sh, sw), dtype=np.uint8)
+        self.binary = np.empty((sh, sw), dtype=np.uint8)
+        self.out = np.empty((sh + 2 * pad, sw + 2 * pad), dtype=np.uint8)
+
+class RegionPipeline:
+    """A compiled REGION_PIPELINES entry. Buffers are reused per input size (a few sizes at most); calls are serialized."""
+
+    def __init__(self, name, spec):
+        self.name = name
+        self.spec = spec
+        self.crop = spec.get("crop")
+        self.scale = int(spec.get("scale", 1))
+        self.pad = int(spec.get("pad", 0))
+        self.binarize = spec.get("binarize", "none")
+        mask = spec.get("mask")
+        self.ranges = [(np.array(lo, dtype=np.uint8), np.array(hi, dtype=np.uint8))
+                       for lo, hi in (mask or {}).get("ranges", [])]
+        self.near = np.array(mask["near"], dtype=np.int32) if mask and "near" in mask else None
+        self.near_tolerance = int(mask.get("tolerance", 0)) if mask else 0
+        self.uses_mask = mask is not None
+        morph = spec.get("morph")
+        self.morph = (MORPH_OPS[morph[0]], np.ones((morph[1], morph[1]), dtype=np.uint8)) if morph else None
+        self.config = f"--oem 3 --psm {spec.get('psm', 6)}"
+        self.whitelist = spec.get("whitelist")
+        self.glyphs = bool(spec.get("glyphs"))
+        if spec.get("whitelist"):
+            self.config += f" -c tessedit_char_whitelist={spec['whitelist']}"
+        self._buffers = ShapePool(lambda shape: _Buffers(shape[0], shape[1], self.scale, self.pad))
+        self._lock = threading.Lock()
+
+    def _buffers_for(self, shape):
+        return self._buffers.get(shape)
+
+    def _run(self, image):
+        arr = np.asarray(image)
+        if arr.ndim == 3 and arr.shape[2] == 4:
+            arr = arr[:, :, :3]
+        if self.crop:
+            left, top, width, height = self.crop
+            arr = arr[top:top + height, left:left + width]
+        buffers = self._buffers_for(arr.shape[:2])
+
+        if self.uses_mask:
+            arr = np.ascontiguousarray(arr)
+            src = buffers.mask
+            src.fill(0)
+            if self.ranges:
+                color_classify.in_ranges(arr, self.ranges, out=src)
+            if self.near is not None:
+                color_classify.near(arr, [self.near], self.near_tolerance, out=buffers.tmp)
+                cv2.bitwise_or(src, buffers.tmp, dst=src)
+        elif arr.ndim == 3:
+            src = cv2.cvtColor(np.ascontiguousarray(arr), cv2.COLOR_RGB2GRAY, dst=buffers.mask)
+        else:
+            np.copyto(buffers.mask, arr)
+            src = buffers.mask
+
+        if self.scale > 1:
+            interpolation = cv2.INTER_NEAREST if self.uses_mask else cv2.INTER_CUBIC
+            src = cv2.resize(src, (buffers.scaled.shape[1], buffers.scaled.shape[0]), dst=buffers.scaled,
+                             interpolation=interpolation)
+        if self.morph is not None:
+            src = cv2.morphologyEx(src, self.morph[0], self.morph[1], dst=buffers.morph)
+
+        # Tesseract reads dark text on a light background best.
+        if self.binarize == "invert":
+            src = cv2.bitwise_not(src, dst=buffers.binary)
+        elif self.binarize == "otsu":
+            _, src = cv2.threshold(src, 0, 255, cv2.THRESH_BINARY | cv2.THRESH_OTSU, dst=buffers.binary)
+            # Light HUD text on a dark background: flip so the background (the majority) is white.
+            if cv2.countNonZero(src) < src.size // 2:
+                cv2.bitwise_not(src, dst=src)
+
+        if self.pad:
+            return cv2.copyMakeBorder(src, self.pad, self.pad, self.pad, self.pad, cv2.BORDER_CONSTANT,
+                                      dst=buffers.out, value=255)
+        np.copyto(buffers.binary, src)
+        return buffers.binary
+
+    def run(self, image):
+        """Return a copy of the preprocessed image (the internal buffers are reused by the next call)."""
+        with self._lock:
+            return self._run(image).copy()
+
+    # Lets a pipeline stand in for a preprocess function in image_processing.ocr_with_retry.
+    __call__ = run
+
+    @property
+    def __name__(self):
+        return self.name
+
+    def ocr(self, image, lang="eng"):
+        """
+        Preprocess and OCR the image with this region's Tesseract settings.
+        Glyph-enabled regions try the trained glyph classifier first.
+        """
+        with self._lock:
+            processed = self._run(image)
+            if self.glyphs:
+                result = glyph_classifier.read(processed, self.whitelist, preprocess=self.name)
+                if result is not None:
+                    return result
+            try:
+                return ocr_image(processed, config=self.config, lang=lang, preprocess=self.name)
+            except TesseractError as e:
+                log(f"Tesseract error in {self.name} region: {e}", level="ERROR", tag="OCR")
+                return OcrResult(preprocess=self.name)
+
+PIPELINES = {name: RegionPipeline(name, spec) for name, spec in REGION_PIPELINES.items()}
+
+def ocr_region(name, image, lang="eng"):
+    """OCR a captured region with its configured pipeline and return an OcrResult."""
+    return PIPELINES[name].ocr(image, lang=lang)
+
+def extract_modules_result_from_image(image):
+    """OCR the modules region with per-word confidences."""
+    return ocr_region("modules", image)
+
+# -----------------------------------------------------------
+# Fixture benchmark
+# -----------------------------------------------------------
+def _accuracy(expected, actual):
+    normalize = lambda text: " ".join(text.lower().split())
+    return SequenceMatcher(None, normalize(expected), normalize(actual)).ratio()
+
+def benchmark(fixtures_dir=FIXTURES_DIR):
+    """Return {region: {"samples", "accuracy", "ms", "baseline_accuracy", "baseline_ms"}} over the fixtures."""
+    results = {}
+    for name, pipeline in PIPELINES.items():
+        region_dir = os.path.join(fixtures_dir, name)
+        if not os.path.isdir(region_dir):
+            continue
+        rows = []
+        for filename in sorted(os.listdir(region_dir)):
+            stem, ext = os.path.splitext(filename)
+            label_path = os.path.join(region_dir, stem + ".txt")
+            if ext.lower() != ".png" or not os.path.exists(label_path):
+                continue
+            with open(label_path, "r", encoding="utf-8") as f:
+                expected = f.read().strip()
+            image = cv2.cvtColor(cv2.imread(os.path.join(region_dir, filename)), cv2.COLOR_BGR2RGB)
+
+            start = time.perf_counter()
+            text = pipeline.ocr(image).text
+            elapsed = time.perf_counter() - start
+
+            gray = cv2.cvtColor(image, cv2.COLOR_RGB2GRAY)
+            start = time.perf_counter()
+            baseline = pytesseract.image_to_string(gray, lang="eng", config="--oem 3 --psm 6")
+            baseline_elapsed = time.perf_counter() - start
+            rows.append((_accuracy(expected, text), elapsed, _accuracy(expected, baseline), baseline_elapsed))
+        if rows:
+            n = len(rows)
+            results[name] = {
+                "samples": n,
+                "accuracy": sum(r[0] for r in rows) / n,
+                "ms": 1000 * sum(r[1] for r in rows) / n,
+                "baseline_accuracy": sum(r[2] for r in rows) / n,
+                "baseline_ms": 1000 * sum(r[3] for r in rows) / n,
+            }
+    return results
+
+if __name__ == "__main__":
+    if len(sys.argv) >= 2 and sys.argv[1] == "bench":
+        directory = sys.argv[2] if len(sys.argv) > 2 else FIXTURES_DIR
+        report = benchmark(directory)
+        if not report:
+            print(f"No labelled fixtures found under {directory}/<region>/*.png (+ .txt).")
+        for region, row in report.items():
+            print(f"{region:10s} n={row['samples']:3d}  accuracy {row['accuracy']:.3f} ({row['ms']:.1f} ms)  "
+                  f"baseline {row['baseline_accuracy']:.3f} ({row['baseline_ms']:.1f} ms)")
+    else:
+        print(__doc__)
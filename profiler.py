@@ -0,0 +1,234 @@
+# profiler.py
+"""
+Sampling profiler that can be switched on and off while the app runs.
+
+While on, the "profiler" worker reads every thread's Python stack with sys._current_frames()
+every SAMPLE_INTERVAL and counts each (thread, stack) it sees. Threads are labelled by name:
+the supervised workers (detection, statistics, main_menu, minimap, map_ocr, discord, memory, ...),
+the web server's request threads as "web", and anything else by its own name. A sample is idle
+when the thread's OS CPU time did not advance since its previous sample (it was sleeping or
+blocked, whether in time.sleep, a lock, a queue or a socket). Idle samples are kept but can be
+left out with idle=0, which leaves only the time spent running. The OS counts thread CPU time
+in clock ticks (10 ms on Linux), so at high sample rates a briefly running thread can look idle.
+
+/debug/profile?trace=start|stop toggles it. The JSON report shows samples and CPU seconds per
+thread and the hottest functions; ?format=collapsed returns the stacks in the collapsed format
+that flamegraph.pl, speedscope and inferno read ("thread;outer;...;inner count" per line).
+A run stops by itself after MAX_DURATION so a forgotten profile does not keep sampling.
+
+The sampler needs the GIL to look, so a thread that runs for less than sys.getswitchinterval()
+(5 ms) before blocking is under-counted; time in C code that holds the GIL (OpenCV, NumPy) is
+attributed to the Python line that called it. The cpu_s column comes from the OS and has
+neither bias.
+"""
+import os
+import re
+import sys
+import threading
+import time
+from collections import Counter
+
+import services
+from services import supervisor
+from utils import log
+
+# Seconds between samples (100 Hz, as py-spy samples by default)
+SAMPLE_INTERVAL = 0.01
+# A run stops on its own after this many seconds
+MAX_DURATION = 300.0
+# Frames kept per stack, innermost first; deeper frames are dropped from the root end
+MAX_DEPTH = 64
+# Distinct stacks kept; later new stacks are counted under TRUNCATED
+MAX_STACKS = 20000
+TRUNCATED = ("[other stacks]",)
+TOP_FUNCTIONS = 20
+# Without per-thread CPU times (no psutil), samples whose innermost Python function is one of these are idle
+IDLE_FUNCTIONS = {"sleep", "wait", "wait_for", "get", "select", "poll", "accept", "recv", "recv_into",
+                  "readinto", "_wait_for_tstate_lock", "serve_forever", "handle_request"}
+# Thread name pattern -> label; request threads come and go, so they share one label
+THREAD_LABELS = [
+    (re.compile(r"^waitress-\d+$"), "web"),
+    (re.compile(r"^Thread-\d+ \(process_request_thread\)$"), "web"),
+]
+
+def thread_label(name):
+    for pattern, label in THREAD_LABELS:
+        if pattern.match(name):
+            return label
+    return name
+
+def _thread_cpu():
+    """native thread id -> CPU seconds used so far."""
+    try:
+        import psutil
+        return {t.id: t.user_time + t.system_time for t in psutil.Process().threads()}
+    except Exception:
+        return {}
+
+class SamplingProfiler:
+    def __init__(self):
+        self.interval = SAMPLE_INTERVAL
+        self.duration = MAX_DURATION
+        self.started = None
+        self.stopped = None
+        self.samples = 0
+        self.overruns = 0
+        self._stacks = Counter()
+        self._idle = Counter()
+        self._last_cpu = {}
+        self._names = {}
+        self._cpu_start = {}
+        self._cpu = {}
+        self._lock = threading.Lock()
+
+    @property
+    def running(self):
+        worker = supervisor.workers.get("profiler")
+        return worker is not None and worker.alive() and not worker.stop_event.is_set()
+
+    def _frame_name(self, code):
+        name = self._names.get(code)
+        if name is None:
+            name = self._names[code] = f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+        return name
+
+    def _labels(self):
+        """thread ident -> (label, native id) for every live thread except the sampler."""
+        own = threading.get_ident()
+        return {t.ident: (thread_label(t.name), t.native_id) for t in threading.enumerate() if t.ident != own}
+
+    def _is_idle(self, native_id, cpu, leaf):
+        used = cpu.get(native_id)
+        if used is None:
+            return leaf is not None and leaf.co_name in IDLE_FUNCTIONS
+        previous = self._last_cpu.get(native_id)
+        self._last_cpu[native_id] = used
+        return previous is not None and used <= previous
+
+    def sample(self):
+        """Take one sample of every thread; returns the per-thread CPU times read alongside it."""
+        labels = self._labels()
+        cpu = _thread_cpu()
+        frames = sys._current_frames()
+        with self._lock:
+            for ident, frame in frames.items():
+                label = labels.get(ident)
+                if label is None:
+                    continue
+                stack = []
+                while frame is not None and len(stack) < MAX_DEPTH:
+                    stack.append(frame.f_code)
+                    frame = frame.f_back
+                key = (label[0],) + tuple(self._frame_name(code) for code in reversed(stack))
+                if key not in self._stacks and len(self._stacks) >= MAX_STACKS:
+                    key = (label[0],) + TRUNCATED
+                self._stacks[key] += 1
+                if self._is_idle(label[1], cpu, stack[0] if stack else None):
+                    self._idle[key] += 1
+            self.samples += 1
+        return cpu
+
+    def _sample_cpu(self, now=None):
+        """CPU seconds per label since the run started (threads that ended are kept at their last value)."""
+        now = _thread_cpu() if now is None else now
+        for ident, (label, native_id) in self._labels().items():
+            if native_id in now:
+                self._cpu[native_id] = (label, now[native_id] - self._cpu_start.get(native_id, 0.0))
+
+    def run(self):
+        deadline = time.time() + self.duration
+        next_sample = time.perf_counter()
+        next_cpu = 0.0
+        while services.tick():
+            cpu = self.sample()
+            if time.time() >= next_cpu:
+                self._sample_cpu(cpu)
+                next_cpu = time.time() + 1.0
+            if time.time() >= deadline:
+                log(f"Profiler stopped after {self.duration:.0f}s.", level="INFO", tag="PROCESS")
+                break
+            # Keep a fixed rate: sampling time comes out of the interval, missed samples are skipped.
+            next_sample += self.interval
+            delay = next_sample - time.perf_counter()
+            if delay < 0:
+                self.overruns += 1
+                next_sample = time.perf_counter()
+                delay = 0
+            services.sleep(delay)
+        self._sample_cpu()
+        self.stopped = time.time()
+        supervisor.stop("profiler")
+
+    def start(self, interval=None, duration=None, reset=True):
+        if self.running:
+            return False
+        if reset:
+            self.reset()
+        self.interval = max(interval or SAMPLE_INTERVAL, 0.001)
+        self.duration = min(duration or MAX_DURATION, MAX_DURATION)
+        self.started, self.stopped = time.time(), None
+        self._cpu_start = _thread_cpu()
+        self._last_cpu = dict(self._cpu_start)
+        supervisor.register("profiler", self.run)
+        supervisor.start("profiler")
+        log(f"Profiler started: sampling every {self.interval * 1000:g} ms for up to {self.duration:.0f}s.",
+            level="INFO", tag="PROCESS")
+        return True
+
+    def stop(self):
+        if "profiler" in supervisor.workers:
+            supervisor.stop("profiler")
+
+    def reset(self):
+        with self._lock:
+            self._stacks.clear()
+            self._idle.clear()
+            self._last_cpu.clear()
+            self._cpu.clear()
+            self.samples = self.overruns = 0
+
+    def _snapshot(self, thread=None, idle=True):
+        with self._lock:
+            stacks = [(key, count if idle else count - self._idle[key]) for key, count in self._stacks.items()
+                      if thread is None or key[0] == thread]
+        return [(key, count) for key, count in stacks if count > 0]
+
+    def collapsed(self, thread=None, idle=True):
+        """Collapsed stack lines ("thread;outer;...;inner count"), heaviest first."""
+        stacks = sorted(self._snapshot(thread, idle), key=lambda item: -item[1])
+        return "".join(f"{';'.join(key)} {count}\n" for key, count in stacks)
+
+    def report(self, thread=None, idle=True, top=TOP_FUNCTIONS):
+        stacks = self._snapshot(thread, idle)
+        per_thread = Counter()
+        own = Counter()
+        total = Counter()
+        for key, count in stacks:
+            per_thread[key[0]] += count
+            own[key[-1]] += count
+            # A recursive function is counted once per stack.
+            for name in set(key[1:]):
+                total[name] += count
+        cpu = Counter()
+        for label, seconds in list(self._cpu.values()):
+            cpu[label] += seconds
+        end = self.stopped or time.time()
+        samples = sum(per_thread.values())
+        return {
+            "running": self.running,
+            "interval_ms": round(self.interval * 1000, 3),
+            "elapsed_s": round(end - self.started, 1) if self.started else 0.0,
+            "samples": self.samples,
+            "overruns": self.overruns,
+            "idle_included": idle,
+            "threads": {
+                label: {"samples": count, "cpu_s": round(cpu[label], 2) if label in cpu else None}
+                for label, count in per_thread.most_common()
+            },
+            "self": [{"function": name, "samples": count, "share": round(count / samples, 3)}
+                     for name, count in own.most_common(top)],
+            "total": [{"function": name, "samples": count, "share": round(count / samples, 3)}
+                      for name, count in total.most_common(top)],
+        }
+
+profiler = SamplingProfiler()
@@ -0,0 +1,152 @@
+# range_engine.py
+import math
+import time
+from collections import deque, namedtuple
+
+import numpy as np
+
+# Sub-pixel position with 1-sigma uncertainty per axis (pixels).
+Fix = namedtuple("Fix", ["x", "y", "sigma_x", "sigma_y"])
+
+# Gray-level noise assumed per pixel when propagating centroid uncertainty.
+PIXEL_NOISE = 8.0
+# 1-sigma uncertainty of cell_block: hand-tuned integer configs vs. automatic sub-pixel fits.
+CONFIG_CELL_SIGMA = 0.5 / math.sqrt(3)
+CALIBRATED_CELL_SIGMA = 0.1
+
+def measure_blob(gray, mask, blob):
+    """
+    Intensity-weighted sub-pixel centroid of a blob and its uncertainty.
+    Variance combines gray-level noise propagated through the weighted mean with the
+    1/12 px² quantization floor of the pixel grid.
+    """
+    left, top, width, height = blob.bbox
+    roi_mask = mask[top:top + height, left:left + width] > 0
+    weights = gray[top:top + height, left:left + width].astype(np.float64)
+    weights *= roi_mask
+    total = weights.sum()
+    count = int(roi_mask.sum())
+    if total <= 0 or count == 0:
+        return Fix(blob.centroid[0], blob.centroid[1], 0.5, 0.5)
+
+    xs = np.arange(left, left + width, dtype=np.float64)
+    ys = np.arange(top, top + height, dtype=np.float64)
+    cx = float(weights.sum(axis=0) @ xs / total)
+    cy = float(weights.sum(axis=1) @ ys / total)
+
+    quantization = 1.0 / (12.0 * count)
+    var_x = PIXEL_NOISE ** 2 * float(roi_mask.sum(axis=0) @ (xs - cx) ** 2) / total ** 2 + quantization
+    var_y = PIXEL_NOISE ** 2 * float(roi_mask.sum(axis=1) @ (ys - cy) ** 2) / total ** 2 + quantization
+    return Fix(cx, cy, math.sqrt(var_x), math.sqrt(var_y))
+
+def range_between(player, target, cell_block, cell_size_m, cell_sigma=CONFIG_CELL_SIGMA):
+    """
+    Range in metres between two fixes and its 1-sigma uncertainty.
+    Returns (range_m, sigma_m, pixel_distance).
+    """
+    dx = target.x - player.x
+    dy = target.y - player.y
+    pixels = math.hypot(dx, dy)
+    metres_per_pixel = cell_size_m / cell_block
+    range_m = pixels * metres_per_pixel
+    if pixels > 0:
+        ux, uy = dx / pixels, dy / pixels
+    else:
+        ux = uy = math.sqrt(0.5)
+    var_pixels = ux ** 2 * (player.sigma_x ** 2 + target.sigma_x ** 2) + uy ** 2 * (player.sigma_y ** 2 + target.sigma_y ** 2)
+    var_m = (metres_per_pixel ** 2) * var_pixels + (range_m * cell_sigma / cell_block) ** 2
+    return range_m, math.sqrt(var_m), pixels
+
+class RangeWindow:
+    """Inverse-variance average of range readings over a short sliding time window."""
+
+    def __init__(self, window_s=1.0, jump_sigma=4.0, jump_floor_m=5.0):
+        self.window_s = window_s
+        self.jump_sigma = jump_sigma
+        self.jump_floor_m = jump_floor_m
+        self.samples = deque()
+
+    def estimate(self):
+        if not self.samples:
+            return None, None
+        weights = [1.0 / max(sigma, 1e-6) ** 2 for _, _, sigma in self.samples]
+        total = sum(weights)
+        mean = sum(w * r for w, (_, r, _) in zip(weights, self.samples)) / total
+        sigma = 1.0 / math.sqrt(total)
+        if len(self.samples) > 1:
+            scatter = math.sqrt(sum((r - mean) ** 2 for _, r, _ in self.samples) / (len(self.samples) - 1))
+            sigma = max(sigma, scatter / math.sqrt(len(self.samples)))
+        return mean, sigma
+
+    def add(self, timestamp, range_m, sigma_m):
+        """Add a reading and return the windowed (range_m, sigma_m). A large jump restarts the window."""
+        while self.samples and timestamp - self.samples[0][0] > self.window_s:
+            self.samples.popleft()
+        mean, sigma = self.estimate()
+        if mean is not None:
+            limit = self.jump_sigma * math.hypot(sigma, sigma_m) + self.jump_floor_m
+            if abs(range_m - mean) > limit:
+                self.samples.clear()
+        self.samples.append((timestamp, range_m, sigma_m))
+        return self.estimate()
+
+class RangeEngine:
+    """
+    Turns per-frame player/target fixes into smoothed range readings.
+    Targets are associated across frames by kind and nearest position, each with its own window.
+    """
+
+    def __init__(self, window_s=1.0, match_px=15.0):
+        self.window_s = window_s
+        self.match_px = match_px
+        self._tracks = []
+
+    def reset(self):
+        self._tracks = []
+
+    def _track_for(self, kind, fix, timestamp, used):
+        best, best_dist = None, self.match_px
+        for track in self._tracks:
+            if track["kind"] != kind or id(track) in used:
+                continue
+            dist = math.hypot(track["x"] - fix.x, track["y"] - fix.y)
+            if dist <= best_dist:
+                best, best_dist = track, dist
+        if best is None:
+            best = {"kind": kind, "window": RangeWindow(self.window_s)}
+            self._tracks.append(best)
+        best["x"], best["y"], best["seen"] = fix.x, fix.y, timestamp
+        used.add(id(best))
+        return best
+
+    def update(self, player, targets, map_name, cell_block, cell_size_m, calibrated=False, timestamp=None):
+        """
+        targets is a list of (kind, Fix). Returns one structured reading per target:
+        {"kind", "position", "range_m", "sigma_m", "raw_range_m", "raw_sigma_m", "pixels", "samples", "timestamp", "map"}.
+        """
+        timestamp = time.time() if timestamp is None else timestamp
+        cell_sigma = CALIBRATED_CELL_SIGMA if calibrated else CONFIG_CELL_SIGMA
+        readings = []
+        used = set()
+        for kind, fix in targets:
+            raw_range, raw_sigma, pixels = range_between(player, fix, cell_block, cell_size_m, cell_sigma)
+            # Only the per-frame (random) part averages out; the cell_block error is systematic.
+            systematic = raw_range * cell_sigma / cell_block
+            random_sigma = math.sqrt(max(raw_sigma ** 2 - systematic ** 2, 0.0))
+            track = self._track_for(kind, fix, timestamp, used)
+            range_m, window_sigma = track["window"].add(timestamp, raw_range, random_sigma)
+            sigma_m = math.hypot(window_sigma, range_m * cell_sigma / cell_block)
+            readings.append({
+                "kind": kind,
+                "position": [round(fix.x, 2), round(fix.y, 2)],
+                "range_m": round(range_m, 1),
+                "sigma_m": round(sigma_m, 1),
+                "raw_range_m": round(raw_range, 1),
+                "raw_sigma_m": round(raw_sigma, 1),
+                "pixels": round(pixels, 2),
+                "samples": len(track["window"].samples),
+                "timestamp": timestamp,
+                "map": map_name,
+            })
+        self._tracks = [t for t in self._tracks if timestamp - t["seen"] <= self.window_s]
+        return readings
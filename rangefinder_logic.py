@@ -1,36 +1,36 @@
 import os
 import time
 import math
-import json
-import threading
 import re
-import pyautogui
 import cv2
 import numpy as np
-import pytesseract
-from flask import Flask, render_template_string, jsonify, request
 import mss
 import mss.tools
 import state
+import services
+import color_classify
+from services import supervisor
 from utils import is_aces_in_focus, log
+from blob_detection import find_blobs, blob_circle
+from grid_calibration import GridCalibrator
+from map_config_store import config_store
+from range_engine import RangeEngine, measure_blob
+from session_recorder import record
+from image_processing import ocr_image
+from ocr_pipeline import PIPELINES
+from screen_layout import layout
+from rangefinder_web import OUTPUT_IMAGE_PATH
 
 # -----------------------------------------------------------
 # Global Regions and Configurations
 # -----------------------------------------------------------
 
-GRID_REGION = (1473, 635, 432, 432)  # (left, top, width, height)
-OCR_REGION = (900, 380, 500, 30)
-
-# Load map configurations from JSON file.
-CONFIGS_PATH = os.path.join(os.path.dirname(__file__), "map_configs.json")
-with open(CONFIGS_PATH, "r") as f:
-    map_configs = json.load(f)
+# Minimap size in reference (1080p) pixels; captures at other resolutions are resized to this once.
+GRID_WIDTH, GRID_HEIGHT = layout.reference_size("grid")
 
 # Directories for saving screenshots
 DIR_GRID = os.path.join("static", "screenshots", "grid")
 DIR_MINIMAP_OCR = os.path.join("static", "screenshots", "minimap_ocr")
-os.makedirs(DIR_GRID, exist_ok=True)
-os.makedirs(DIR_MINIMAP_OCR, exist_ok=True)
 
 # Global variables for rangefinder logic
 current_map = None
@@ -38,20 +38,29 @@ valid_map_detected = False
 active_config = None
 latest_grid_filename = None
 
-OUTPUT_IMAGE_PATH = "static/screenshots/minimap_ocr/tracked_target.png"
 grid_offset_x = 0
 grid_offset_y = 0
 latest_ocr_text = ""
 latest_cell_size_m = None
+latest_targets = []
+
+# Sub-pixel range readings, averaged over a short time window per target
+range_engine = RangeEngine()
+_last_player_fix = None
+# Range readings go to the session log at most this often (seconds)
+RANGE_RECORD_INTERVAL = 1.0
+_last_range_record = 0.0
+
+# Automatic grid calibration (fits cell_block and offset from the minimap itself)
+grid_calibrator = GridCalibrator()
+auto_calibrate = True
+calibrated_fit = None
 
 # Flags
 capture_paused = False
 ocr_paused = False
 config_logged = False
 
-# Custom Tesseract configuration
-TESS_CONFIG = '--psm 7 -c tessedit_char_whitelist=0123456789.'
-
 # -----------------------------------------------------------
 # Minimap Tracking Functions (Player & Ping Detection)
 # -----------------------------------------------------------
@@ -76,41 +85,74 @@ def hex_to_bgr(hex_str):
     b = int(hex_str[4:6], 16)
     return np.array([b, g, r], dtype=np.uint8)
 
+# Enemy marker colors (matched per channel with enemy_tolerance)
+enemy_hex_colors = ["fa0c00", "9e0800", "950801"]
+
 target_colors = [hex_to_bgr(h) for h in hex_colors]
 ping_target_colors = [hex_to_bgr(h) for h in ping_hex_colors]
 
+enemy_tolerance = 60
+enemy_bounds = [
+    (np.clip(c.astype(np.int16) - (enemy_tolerance - 1), 0, 255).astype(np.uint8),
+     np.clip(c.astype(np.int16) + (enemy_tolerance - 1), 0, 255).astype(np.uint8))
+    for c in (hex_to_bgr(h) for h in enemy_hex_colors)
+]
+
+# Blob filters (pixel areas at the 432x432 minimap capture)
+PING_MIN_AREA = 3
+PING_MAX_AREA = 400
+PING_MAX_ASPECT = 3
+ENEMY_MIN_AREA = 6
+ENEMY_MAX_AREA = 150
+ENEMY_MAX_ASPECT = 3
+
 tolerance = 4
 max_radius = 10
 
-def process_image(image):
+PLAYER_MARK_COLOR = np.array([0, 0, 255], dtype=np.uint8)
+
+class FrameBuffers:
+    """Scratch arrays reused by every combined_loop iteration to avoid per-frame allocations."""
+
+    def __init__(self, height, width):
+        self.shape = (height, width)
+        self.frame = np.empty((height, width, 3), dtype=np.uint8)
+        self.gray = np.empty((height, width), dtype=np.uint8)
+        self.hit = np.empty((height, width), dtype=bool)
+        self.player_mask = np.empty((height, width), dtype=np.uint8)
+        self.ping_mask = np.empty((height, width), dtype=np.uint8)
+        self.enemy_mask = np.empty((height, width), dtype=np.uint8)
+
+def color_mask(image, targets, out=None):
+    """
+    Mark pixels within `tolerance` (Euclidean BGR distance) of any target colour as 255.
+    When `out` is given, the mask is computed in place without allocating.
+    """
+    return color_classify.near(image, targets, tolerance, out)
+
+def bounds_mask(image, bounds, out=None):
+    """Mark pixels that fall inside any of the per-channel (lower, upper) BGR bounds as 255."""
+    return color_classify.in_ranges(image, bounds, out)
+
+def mark_pixels(image, mask, color=PLAYER_MARK_COLOR, scratch=None):
+    """Paint every masked pixel of `image` with `color` in place."""
+    hit = np.not_equal(mask, 0, out=scratch)
+    np.copyto(image, color, where=hit[:, :, None])
+    return image
+
+def process_image(image, out=None):
     """Process image for player detection; return image copy and a binary mask."""
-    output = image.copy()
-    h, w, _ = image.shape
-    reshaped = image.reshape(-1, 3)
-    mask = np.zeros((reshaped.shape[0],), dtype=bool)
-    for target in target_colors:
-        diff = reshaped.astype(np.int16) - target.astype(np.int16)
-        dist = np.linalg.norm(diff, axis=1)
-        mask |= (dist < tolerance)
-    output.reshape(-1, 3)[mask] = [0, 0, 255]
-    return output, mask
-
-def process_ping(image):
-    """Process image for ping detection; return image copy and binary mask."""
-    output = image.copy()
-    h, w, _ = image.shape
-    reshaped = image.reshape(-1, 3)
-    ping_mask = np.zeros((reshaped.shape[0],), dtype=bool)
-    for target in ping_target_colors:
-        diff = reshaped.astype(np.int16) - target.astype(np.int16)
-        dist = np.linalg.norm(diff, axis=1)
-        ping_mask |= (dist < tolerance)
-    return output, ping_mask
+    mask = color_mask(image, target_colors, out=out)
+    return mark_pixels(image.copy(), mask), mask
+
+def process_ping(image, out=None):
+    """Process image for ping detection; return the (untouched) image and binary mask."""
+    return image, color_mask(image, ping_target_colors, out=out)
 
 def get_enclosing_circle(mask, image_shape):
     """Return center, radius, and count of detected pixels using cv2.minEnclosingCircle."""
     h, w = image_shape[:2]
-    mask_2d = mask.reshape(h, w).astype(np.uint8)
+    mask_2d = mask.reshape(h, w).view(np.uint8)
     points = cv2.findNonZero(mask_2d)
     if points is not None:
         center, radius = cv2.minEnclosingCircle(points)
@@ -124,15 +166,15 @@ def get_enclosing_circle(mask, image_shape):
         return None, None, 0
 
 def draw_filled_circle(image, center, radius, color=(0, 0, 255)):
-    output = image.copy()
+    """Draw a filled circle onto `image` in place."""
     if center is not None and radius is not None:
-        cv2.circle(output, center, radius, color, -1)
-    return output
+        cv2.circle(image, center, radius, color, -1)
+    return image
 
 def overlay_text(image, text, color=(255, 255, 255), position=(10, 30)):
-    output = image.copy()
-    cv2.putText(output, text, position, cv2.FONT_HERSHEY_SIMPLEX, 1, color, 2)
-    return output
+    """Draw `text` onto `image` in place."""
+    cv2.putText(image, text, position, cv2.FONT_HERSHEY_SIMPLEX, 1, color, 2)
+    return image
 
 # Tracking parameters for minimap detection
 prev_center = None
@@ -145,11 +187,31 @@ min_count_threshold = 2
 # A variable for storing the most recent pause message (to avoid log spam)
 _last_pause_msg = None
 
+_placeholder = None
+
 def write_placeholder():
     """Write a placeholder image when tracking is paused."""
-    placeholder = np.zeros((GRID_REGION[3], GRID_REGION[2], 3), dtype=np.uint8)
-    placeholder = overlay_text(placeholder, "Tracking paused", color=(0, 0, 255), position=(10, 30))
-    cv2.imwrite(OUTPUT_IMAGE_PATH, placeholder)
+    global _placeholder
+    if _placeholder is None:
+        _placeholder = np.zeros((GRID_HEIGHT, GRID_WIDTH, 3), dtype=np.uint8)
+        overlay_text(_placeholder, "Tracking paused", color=(0, 0, 255), position=(10, 30))
+    cv2.imwrite(OUTPUT_IMAGE_PATH, _placeholder)
+
+def detect_markers(img, buffers):
+    """
+    Player, ping and enemy markers of one minimap frame in buffers' reference size.
+    Returns (player_mask, player_blobs, ping_mask, ping_blobs, enemy_mask, enemy_blobs); the masks
+    are taken from the clean frame, so call this before anything is drawn onto img.
+    """
+    mask = color_mask(img, target_colors, out=buffers.player_mask)
+    ping_mask = color_mask(img, ping_target_colors, out=buffers.ping_mask)
+    enemy_mask = bounds_mask(img, enemy_bounds, out=buffers.enemy_mask)
+    player_blobs = find_blobs(mask, min_area=1)
+    ping_blobs = find_blobs(ping_mask, min_area=PING_MIN_AREA, max_area=PING_MAX_AREA,
+                            max_aspect=PING_MAX_ASPECT)
+    enemy_blobs = find_blobs(enemy_mask, min_area=ENEMY_MIN_AREA, max_area=ENEMY_MAX_AREA,
+                             max_aspect=ENEMY_MAX_ASPECT)
+    return mask, player_blobs, ping_mask, ping_blobs, enemy_mask, enemy_blobs
 
 # -----------------------------------------------------------
 # Combined Capture Loop (Tracking + Grid Overlay)
@@ -160,29 +222,66 @@ def combined_loop():
     then draw grid lines (from the active map configuration) onto the image.
     Save the final combined image to OUTPUT_IMAGE_PATH.
     """
-    global prev_center, prev_count, stable_count, _last_pause_msg
+    global prev_center, prev_count, stable_count, _last_pause_msg, latest_targets, calibrated_fit, _last_player_fix
+    global _last_range_record
     global grid_offset_x, grid_offset_y, active_config, current_map, valid_map_detected
 
     with mss.mss() as sct:
-        monitor = {"left": GRID_REGION[0], "top": GRID_REGION[1], "width": GRID_REGION[2], "height": GRID_REGION[3]}
-        while True:
-            if (not is_aces_in_focus()) or state.statistics_open or state.main_menu_open or (state.game_state == "In Menu"):
-                msg = f"Pausing combined tracking. Focus={is_aces_in_focus()}, stats={state.statistics_open}, game_state={state.game_state}"
+        buffers = FrameBuffers(GRID_HEIGHT, GRID_WIDTH)
+        img = buffers.frame
+        grid_rect = None
+        native = None
+        while services.tick():
+            if (not is_aces_in_focus()) or state.statistics_open or state.main_menu_open or (state.game_state == "In Menu") \
+                    or not layout.valid("grid"):
+                msg = (f"Pausing combined tracking. Focus={is_aces_in_focus()}, stats={state.statistics_open}, "
+                       f"game_state={state.game_state}, capture_valid={layout.valid('grid')}")
                 if _last_pause_msg != msg:
                     log(msg, level="INFO", tag="COMBINED")
                     _last_pause_msg = msg
                 write_placeholder()
-                time.sleep(1)
+                services.sleep(1)
                 continue
             else:
                 _last_pause_msg = None
 
+            if layout.region("grid") != grid_rect:
+                grid_rect = layout.region("grid")
+                monitor = {"left": grid_rect[0], "top": grid_rect[1], "width": grid_rect[2], "height": grid_rect[3]}
+                # Non-1080p screens: convert at native size, then resize once into the reference frame.
+                native = None if grid_rect[2:] == (GRID_WIDTH, GRID_HEIGHT) else \
+                    np.empty((grid_rect[3], grid_rect[2], 3), dtype=np.uint8)
+
             sct_img = sct.grab(monitor)
-            img = cv2.cvtColor(np.array(sct_img), cv2.COLOR_BGRA2BGR)
+            # View the raw BGRA grab without copying and convert straight into the reusable frame.
+            bgra = np.frombuffer(sct_img.raw, dtype=np.uint8).reshape(sct_img.height, sct_img.width, 4)
+            if native is None:
+                cv2.cvtColor(bgra, cv2.COLOR_BGRA2BGR, dst=img)
+            else:
+                cv2.cvtColor(bgra, cv2.COLOR_BGRA2BGR, dst=native)
+                interpolation = cv2.INTER_AREA if native.shape[1] > GRID_WIDTH else cv2.INTER_LINEAR
+                cv2.resize(native, (GRID_WIDTH, GRID_HEIGHT), dst=img, interpolation=interpolation)
+            gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY, dst=buffers.gray)
+
+            # --- Grid Calibration (cached per map, refit on zoom change) ---
+            if auto_calibrate:
+                fit = grid_calibrator.update(current_map or "Unknown", gray)
+                if fit is not None:
+                    calibrated_fit = fit
+                    grid_offset_x, grid_offset_y = fit["offset"]
+            else:
+                calibrated_fit = None
+
+            mask, player_blobs, ping_mask, ping_blobs, enemy_mask, enemy_blobs = detect_markers(img, buffers)
 
             # --- Player Detection ---
-            processed_img, mask = process_image(img)
-            center, radius, count = get_enclosing_circle(mask, img.shape)
+            output_img = mark_pixels(img, mask, scratch=buffers.hit)
+            if player_blobs:
+                center, radius = blob_circle(player_blobs[0], max_radius=max_radius)
+                count = player_blobs[0].area
+            else:
+                center, radius, count = None, None, 0
+            detected_center = center
             if count > 0:
                 msg = f"Target seen: {count} pixels"
                 text_color = (255, 255, 255)
@@ -224,68 +323,74 @@ def combined_loop():
                 prev_count = 0
                 stable_count = 0
 
-            circled_img = draw_filled_circle(processed_img, center, radius)
-            output_img = overlay_text(circled_img, msg, color=text_color, position=(10, 30))
-
-            # --- Ping Detection ---
-            def process_ping_local(image):
-                out = image.copy()
-                h, w, _ = image.shape
-                reshaped = image.reshape(-1, 3)
-                ping_mask = np.zeros((reshaped.shape[0],), dtype=bool)
-                for target in ping_target_colors:
-                    diff = reshaped.astype(np.int16) - target.astype(np.int16)
-                    dist = np.linalg.norm(diff, axis=1)
-                    ping_mask |= (dist < tolerance)
-                return out, ping_mask
-
-            _, ping_mask = process_ping_local(img)
-            ping_center, ping_radius, ping_count = get_enclosing_circle(ping_mask, img.shape)
-            if ping_count > 0:
-                output_img = draw_filled_circle(output_img, ping_center, ping_radius, color=(0, 255, 255))
-                if center is not None and ping_center is not None:
-                    cv2.line(output_img, ping_center, center, (255, 255, 255), 2)
-                    dx = ping_center[0] - center[0]
-                    dy = ping_center[1] - center[1]
-                    pixel_distance = math.sqrt(dx * dx + dy * dy)
-                    active_map = getattr(state, "current_map", None)
-                    if active_map not in map_configs:
-                        active_map = "Frozen Pass"
-                    config = map_configs[active_map]
-                    conversion_factor = config["cell_size_m"] / config["cell_block"]
-                    range_m = pixel_distance * conversion_factor
-                    range_text = f"Range: {range_m:.2f} m"
-                    cv2.putText(output_img, range_text, (10, 70), cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 255, 0), 2)
-                    log(f"Calculated range: {range_text} (Pixel distance: {pixel_distance:.2f}, Conversion factor: {conversion_factor:.4f})",
-                        level="INFO", tag="COMBINED")
-
-            if active_config is not None:
-                output_img = draw_infinite_grid(output_img, active_config.get("cell_block", 56), grid_offset_x, grid_offset_y)
+            draw_filled_circle(output_img, center, radius)
+            overlay_text(output_img, msg, color=text_color, position=(10, 30))
+
+            # Sub-pixel player position; held at the last accepted fix while tracking rejects a jump.
+            if center is None:
+                player_fix = _last_player_fix = None
+            elif center == detected_center:
+                player_fix = _last_player_fix = measure_blob(gray, mask, player_blobs[0])
+            else:
+                player_fix = _last_player_fix
+
+            # --- Ping & Enemy Markers ---
+            fixes = []
+            for kind, blobs, target_mask, color in (("ping", ping_blobs, ping_mask, (0, 255, 255)),
+                                                    ("enemy", enemy_blobs, enemy_mask, (255, 0, 255))):
+                for blob in blobs:
+                    target_center, target_radius = blob_circle(blob, max_radius=max_radius)
+                    draw_filled_circle(output_img, target_center, target_radius, color=color)
+                    if center is not None:
+                        cv2.line(output_img, target_center, center, (255, 255, 255), 1 if kind == "enemy" else 2)
+                        fixes.append((kind, measure_blob(gray, target_mask, blob)))
+
+            config = config_store.configs.get(current_map) if current_map else None
+            if player_fix is not None and fixes and config is not None and "cell_size_m" in config:
+                cell_block = calibrated_fit["cell_block"] if calibrated_fit is not None else config["cell_block"]
+                targets = range_engine.update(player_fix, fixes, current_map, cell_block, config["cell_size_m"],
+                                              calibrated=calibrated_fit is not None)
+                for target in targets:
+                    if target["kind"] == "ping":
+                        log(f"Calculated range: {target['range_m']:.1f} ± {target['sigma_m']:.1f} m "
+                            f"(Pixel distance: {target['pixels']:.2f}, samples: {target['samples']})",
+                            level="INFO", tag="COMBINED")
+            else:
+                targets = []
+                if fixes and config is None:
+                    cv2.putText(output_img, "Range: no map config", (10, 70),
+                                cv2.FONT_HERSHEY_SIMPLEX, 0.8, (0, 0, 255), 2)
+
+            for i, target in enumerate(targets[:4]):
+                label = "Range" if target["kind"] == "ping" else "Enemy"
+                cv2.putText(output_img, f"{label}: {target['range_m']:.0f} +/- {target['sigma_m']:.0f} m", (10, 70 + 30 * i),
+                            cv2.FONT_HERSHEY_SIMPLEX, 0.8, (0, 255, 0), 2)
+            latest_targets = targets
+            if targets and time.time() - _last_range_record >= RANGE_RECORD_INTERVAL:
+                _last_range_record = time.time()
+                for target in targets:
+                    record("range", kind=target["kind"], range_m=target["range_m"], sigma_m=target["sigma_m"])
+
+            if current_map in config_store:
+                stored = config_store.configs[current_map]
+                # A hot-reloaded offset applies right away unless auto-calibration owns the offset.
+                if stored is not active_config and active_config is not None and calibrated_fit is None \
+                        and stored.get("offset", (0, 0)) != active_config.get("offset", (0, 0)):
+                    grid_offset_x, grid_offset_y = stored.get("offset", (0, 0))
+                    log(f"Grid offset for {current_map} reloaded: ({grid_offset_x}, {grid_offset_y})",
+                        level="INFO", tag="RANGE")
+                active_config = stored
+            if calibrated_fit is not None:
+                draw_infinite_grid(output_img, calibrated_fit["cell_block"], grid_offset_x, grid_offset_y)
+            elif active_config is not None:
+                draw_infinite_grid(output_img, active_config.get("cell_block", 56), grid_offset_x, grid_offset_y)
 
             cv2.imwrite(OUTPUT_IMAGE_PATH, output_img)
-            time.sleep(0.1)
+            services.sleep(0.1)
 
 # -----------------------------------------------------------
 # Rangefinder OCR and Flask Web Server
 # -----------------------------------------------------------
-def cleanup_directory_by_count(directory, max_files=10):
-    files = [os.path.join(directory, f) for f in os.listdir(directory)
-             if os.path.isfile(os.path.join(directory, f))]
-    if len(files) <= max_files:
-        return
-    files.sort(key=lambda f: os.path.getmtime(f))
-    for f in files[:-max_files]:
-        try:
-            os.remove(f)
-        except Exception as e:
-            log(f"Error deleting {f}: {e}", level="ERROR", tag="RANGE")
-
-def ocr_map_name(region):
-    ocr_img = pyautogui.screenshot(region=region)
-    ocr_gray = ocr_img.convert("L")
-    text = pytesseract.image_to_string(ocr_gray, lang='eng')
-    return text.strip()
-
 def draw_infinite_grid(img, cell_period, offset_x, offset_y):
     h, w = img.shape[:2]
     n_min = math.floor((-offset_x) / cell_period)
@@ -307,14 +412,14 @@ def ocr_detection_loop():
     """
     global current_map, valid_map_detected, active_config, grid_offset_x, grid_offset_y, ocr_paused, latest_ocr_text
     global latest_minimap_ocr_original, latest_minimap_ocr_processed
-    while True:
+    while services.tick():
         if state.statistics_open:
             log("Statistics open; pausing minimap name detection.", level="INFO", tag="OCR")
-            time.sleep(2)
+            services.sleep(2)
             continue
         if state.main_menu_open:
             log("Main Menu detected; pausing minimap name detection.", level="INFO", tag="OCR")
-            time.sleep(2)
+            services.sleep(2)
             continue
 
         if state.game_state == "In Menu":
@@ -323,235 +428,72 @@ def ocr_detection_loop():
                 valid_map_detected = False
                 active_config = None
                 current_map = None
+                range_engine.reset()
             if not ocr_paused:
                 ocr_paused = True
-            time.sleep(2)
+            services.sleep(2)
             continue
         else:
             if ocr_paused:
                 log("Game in focus; resuming OCR detection.", level="INFO", tag="OCR")
                 ocr_paused = False
 
-        if is_aces_in_focus():
+        if is_aces_in_focus() and layout.valid():
             log("Game in focus; running OCR to detect map name...", level="INFO", tag="OCR")
             timestamp = int(time.time())
             try:
-                minimap_ocr_img = pyautogui.screenshot(region=OCR_REGION)
+                minimap_ocr_img = layout.grab("map_name")
                 minimap_ocr_original_filename = f"minimap_ocr_original_{timestamp}.png"
                 minimap_ocr_original_filepath = os.path.join(DIR_MINIMAP_OCR, minimap_ocr_original_filename)
                 minimap_ocr_img.save(minimap_ocr_original_filepath)
                 latest_minimap_ocr_original = f"screenshots/minimap_ocr/{minimap_ocr_original_filename}"
 
-                minimap_np = np.array(minimap_ocr_img)
-                target = np.array([230, 206, 120], dtype=np.uint8)
-                tol = 60
-                diff = cv2.absdiff(minimap_np, target)
-                distance = np.linalg.norm(diff, axis=2)
-                processed = np.where(distance < tol, 0, 255).astype(np.uint8)
-                if len(processed.shape) == 3:
-                    processed = cv2.cvtColor(processed, cv2.COLOR_RGB2GRAY)
+                map_pipeline = PIPELINES["map_name"]
+                processed = map_pipeline.run(minimap_ocr_img)
                 minimap_ocr_processed_filename = f"minimap_ocr_processed_{timestamp}.png"
                 minimap_ocr_processed_filepath = os.path.join(DIR_MINIMAP_OCR, minimap_ocr_processed_filename)
                 cv2.imwrite(minimap_ocr_processed_filepath, processed)
                 latest_minimap_ocr_processed = f"screenshots/minimap_ocr/{minimap_ocr_processed_filename}"
 
-                map_text = pytesseract.image_to_string(processed, lang='eng').strip()
+                map_text = ocr_image(processed, config=map_pipeline.config, preprocess=map_pipeline.name).text.strip()
                 latest_ocr_text = map_text
             except Exception as e:
                 log(f"Error capturing minimap OCR images: {e}", level="ERROR", tag="OCR")
                 map_text = ""
             log(f"OCR Result (from processed image): {map_text}", level="DEBUG", tag="OCR")
-            for map_name in sorted(map_configs.keys(), key=lambda x: -len(x)):
-                if map_name.lower() in map_text.lower():
-                    current_map = map_name
-                    valid_map_detected = True
-                    active_config = map_configs[map_name]
-                    grid_offset_x, grid_offset_y = active_config.get("offset", (0, 0))
-                    log(f"Detected map: {current_map}", level="INFO", tag="OCR")
-                    break
+            map_name, config = config_store.lookup(map_text)
+            if map_name is not None:
+                if map_name != current_map:
+                    record("map", map=map_name)
+                current_map = map_name
+                valid_map_detected = True
+                active_config = config
+                grid_offset_x, grid_offset_y = active_config.get("offset", (0, 0))
+                log(f"Detected map: {current_map}", level="INFO", tag="OCR")
             if not valid_map_detected:
                 log("Map name not recognized. Retrying in 2 seconds...", level="WARN", tag="OCR")
-        time.sleep(2)
-
-# -----------------------------------------------------------
-# Flask Web Server for Rangefinder Interface
-# -----------------------------------------------------------
-app = Flask(__name__, static_url_path='/static', static_folder='static')
-
-RANGEFINDER_HTML = """
-<!DOCTYPE html>
-<html>
-<head>
-    <meta charset="UTF-8">
-    <title>Rangefinder Dashboard</title>
-    <link rel="stylesheet" href="https://stackpath.bootstrapcdn.com/bootswatch/4.5.2/darkly/bootstrap.min.css">
-    <style>
-        body { margin: 20px; background-color: #2b2b2b; color: #ddd; }
-        .screenshot { width: 50%; border: 2px solid #555; margin-bottom: 20px; }
-        .info-panel { margin-top: 20px; }
-        .info-panel p { font-size: 18px; margin: 5px 0; }
-        .control-panel { margin-top: 20px; }
-    </style>
-    <script>
-        function fetchLatest() {
-            fetch('/latest')
-            .then(response => response.json())
-            .then(data => {
-                if(data.grid) {
-                    document.getElementById('combined_img').src = data.grid + '?t=' + new Date().getTime();
-                }
-                document.getElementById('current_map').innerText = "Current Map: " + data.current_map;
-                document.getElementById('ocr_text').innerText = "OCR Text: " + data.ocr_text;
-                document.getElementById('cell_size').innerText = "Cell Size (m): " + (data.cell_size !== null ? data.cell_size : "N/A");
-                document.getElementById('offset_line').innerText = "Grid Offset: (" + data.offset_x + ", " + data.offset_y + ")";
-            })
-            .catch(err => console.error("Error fetching latest:", err));
-        }
-        function adjustOffset(axis, delta) {
-            fetch('/adjust_offset?axis=' + axis + '&delta=' + delta)
-            .then(response => response.json())
-            .then(data => { alert(data.message); fetchLatest(); })
-            .catch(err => console.error("Error adjusting offset:", err));
-        }
-        function changeMap() {
-            let mapName = document.getElementById('map_select').value;
-            fetch('/set_map?map=' + encodeURIComponent(mapName))
-            .then(response => response.json())
-            .then(data => { alert(data.message); fetchLatest(); })
-            .catch(err => console.error("Error changing map:", err));
-        }
-        function bypassOCR() {
-            fetch('/bypass')
-            .then(response => response.json())
-            .then(data => { alert(data.message); fetchLatest(); })
-            .catch(err => console.error("Error bypassing OCR:", err));
-        }
-        setInterval(fetchLatest, 1000);
-        window.onload = fetchLatest;
-    </script>
-</head>
-<body>
-    <div class="container">
-        <h1 class="text-center my-4">Rangefinder Dashboard</h1>
-        <div class="row">
-            <div class="col-md-12">
-                <img id="combined_img" class="screenshot" src="{{ grid }}" alt="Combined Output">
-            </div>
-        </div>
-        <div class="row info-panel">
-            <div class="col-md-3">
-                <p id="current_map">Current Map: None</p>
-            </div>
-            <div class="col-md-3">
-                <p id="ocr_text">OCR Text: </p>
-            </div>
-            <div class="col-md-3">
-                <p id="cell_size">Cell Size (m): N/A</p>
-            </div>
-            <div class="col-md-3">
-                <p id="offset_line">Grid Offset: (0, 0)</p>
-            </div>
-        </div>
-        <div class="row control-panel">
-            <div class="col-md-6">
-                <div class="btn-group" role="group">
-                    <button type="button" class="btn btn-primary" onclick="adjustOffset('x', 1)">Offset X +</button>
-                    <button type="button" class="btn btn-primary" onclick="adjustOffset('x', -1)">Offset X -</button>
-                    <button type="button" class="btn btn-primary" onclick="adjustOffset('y', 1)">Offset Y +</button>
-                    <button type="button" class="btn btn-primary" onclick="adjustOffset('y', -1)">Offset Y -</button>
-                </div>
-            </div>
-            <div class="col-md-6">
-                <div class="input-group">
-                    <select id="map_select" class="custom-select">
-                        {% for map in maps %}
-                            <option value="{{ map }}" {% if map == current_map %}selected{% endif %}>{{ map }}</option>
-                        {% endfor %}
-                    </select>
-                    <div class="input-group-append">
-                        <button class="btn btn-secondary" type="button" onclick="changeMap()">Set Map</button>
-                    </div>
-                </div>
-                <br>
-                <button class="btn btn-warning" onclick="bypassOCR()">Bypass OCR (Default Frozen Pass)</button>
-            </div>
-        </div>
-    </div>
-</body>
-</html>
-"""
-
-@app.route("/")
-def index():
-    return render_template_string(RANGEFINDER_HTML,
-                                  grid=OUTPUT_IMAGE_PATH,
-                                  maps=list(map_configs.keys()),
-                                  current_map=current_map if current_map else "None")
-
-@app.route("/latest")
-def latest():
-    return jsonify({
-        "grid": OUTPUT_IMAGE_PATH,
-        "offset_x": grid_offset_x,
-        "offset_y": grid_offset_y,
-        "current_map": current_map if current_map else "None",
-        "ocr_text": latest_ocr_text,
-        "cell_size": latest_cell_size_m
-    })
-
-@app.route("/adjust_offset")
-def adjust_offset():
-    global grid_offset_x, grid_offset_y
-    try:
-        axis = request.args.get("axis", "").lower()
-        delta = int(request.args.get("delta", 0))
-        if axis == "x":
-            grid_offset_x += delta
-        elif axis == "y":
-            grid_offset_y += delta
-    except Exception as e:
-        message = f"Error updating offsets: {e}"
-    return jsonify({"message": message})
-
-@app.route("/set_map")
-def set_map():
-    global current_map, grid_offset_x, grid_offset_y, active_config, valid_map_detected, latest_cell_size_m
-    map_name = request.args.get("map", "").strip()
-    if map_name in map_configs:
-        current_map = map_name
-        active_config = map_configs[map_name]
-        grid_offset_x, grid_offset_y = active_config.get("offset", (0, 0))
-        valid_map_detected = True
-        if "cell_size_m" in active_config:
-            latest_cell_size_m = active_config["cell_size_m"]
-        message = (f"Map changed to {map_name}. New settings: grid_region: {GRID_REGION}, "
-                   f"cell_block: {active_config['cell_block']}, "
-                   f"offset: {active_config['offset']}, cell_size_m: {latest_cell_size_m}.")
-    else:
-        message = f"Map '{map_name}' not found."
-    return jsonify({"message": message})
-
-@app.route("/bypass")
-def bypass():
-    global current_map, valid_map_detected, active_config, grid_offset_x, grid_offset_y, latest_cell_size_m
-    current_map = "Frozen Pass"
-    valid_map_detected = True
-    active_config = map_configs["Frozen Pass"]
-    grid_offset_x, grid_offset_y = active_config.get("offset", (0, 0))
-    if "cell_size_m" in active_config:
-        latest_cell_size_m = active_config["cell_size_m"]
-    return jsonify({"message": "Bypassed OCR. Defaulted to Frozen Pass."})
+        services.sleep(2)
 
 def start_rangefinder():
-    ocr_thread = threading.Thread(target=ocr_detection_loop, daemon=True)
-    ocr_thread.start()
-    time.sleep(5)
-    combined_thread = threading.Thread(target=combined_loop, daemon=True)
-    combined_thread.start()
-    app.run(host="0.0.0.0", port=5001, debug=False)
+    """Start map OCR and minimap tracking; the web interface is served by rangefinder_web."""
+    os.makedirs(DIR_GRID, exist_ok=True)
+    os.makedirs(DIR_MINIMAP_OCR, exist_ok=True)
+    config_store.start_watching()
+    # Registered here rather than at import, so the loops always belong to the module that starts them.
+    supervisor.register("minimap", combined_loop)
+    supervisor.register("map_ocr", ocr_detection_loop)
+    supervisor.start("map_ocr")
+    # The tracking loop draws "no map config" until the OCR thread has found the map.
+    supervisor.start("minimap")
 
 # -----------------------------------------------------------
 # Main Entry Point: Start Combined Tracking and Rangefinder
 # -----------------------------------------------------------
 if __name__ == "__main__":
-    start_rangefinder()
\ No newline at end of file
+    # The web routes import this file as `rangefinder_logic`; run the loops in that module, not in
+    # this __main__ copy, so /latest, /adjust_offset and /set_map see the state the loops update.
+    import rangefinder_logic
+    from server import start_server
+    services.mark_ready("rangefinder")
+    rangefinder_logic.start_rangefinder()
+    start_server()
\ No newline at end of file
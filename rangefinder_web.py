@@ -0,0 +1,278 @@
+# rangefinder_web.py
+"""
+Rangefinder dashboard and JSON API, served by server.app on the main port.
+
+This module is imported by the web server at startup and stays light: rangefinder_logic
+(OpenCV, mss, Tesseract) is only touched once services reports it ready, and until then
+the page renders and /latest reports that tracking is still starting.
+"""
+from flask import Blueprint, render_template_string, jsonify, request
+
+import services
+from map_config_store import config_store
+from screen_layout import layout
+from versioned import VersionedDocument, versioned_response
+
+rangefinder_bp = Blueprint("rangefinder", __name__)
+
+OUTPUT_IMAGE_PATH = "static/screenshots/minimap_ocr/tracked_target.png"
+
+def _engine():
+    """The rangefinder_logic module once it has been loaded in the background, else None."""
+    if not services.is_ready("rangefinder"):
+        return None
+    import rangefinder_logic
+    return rangefinder_logic
+
+NOT_READY_MESSAGE = "Rangefinder is still starting."
+
+RANGEFINDER_HTML = """
+<!DOCTYPE html>
+<html>
+<head>
+    <meta charset="UTF-8">
+    <title>Rangefinder Dashboard</title>
+    <link rel="stylesheet" href="https://stackpath.bootstrapcdn.com/bootswatch/4.5.2/darkly/bootstrap.min.css">
+    <style>
+        body { margin: 20px; background-color: #2b2b2b; color: #ddd; }
+        .screenshot { width: 50%; border: 2px solid #555; margin-bottom: 20px; }
+        .info-panel { margin-top: 20px; }
+        .info-panel p { font-size: 18px; margin: 5px 0; }
+        .control-panel { margin-top: 20px; }
+    </style>
+    <script>
+        function fetchLatest() {
+            fetch('/latest')
+            .then(response => response.json())
+            .then(data => {
+                if(data.grid) {
+                    document.getElementById('combined_img').src = data.grid + '?t=' + new Date().getTime();
+                }
+                document.getElementById('current_map').innerText = "Current Map: " + data.current_map;
+                document.getElementById('ocr_text').innerText = "OCR Text: " + data.ocr_text;
+                document.getElementById('cell_size').innerText = "Cell Size (m): " + (data.cell_size !== null ? data.cell_size : "N/A");
+                document.getElementById('offset_line').innerText = "Grid Offset: (" + data.offset_x + ", " + data.offset_y + ")";
+                document.getElementById('calibration').innerText = "Auto Calibration: " + (data.auto_calibrate ? (data.calibration ? "cell " + data.calibration.cell_block + " px, confidence " + data.calibration.confidence : "searching") : "off");
+            })
+            .catch(err => console.error("Error fetching latest:", err));
+        }
+        function adjustOffset(axis, delta) {
+            fetch('/adjust_offset?axis=' + axis + '&delta=' + delta)
+            .then(response => response.json())
+            .then(data => { alert(data.message); fetchLatest(); })
+            .catch(err => console.error("Error adjusting offset:", err));
+        }
+        function changeMap() {
+            let mapName = document.getElementById('map_select').value;
+            fetch('/set_map?map=' + encodeURIComponent(mapName))
+            .then(response => response.json())
+            .then(data => { alert(data.message); fetchLatest(); })
+            .catch(err => console.error("Error changing map:", err));
+        }
+        function setAutoCalibrate(enabled) {
+            fetch('/calibrate?enabled=' + (enabled ? 1 : 0) + '&force=' + (enabled ? 1 : 0))
+            .then(response => response.json())
+            .then(data => { alert(data.message); fetchLatest(); })
+            .catch(err => console.error("Error toggling calibration:", err));
+        }
+        function bypassOCR() {
+            fetch('/bypass')
+            .then(response => response.json())
+            .then(data => { alert(data.message); fetchLatest(); })
+            .catch(err => console.error("Error bypassing OCR:", err));
+        }
+        setInterval(fetchLatest, 1000);
+        window.onload = fetchLatest;
+    </script>
+</head>
+<body>
+    <div class="container">
+        <h1 class="text-center my-4">Rangefinder Dashboard</h1>
+        <div class="row">
+            <div class="col-md-12">
+                <img id="combined_img" class="screenshot" src="{{ grid }}" alt="Combined Output">
+            </div>
+        </div>
+        <div class="row info-panel">
+            <div class="col-md-3">
+                <p id="current_map">Current Map: None</p>
+            </div>
+            <div class="col-md-3">
+                <p id="ocr_text">OCR Text: </p>
+            </div>
+            <div class="col-md-3">
+                <p id="cell_size">Cell Size (m): N/A</p>
+            </div>
+            <div class="col-md-3">
+                <p id="offset_line">Grid Offset: (0, 0)</p>
+            </div>
+        </div>
+        <div class="row info-panel">
+            <div class="col-md-12">
+                <p id="calibration">Auto Calibration: searching</p>
+            </div>
+        </div>
+        <div class="row control-panel">
+            <div class="col-md-6">
+                <div class="btn-group" role="group">
+                    <button type="button" class="btn btn-primary" onclick="adjustOffset('x', 1)">Offset X +</button>
+                    <button type="button" class="btn btn-primary" onclick="adjustOffset('x', -1)">Offset X -</button>
+                    <button type="button" class="btn btn-primary" onclick="adjustOffset('y', 1)">Offset Y +</button>
+                    <button type="button" class="btn btn-primary" onclick="adjustOffset('y', -1)">Offset Y -</button>
+                </div>
+            </div>
+            <div class="col-md-6">
+                <div class="input-group">
+                    <select id="map_select" class="custom-select">
+                        {% for map in maps %}
+                            <option value="{{ map }}" {% if map == current_map %}selected{% endif %}>{{ map }}</option>
+                        {% endfor %}
+                    </select>
+                    <div class="input-group-append">
+                        <button class="btn btn-secondary" type="button" onclick="changeMap()">Set Map</button>
+                    </div>
+                </div>
+                <br>
+                <button class="btn btn-warning" onclick="bypassOCR()">Bypass OCR (Default Frozen Pass)</button>
+                <button class="btn btn-info" onclick="setAutoCalibrate(true)">Auto Calibrate</button>
+                <button class="btn btn-secondary" onclick="setAutoCalibrate(false)">Manual Grid</button>
+            </div>
+        </div>
+    </div>
+</body>
+</html>
+"""
+
+@rangefinder_bp.route("/rangefinder")
+def index():
+    rf = _engine()
+    current_map = rf.current_map if rf is not None else None
+    return render_template_string(RANGEFINDER_HTML,
+                                  grid=OUTPUT_IMAGE_PATH,
+                                  maps=config_store.names(),
+                                  current_map=current_map if current_map else "None")
+
+def _latest_fingerprint():
+    rf = _engine()
+    if rf is None:
+        return None
+    return (rf.grid_offset_x, rf.grid_offset_y, rf.current_map, rf.latest_ocr_text, rf.latest_cell_size_m,
+            rf.latest_targets, rf.auto_calibrate, rf.calibrated_fit)
+
+def build_latest():
+    rf = _engine()
+    if rf is None:
+        return {"ready": False, "grid": None, "offset_x": 0, "offset_y": 0, "current_map": "None",
+                "ocr_text": "", "cell_size": None, "targets": [], "auto_calibrate": False, "calibration": None}
+    return {
+        "ready": True,
+        "grid": OUTPUT_IMAGE_PATH,
+        "offset_x": rf.grid_offset_x,
+        "offset_y": rf.grid_offset_y,
+        "current_map": rf.current_map if rf.current_map else "None",
+        "ocr_text": rf.latest_ocr_text,
+        "cell_size": rf.latest_cell_size_m,
+        "targets": rf.latest_targets,
+        "auto_calibrate": rf.auto_calibrate,
+        "calibration": rf.calibrated_fit
+    }
+
+latest_document = VersionedDocument("latest", _latest_fingerprint, build_latest)
+
+@rangefinder_bp.route("/latest")
+def latest():
+    return versioned_response(latest_document)
+
+@rangefinder_bp.route("/adjust_offset")
+def adjust_offset():
+    rf = _engine()
+    if rf is None:
+        return jsonify({"message": NOT_READY_MESSAGE})
+    # Manual tuning takes precedence over the automatic fit.
+    rf.auto_calibrate = False
+    try:
+        axis = request.args.get("axis", "").lower()
+        delta = int(request.args.get("delta", 0))
+        if axis == "x":
+            rf.grid_offset_x += delta
+        elif axis == "y":
+            rf.grid_offset_y += delta
+        message = f"Grid offset set to ({rf.grid_offset_x}, {rf.grid_offset_y})."
+        if rf.current_map in config_store:
+            config_store.update(rf.current_map, offset=[round(rf.grid_offset_x, 2), round(rf.grid_offset_y, 2)])
+            message += f" Saved for {rf.current_map}."
+    except Exception as e:
+        message = f"Error updating offsets: {e}"
+    return jsonify({"message": message})
+
+@rangefinder_bp.route("/set_map")
+def set_map():
+    rf = _engine()
+    if rf is None:
+        return jsonify({"message": NOT_READY_MESSAGE})
+    map_name = request.args.get("map", "").strip()
+    if not map_name:
+        return jsonify({"message": "No map name given."})
+    # Optional overrides are persisted to map_configs.json (and can define a new map).
+    updates = {}
+    try:
+        if "offset_x" in request.args or "offset_y" in request.args:
+            _, existing = config_store.get(map_name)
+            offset = list((existing or {}).get("offset", (0, 0)))
+            offset[0] = round(float(request.args.get("offset_x", offset[0])), 2)
+            offset[1] = round(float(request.args.get("offset_y", offset[1])), 2)
+            updates["offset"] = offset
+        if "cell_block" in request.args:
+            updates["cell_block"] = float(request.args["cell_block"])
+        if "cell_size_m" in request.args:
+            updates["cell_size_m"] = float(request.args["cell_size_m"])
+    except ValueError as e:
+        return jsonify({"message": f"Invalid map settings: {e}"})
+    if updates:
+        resolved, _ = config_store.get(map_name)
+        if resolved is None and not ("cell_block" in updates and "cell_size_m" in updates):
+            # A new map needs its grid; anything less is most likely a mistyped name.
+            return jsonify({"message": f"Map '{map_name}' not found. A new map needs both cell_block and cell_size_m."})
+        config_store.update(resolved or map_name, **updates)
+    resolved, config = config_store.get(map_name)
+    if config is not None and "cell_block" in config and "cell_size_m" in config:
+        map_name = resolved
+        rf.current_map = map_name
+        rf.active_config = config
+        rf.grid_offset_x, rf.grid_offset_y = config.get("offset", (0, 0))
+        rf.valid_map_detected = True
+        rf.latest_cell_size_m = config["cell_size_m"]
+        message = (f"Map changed to {map_name}. New settings: grid_region: {layout.region('grid')}, "
+                   f"cell_block: {config['cell_block']}, "
+                   f"offset: {config.get('offset', [0, 0])}, cell_size_m: {rf.latest_cell_size_m}.")
+    else:
+        message = f"Map '{map_name}' not found."
+    return jsonify({"message": message})
+
+@rangefinder_bp.route("/calibrate")
+def calibrate():
+    rf = _engine()
+    if rf is None:
+        return jsonify({"message": NOT_READY_MESSAGE})
+    enabled = request.args.get("enabled")
+    if enabled is not None:
+        rf.auto_calibrate = enabled.lower() in ("1", "true", "yes", "on")
+    if request.args.get("force", "").lower() in ("1", "true", "yes", "on"):
+        rf.grid_calibrator.forget(rf.current_map or "Unknown")
+    state_text = "enabled" if rf.auto_calibrate else "disabled"
+    return jsonify({"message": f"Automatic grid calibration {state_text}.",
+                    "auto_calibrate": rf.auto_calibrate,
+                    "calibration": rf.grid_calibrator.get(rf.current_map or "Unknown")})
+
+@rangefinder_bp.route("/bypass")
+def bypass():
+    rf = _engine()
+    if rf is None:
+        return jsonify({"message": NOT_READY_MESSAGE})
+    rf.current_map = "Frozen Pass"
+    rf.valid_map_detected = True
+    rf.active_config = config_store.configs["Frozen Pass"]
+    rf.grid_offset_x, rf.grid_offset_y = rf.active_config.get("offset", (0, 0))
+    if "cell_size_m" in rf.active_config:
+        rf.latest_cell_size_m = rf.active_config["cell_size_m"]
+    return jsonify({"message": "Bypassed OCR. Defaulted to Frozen Pass."})
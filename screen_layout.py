@@ -0,0 +1,340 @@
+# screen_layout.py
+"""
+Resolution-independent screen regions.
+
+Regions are defined once against the 1920x1080 reference layout, relative to the screen anchor
+the HUD element is attached to. They are resolved to pixel rects for the actual resolution and
+UI scale and cached. grab() downscales captures back to reference size, so the masks,
+OCR pipelines and grid configs tuned for 1080p work the same on 1440p and 4K.
+
+The "screen" is the game's client area: the aces.exe window on whichever monitor it is on, in
+fullscreen or windowed mode (the primary monitor if no window is found). Its bounds are cached
+and re-read at most every WINDOW_POLL_S; region rects are translated to its desktop origin.
+valid() tells capture loops whether the mapping can be trusted before they spend time on OCR;
+valid(region) also checks that region's HUD_PROBES, pixels the HUD always draws around it.
+"""
+import threading
+import time
+
+from PIL import Image
+
+from utils import log
+
+REFERENCE_RESOLUTION = (1920, 1080)
+# In-game HUD scale relative to the default (1.0)
+UI_SCALE = 1.0
+
+# Seconds between checks of the game window position and size (one GetClientRect call)
+WINDOW_POLL_S = 1.0
+# Seconds between capture sanity checks
+VALIDATE_INTERVAL = 2.0
+GAME_PROCESS = "aces.exe"
+
+# region -> pixels the HUD always draws while that region is on screen, as (anchor, (x, y), rgb,
+# tolerance) in reference pixels. valid(region) only trusts the mapping while at least one matches.
+HUD_PROBES = {
+    # The dark frame around the minimap, just outside the left and top edges of the grid region
+    "grid": [
+        ("bottom-right", (-449, -229), (24, 24, 24), 48),
+        ("bottom-right", (-231, -447), (24, 24, 24), 48),
+    ],
+}
+# Reference points sampled to catch a blank capture (covered window, or a monitor we cannot grab)
+BLANK_PROBES = [
+    ("center", (0, 0)),
+    ("top-left", (40, 40)),
+    ("top-right", (-40, 40)),
+    ("bottom-left", (40, -40)),
+    ("bottom-right", (-40, -40)),
+]
+# A probe whose channels all stay at or below this counts as black
+BLANK_LEVEL = 8
+
+# Anchor -> (fraction of screen width, fraction of screen height) the offsets are measured from
+ANCHORS = {
+    "top-left": (0.0, 0.0),
+    "top": (0.5, 0.0),
+    "top-right": (1.0, 0.0),
+    "center": (0.5, 0.5),
+    "bottom-left": (0.0, 1.0),
+    "bottom-right": (1.0, 1.0),
+}
+
+# name -> (anchor, (x, y, width, height)) in reference pixels; x/y are offsets from the anchor point
+REGIONS = {
+    "feed": ("top-right", (-450, 0, 450, 50)),
+    "battle": ("top", (-100, 0, 200, 65)),
+    "gear": ("bottom-left", (0, -100, 250, 100)),
+    "modules": ("top-right", (-200, 70, 200, 300)),
+    "stats": ("top-left", (40, 77, 300, 35)),
+    "main_menu": ("bottom-left", (300, -202, 1020, 20)),
+    "grid": ("bottom-right", (-447, -445, 432, 432)),
+    "map_name": ("center", (-60, -160, 500, 30)),
+}
+
+def resolve_region(name, screen_size, ui_scale=1.0):
+    """Pixel rect (left, top, width, height) of a region for the given screen size and UI scale."""
+    anchor, (x, y, width, height) = REGIONS[name]
+    screen_w, screen_h = screen_size
+    # The HUD scales with screen height; anchors absorb different aspect ratios.
+    scale = screen_h / REFERENCE_RESOLUTION[1] * ui_scale
+    ax, ay = ANCHORS[anchor]
+    left = round(ax * screen_w + x * scale)
+    top = round(ay * screen_h + y * scale)
+    width, height = round(width * scale), round(height * scale)
+    left = min(max(left, 0), max(screen_w - width, 0))
+    top = min(max(top, 0), max(screen_h - height, 0))
+    return left, top, width, height
+
+def anchor_point(anchor, offset, screen_size, ui_scale=1.0):
+    """Pixel (x, y) of a reference point relative to the screen's top-left corner, clamped on screen."""
+    screen_w, screen_h = screen_size
+    scale = screen_h / REFERENCE_RESOLUTION[1] * ui_scale
+    ax, ay = ANCHORS[anchor]
+    x = round(ax * screen_w + offset[0] * scale)
+    y = round(ay * screen_h + offset[1] * scale)
+    return min(max(x, 0), screen_w - 1), min(max(y, 0), screen_h - 1)
+
+def monitor_rects():
+    """(left, top, width, height) of every monitor in desktop coordinates."""
+    from screeninfo import get_monitors
+    return [(m.x, m.y, m.width, m.height) for m in get_monitors()]
+
+def primary_screen_bounds():
+    from screeninfo import get_monitors
+    monitors = get_monitors()
+    for monitor in monitors:
+        if getattr(monitor, "is_primary", False):
+            return monitor.x, monitor.y, monitor.width, monitor.height
+    if monitors:
+        return monitors[0].x, monitors[0].y, monitors[0].width, monitors[0].height
+    import pyautogui
+    return (0, 0) + tuple(pyautogui.size())
+
+def find_game_window(process_name=GAME_PROCESS):
+    """Handle of the largest visible top-level window owned by the game process, or None."""
+    import psutil
+    import win32gui
+    import win32process
+    pids = {p.pid for p in psutil.process_iter(["name"]) if (p.info["name"] or "").lower() == process_name}
+    if not pids:
+        return None
+    found = []
+
+    def collect(hwnd, _):
+        if win32gui.IsWindowVisible(hwnd):
+            _, pid = win32process.GetWindowThreadProcessId(hwnd)
+            if pid in pids:
+                left, top, right, bottom = win32gui.GetWindowRect(hwnd)
+                found.append(((right - left) * (bottom - top), hwnd))
+        return True
+
+    win32gui.EnumWindows(collect, None)
+    return max(found)[1] if found else None
+
+def window_client_rect(hwnd):
+    """
+    (left, top, width, height) of a window's client area in desktop coordinates.
+    Returns "minimized" for an iconic window and None if the window no longer exists.
+    """
+    import win32gui
+    try:
+        if not win32gui.IsWindow(hwnd):
+            return None
+        if win32gui.IsIconic(hwnd):
+            return "minimized"
+        _, _, width, height = win32gui.GetClientRect(hwnd)
+        left, top = win32gui.ClientToScreen(hwnd, (0, 0))
+    except Exception:
+        return None
+    if width <= 0 or height <= 0:
+        return "minimized"
+    return left, top, width, height
+
+def _overlap(a, b):
+    return a[0] < b[0] + b[2] and b[0] < a[0] + a[2] and a[1] < b[1] + b[3] and b[1] < a[1] + a[3]
+
+class ScreenLayout:
+    """Caches the game's desktop bounds and resolved region rects per (resolution, UI scale)."""
+
+    def __init__(self, ui_scale=UI_SCALE):
+        self.ui_scale = ui_scale
+        self.screen_size = None
+        self.origin = (0, 0)
+        # "window" (game client area), "monitor" (no game window found), "minimized" or "manual"
+        self.source = None
+        self.hwnd = None
+        self._cache = {}
+        self._lock = threading.Lock()
+        self._next_poll = 0.0
+        self._valid = None
+        self._invalid_reason = None
+        self._next_validate = 0.0
+        # region -> (valid, reason, next check) of its HUD probes
+        self._probes = {}
+        self._local = threading.local()
+
+    @property
+    def scale(self):
+        size = self.screen_size or REFERENCE_RESOLUTION
+        return size[1] / REFERENCE_RESOLUTION[1] * self.ui_scale
+
+    def game_bounds(self):
+        """((left, top, width, height), source) of the area the game renders into."""
+        rect = window_client_rect(self.hwnd) if self.hwnd else None
+        if rect is None:
+            self.hwnd = find_game_window()
+            rect = window_client_rect(self.hwnd) if self.hwnd else None
+        if rect == "minimized":
+            # Keep the last mapping; valid() reports it as unusable until the window is restored.
+            if self.screen_size is None:
+                return primary_screen_bounds(), "minimized"
+            return self.origin + self.screen_size, "minimized"
+        if rect is not None:
+            return rect, "window"
+        return primary_screen_bounds(), "monitor"
+
+    def refresh(self, screen_size=None, ui_scale=None, origin=None):
+        """
+        Re-read the game bounds (or use the given size and origin, which disables polling);
+        return True if the mapping changed.
+        """
+        if screen_size is not None:
+            bounds, source = tuple(origin or (0, 0)) + tuple(screen_size), "manual"
+        else:
+            bounds, source = self.game_bounds()
+        ui_scale = self.ui_scale if ui_scale is None else ui_scale
+        with self._lock:
+            self._next_poll = time.time() + WINDOW_POLL_S
+            changed_source = source != self.source
+            self.source = source
+            if self.screen_size is not None and bounds == self.origin + self.screen_size and ui_scale == self.ui_scale:
+                if changed_source:
+                    self._next_validate = 0.0
+                return False
+            self.origin, self.screen_size, self.ui_scale = tuple(bounds[:2]), tuple(bounds[2:]), ui_scale
+            self._next_validate = 0.0
+            self._probes = {}
+        log(f"Game area {bounds[2]}x{bounds[3]} at ({bounds[0]}, {bounds[1]}) [{source}], UI scale {ui_scale:g}: "
+            f"HUD regions scaled by {self.scale:.3f}", level="INFO", tag="PROCESS")
+        return True
+
+    def _poll(self):
+        if self.screen_size is None or (self.source != "manual" and time.time() >= self._next_poll):
+            self.refresh()
+
+    def region(self, name):
+        """Desktop pixel rect of a region in the game's current bounds."""
+        self._poll()
+        key = (name, self.screen_size, self.ui_scale)
+        rect = self._cache.get(key)
+        if rect is None:
+            rect = self._cache[key] = resolve_region(name, self.screen_size, self.ui_scale)
+        return rect[0] + self.origin[0], rect[1] + self.origin[1], rect[2], rect[3]
+
+    def reference_size(self, name):
+        """(width, height) of a region in reference pixels."""
+        return tuple(REGIONS[name][1][2:])
+
+    def capture(self, rect):
+        """Screenshot a desktop rect (any monitor) as an RGB image."""
+        sct = getattr(self._local, "sct", None)
+        if sct is None:
+            # mss handles are per thread.
+            import mss
+            sct = self._local.sct = mss.mss()
+        shot = sct.grab({"left": rect[0], "top": rect[1], "width": rect[2], "height": rect[3]})
+        return Image.frombytes("RGB", shot.size, shot.bgra, "raw", "BGRX")
+
+    def grab(self, name):
+        """Screenshot a region, downscaled (or upscaled) to its reference size."""
+        image = self.capture(self.region(name))
+        size = self.reference_size(name)
+        if image.size != size:
+            image = image.resize(size, Image.BOX if image.width > size[0] else Image.BICUBIC)
+        return image
+
+    def _pixel(self, anchor, offset):
+        x, y = anchor_point(anchor, offset, self.screen_size, self.ui_scale)
+        return self.capture((self.origin[0] + x, self.origin[1] + y, 1, 1)).getpixel((0, 0))
+
+    def _check(self):
+        """None if captures of the current mapping show the game, else the reason they do not."""
+        if self.source == "minimized":
+            return "game window is minimized"
+        try:
+            monitors = monitor_rects()
+        except Exception:
+            monitors = []
+        bounds = self.origin + self.screen_size
+        if monitors and not any(_overlap(bounds, monitor) for monitor in monitors):
+            return "game area is outside every monitor"
+        if all(max(self._pixel(anchor, offset)) <= BLANK_LEVEL for anchor, offset in BLANK_PROBES):
+            return "capture is blank"
+        return None
+
+    def _check_probes(self, region):
+        """None if one of the region's HUD probes matches, else the reason (with the colours seen)."""
+        seen = []
+        for anchor, offset, rgb, tolerance in HUD_PROBES[region]:
+            pixel = self._pixel(anchor, offset)
+            if sum((a - b) ** 2 for a, b in zip(pixel, rgb)) < tolerance ** 2:
+                return None
+            seen.append("#%02x%02x%02x" % tuple(pixel[:3]))
+        return f"no {region} HUD probe matched (saw {', '.join(seen)})"
+
+    def _probes_valid(self, region, now):
+        previous = self._probes.get(region)
+        if previous is not None and now < previous[2]:
+            return previous[0]
+        try:
+            reason = self._check_probes(region)
+        except Exception as e:
+            reason = f"capture failed: {e}"
+        if previous is None or reason != previous[1]:
+            if reason:
+                log(f"Capture of {region} invalid ({reason}); suspending its OCR.", level="WARN", tag="PROCESS")
+            elif previous is not None and not previous[0]:
+                log(f"Capture of {region} valid again; resuming its OCR.", level="INFO", tag="PROCESS")
+        self._probes[region] = (reason is None, reason, now + VALIDATE_INTERVAL)
+        return reason is None
+
+    def valid(self, region=None):
+        """
+        True while captures can be trusted to show the game; loops check this before running OCR.
+        With a region that has HUD_PROBES, its probes must match too.
+        Re-checked at most every VALIDATE_INTERVAL (sooner after the mapping changes).
+        """
+        self._poll()
+        now = time.time()
+        if self._valid is None or now >= self._next_validate:
+            try:
+                reason = self._check()
+            except Exception as e:
+                reason = f"capture failed: {e}"
+            self._next_validate = now + VALIDATE_INTERVAL
+            if reason != self._invalid_reason:
+                if reason:
+                    log(f"Capture mapping invalid ({reason}); suspending OCR.", level="WARN", tag="PROCESS")
+                elif self._valid is False:
+                    log("Capture mapping valid again; resuming OCR.", level="INFO", tag="PROCESS")
+            self._valid, self._invalid_reason = reason is None, reason
+        if not self._valid:
+            return False
+        if region in HUD_PROBES:
+            return self._probes_valid(region, now)
+        return True
+
+    def describe(self):
+        """Current mapping for /status."""
+        return {
+            "origin": list(self.origin),
+            "size": list(self.screen_size) if self.screen_size else None,
+            "ui_scale": self.ui_scale,
+            "source": self.source,
+            "valid": self._valid,
+            "reason": self._invalid_reason,
+            "probes": {region: {"valid": ok, "reason": reason} for region, (ok, reason, _) in self._probes.items()},
+        }
+
+layout = ScreenLayout()
@@ -1,11 +1,37 @@
-from flask import Flask, render_template_string, jsonify
+from flask import Flask, Response, render_template_string, request, jsonify
+import gzip
+import itertools
 import time
 import state
 import logging
 
+from utils import log
+from rangefinder_web import rangefinder_bp
+from event_feed import events_bp, MAX_STREAMS
+import services
+from screen_layout import layout
+from ocr_cache import cache as ocr_cache
+from memory_budget import watchdog
+from profiler import profiler
+from versioned import MAX_LONG_POLLS, VersionedDocument, versioned_response
+from match_stats import aggregator
+
 logging.getLogger('werkzeug').setLevel(logging.ERROR)
 
+SERVER_PORT = 5000
+# Threads for ordinary requests, plus one for every /events stream and long-poll that may be open
+SERVER_THREADS = 8 + MAX_STREAMS + MAX_LONG_POLLS
+
+# Responses smaller than this are not worth compressing.
+GZIP_MIN_SIZE = 500
+GZIP_MIMETYPES = {"text/html", "text/plain", "text/css", "application/json", "application/javascript"}
+# Bundled images never change at runtime; screenshots are overwritten constantly.
+STATIC_MAX_AGE = 3600
+
 app = Flask(__name__, static_url_path='/static', static_folder='static')
+# Detection and rangefinder dashboards share one app and one port.
+app.register_blueprint(rangefinder_bp)
+app.register_blueprint(events_bp)
 
 INDEX_HTML = """
 <!DOCTYPE html>
@@ -112,7 +138,7 @@ INDEX_HTML = """
         <div class="card">
             <div class="card-header"><strong>Additional Info</strong></div>
             <div class="card-body">
-                <p>Minimap Tracker TODO</p>
+                <p><a href="/rangefinder">Rangefinder Dashboard</a></p>
             </div>
         </div>
         <p class="mt-3 text-muted">This page updates automatically.</p>
@@ -204,29 +230,74 @@ INDEX_HTML = """
 </html>
 """
 
+@app.after_request
+def compress_and_cache(response):
+    """Add caching headers for static files and gzip compressible responses."""
+    if request.path.startswith("/static/"):
+        if request.path.startswith("/static/screenshots/"):
+            response.cache_control.no_cache = True
+        else:
+            response.cache_control.no_cache = None
+            response.cache_control.public = True
+            response.cache_control.max_age = STATIC_MAX_AGE
+
+    if (response.direct_passthrough
+            or response.is_streamed
+            or not 200 <= response.status_code < 300
+            or "Content-Encoding" in response.headers
+            or response.mimetype not in GZIP_MIMETYPES
+            or "gzip" not in request.headers.get("Accept-Encoding", "").lower()):
+        return response
+    data = response.get_data()
+    if len(data) < GZIP_MIN_SIZE:
+        return response
+    response.set_data(gzip.compress(data, compresslevel=5))
+    response.headers["Content-Encoding"] = "gzip"
+    response.vary.add("Accept-Encoding")
+    return response
+
 @app.route("/")
 def index():
     return render_template_string(INDEX_HTML)
 
-@app.route("/status")
-def status_endpoint():
+STATUS_TIMEOUT = 5
+
+def _status_fingerprint():
+    """Everything /status depends on; the document is rebuilt only when this changes."""
+    current_time = time.time()
+    return (
+        state.game_state,
+        state.last_event_result,
+        state.last_modules_result,
+        state.last_raw_event_snapshot,
+        state.last_processed_event_snapshot,
+        current_time - state.last_event_timestamp > STATUS_TIMEOUT,
+        current_time - state.last_modules_timestamp > STATUS_TIMEOUT,
+        tuple(state.stats.items()),
+        state.log_count,
+        tuple((name, s["ready"], s["detail"]) for name, s in sorted(services.readiness().items())),
+        tuple(layout.describe().items()),
+    )
+
+def build_status():
     current_time = time.time()
-    TIMEOUT = 5
 
     event_result = state.last_event_result
     module_result = state.last_modules_result
-    if current_time - state.last_event_timestamp > TIMEOUT:
+    if current_time - state.last_event_timestamp > STATUS_TIMEOUT:
         event_result = ""
-    if current_time - state.last_modules_timestamp > TIMEOUT:
+    if current_time - state.last_modules_timestamp > STATUS_TIMEOUT:
         module_result = ""
 
     modules_hit = []
     if module_result:
         modules_hit = [m.strip() for m in module_result.split(";") if m.strip()]
 
-    raw_snapshot = state.last_raw_event_snapshot if current_time - state.last_event_timestamp <= TIMEOUT else ""
-    processed_snapshot = state.last_processed_event_snapshot if current_time - state.last_event_timestamp <= TIMEOUT else ""
+    raw_snapshot = state.last_raw_event_snapshot if current_time - state.last_event_timestamp <= STATUS_TIMEOUT else ""
+    processed_snapshot = state.last_processed_event_snapshot if current_time - state.last_event_timestamp <= STATUS_TIMEOUT else ""
 
+    # "changed" is relative to the previous build; prev_stats is not part of the fingerprint,
+    # so refreshing it here does not trigger another rebuild.
     stats_rows = []
     for metric, value in state.stats.items():
         changed = (state.prev_stats.get(metric) != value)
@@ -238,18 +309,83 @@ def status_endpoint():
     state.prev_stats.clear()
     state.prev_stats.update(state.stats)
 
-    recent_logs = "\n".join(state.log_store[-50:])
+    # The last 50 lines, taken from the end of the deque without copying all of it
+    recent_logs = "\n".join(reversed(list(itertools.islice(reversed(state.log_store), 50))))
 
-    data = {
+    return {
         "game_state": state.game_state,
         "last_event_result": event_result,
         "modules_hit": modules_hit,
         "stats_rows": stats_rows,
         "logs": recent_logs,
         "raw_event_snapshot": raw_snapshot,
-        "processed_event_snapshot": processed_snapshot
+        "processed_event_snapshot": processed_snapshot,
+        "services": services.readiness(),
+        "capture": layout.describe()
     }
-    return jsonify(data)
 
-def start_server():
-    app.run(host="0.0.0.0", port=5000, debug=False)
\ No newline at end of file
+status_document = VersionedDocument("status", _status_fingerprint, build_status)
+
+@app.route("/status")
+def status_endpoint():
+    return versioned_response(status_document)
+
+stats_document = VersionedDocument("stats", lambda: aggregator.version, aggregator.snapshot)
+
+@app.route("/stats")
+def stats_endpoint():
+    """Per-match, per-map, session and rolling (last N matches) rollups."""
+    return versioned_response(stats_document)
+
+@app.route("/health")
+def health_endpoint():
+    """
+    Worker lifecycle, heartbeats and loop rates, startup readiness and OCR cache hit rate;
+    503 if a worker is down or stalled.
+    """
+    workers = services.supervisor.health()
+    healthy = all(w["state"] in ("running", "stopped") for w in workers.values())
+    body = {"ok": healthy, "workers": workers, "services": services.readiness(), "ocr_cache": ocr_cache.stats()}
+    return jsonify(body), 200 if healthy else 503
+
+@app.route("/debug/memory")
+def debug_memory_endpoint():
+    """
+    RSS trend and, with tracemalloc on, top allocation sites and growth between snapshots.
+    ?trace=start|stop toggles tracemalloc; ?snapshot=1 takes a snapshot now.
+    """
+    trace = request.args.get("trace")
+    if trace in ("start", "stop"):
+        watchdog.set_tracing(trace == "start")
+    elif request.args.get("snapshot"):
+        watchdog.snapshot()
+    return jsonify(watchdog.report())
+
+@app.route("/debug/profile")
+def debug_profile_endpoint():
+    """
+    Sampling profiler: samples and CPU time per thread plus the hottest functions.
+    ?trace=start|stop toggles it (start takes interval_ms and duration in seconds);
+    ?format=collapsed returns flamegraph input; ?thread=<name> and ?idle=0 filter the samples.
+    """
+    trace = request.args.get("trace")
+    if trace == "start":
+        profiler.start(interval=request.args.get("interval_ms", type=float, default=0) / 1000,
+                       duration=request.args.get("duration", type=float))
+    elif trace == "stop":
+        profiler.stop()
+    thread = request.args.get("thread") or None
+    idle = request.args.get("idle", "1").lower() not in ("0", "false", "no")
+    if request.args.get("format") == "collapsed":
+        return Response(profiler.collapsed(thread, idle), mimetype="text/plain")
+    return jsonify(profiler.report(thread, idle))
+
+def start_server(host="0.0.0.0", port=SERVER_PORT):
+    """Serve every dashboard and API on one port, using a fixed thread pool when waitress is installed."""
+    try:
+        from waitress import serve
+    except ImportError:
+        log("waitress not installed; falling back to the Flask development server.", level="WARN", tag="PROCESS")
+        app.run(host=host, port=port, debug=False, threaded=True)
+        return
+    serve(app, host=host, port=port, threads=SERVER_THREADS, ident=None)
\ No newline at end of file
@@ -0,0 +1,215 @@
+# services.py
+"""
+Startup readiness and worker supervision.
+
+Subsystems come up in the background in whatever order their dependencies allow; code that
+depends on one (e.g. a web route) checks is_ready() instead of importing heavy modules itself.
+Every long-running loop runs under `supervisor`, which restarts it if it dies and exposes
+heartbeats and iteration rates for /health.
+"""
+import threading
+import time
+import traceback
+from collections import deque
+
+from utils import log
+
+_lock = threading.Lock()
+_events = {}
+_status = {}
+_started = time.time()
+
+def _event(name):
+    with _lock:
+        if name not in _events:
+            _events[name] = threading.Event()
+            _status[name] = {"ready": False, "detail": "starting", "since": None}
+        return _events[name]
+
+def mark_ready(name, detail="ready"):
+    event = _event(name)
+    _status[name] = {"ready": True, "detail": detail, "since": round(time.time() - _started, 3)}
+    event.set()
+    log(f"{name} ready after {_status[name]['since']:.2f}s ({detail})", level="DEBUG", tag="PROCESS")
+
+def mark_failed(name, detail):
+    _event(name)
+    _status[name] = {"ready": False, "detail": detail, "since": round(time.time() - _started, 3)}
+
+def is_ready(name):
+    return _event(name).is_set()
+
+def wait_ready(name, timeout=None):
+    return _event(name).wait(timeout)
+
+def readiness():
+    """{name: {"ready", "detail", "since"}} for the status page; "since" is seconds after process start."""
+    with _lock:
+        return {name: dict(status) for name, status in _status.items()}
+
+# -----------------------------------------------------------
+# Worker supervision
+# -----------------------------------------------------------
+# Seconds to wait for a worker to exit when stopping it
+JOIN_TIMEOUT = 5.0
+# Restart delay doubles per consecutive failure, from BACKOFF_BASE up to BACKOFF_MAX
+BACKOFF_BASE = 1.0
+BACKOFF_MAX = 60.0
+# A run at least this long resets the failure count
+BACKOFF_RESET = 60.0
+# A running worker without a heartbeat for this long is reported as stalled
+STALL_AFTER = 30.0
+# Iteration timestamps kept per worker for the rate estimate
+RATE_WINDOW = 50
+
+_local = threading.local()
+
+class Worker:
+    def __init__(self, name, target, args=(), restart=True):
+        self.name = name
+        self.target = target
+        self.args = args
+        self.restart = restart
+        self.thread = None
+        self.stop_event = threading.Event()
+        self.state = "stopped"
+        self.starts = 0
+        self.failures = 0
+        self.consecutive_failures = 0
+        self.last_error = None
+        self.last_heartbeat = None
+        self.iterations = 0
+        self.ticks = deque(maxlen=RATE_WINDOW)
+
+    def alive(self):
+        return self.thread is not None and self.thread.is_alive()
+
+    def rate(self):
+        """Iterations per second over the recent tick window."""
+        ticks = list(self.ticks)
+        if len(ticks) < 2 or ticks[-1] == ticks[0]:
+            return 0.0
+        return (len(ticks) - 1) / (ticks[-1] - ticks[0])
+
+class Supervisor:
+    """
+    Owns every long-running worker thread.
+
+    start() never launches a second thread for a worker that is still alive; stop() signals and
+    joins. A worker that raises (or returns without being asked to stop) is restarted after an
+    exponential backoff. Workers report progress with tick()/sleep(), which health() exposes.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.workers = {}
+
+    def register(self, name, target, args=(), restart=True):
+        with self._lock:
+            if name not in self.workers:
+                self.workers[name] = Worker(name, target, args, restart)
+            return self.workers[name]
+
+    def _run(self, worker):
+        _local.worker = worker
+        while not worker.stop_event.is_set():
+            started = time.time()
+            worker.state = "running"
+            worker.starts += 1
+            try:
+                worker.target(*worker.args)
+                if worker.stop_event.is_set():
+                    break
+                worker.last_error = "exited unexpectedly"
+            except Exception as e:
+                worker.last_error = f"{type(e).__name__}: {e}"
+                log(f"Worker {worker.name} crashed:\n{traceback.format_exc()}", level="ERROR", tag="PROCESS")
+            worker.failures += 1
+            if not worker.restart:
+                worker.state = "failed"
+                return
+            if time.time() - started >= BACKOFF_RESET:
+                worker.consecutive_failures = 0
+            worker.consecutive_failures += 1
+            delay = min(BACKOFF_MAX, BACKOFF_BASE * 2 ** (worker.consecutive_failures - 1))
+            worker.state = "backoff"
+            log(f"Restarting {worker.name} in {delay:g}s ({worker.last_error}).", level="WARN", tag="PROCESS")
+            worker.stop_event.wait(delay)
+        worker.state = "stopped"
+
+    def start(self, name):
+        """Start a registered worker; a no-op if its thread is still alive."""
+        worker = self.workers[name]
+        with self._lock:
+            if worker.alive():
+                if worker.stop_event.is_set():
+                    log(f"{name} is still shutting down; not starting a second copy.", level="WARN", tag="PROCESS")
+                return False
+            worker.stop_event = threading.Event()
+            worker.consecutive_failures = 0
+            worker.thread = threading.Thread(target=self._run, args=(worker,), name=name, daemon=True)
+            worker.thread.start()
+        return True
+
+    def stop(self, name, timeout=JOIN_TIMEOUT):
+        """Signal a worker to stop and wait for its thread; returns False if it did not exit in time."""
+        worker = self.workers[name]
+        worker.stop_event.set()
+        if worker.thread is None or worker.thread is threading.current_thread():
+            return True
+        worker.thread.join(timeout)
+        if worker.thread.is_alive():
+            worker.state = "stopping"
+            log(f"{name} did not stop within {timeout:.0f}s.", level="WARN", tag="PROCESS")
+            return False
+        return True
+
+    def stop_all(self, names=None, timeout=JOIN_TIMEOUT):
+        """Stop the named workers (default: all) in parallel, then join each."""
+        names = list(self.workers) if names is None else list(names)
+        for name in names:
+            self.workers[name].stop_event.set()
+        for name in names:
+            self.stop(name, timeout)
+
+    def health(self):
+        now = time.time()
+        report = {}
+        for name, worker in list(self.workers.items()):
+            age = None if worker.last_heartbeat is None else round(now - worker.last_heartbeat, 1)
+            state = worker.state
+            if state == "running" and age is not None and age > STALL_AFTER:
+                state = "stalled"
+            report[name] = {
+                "state": state,
+                "alive": worker.alive(),
+                "starts": worker.starts,
+                "failures": worker.failures,
+                "last_error": worker.last_error,
+                "heartbeat_age_s": age,
+                "iterations": worker.iterations,
+                "rate_hz": round(worker.rate(), 2),
+            }
+        return report
+
+supervisor = Supervisor()
+
+def tick():
+    """Record one loop iteration of the calling worker; False once it has been asked to stop."""
+    worker = getattr(_local, "worker", None)
+    if worker is None:
+        return True
+    now = time.time()
+    worker.last_heartbeat = now
+    worker.iterations += 1
+    worker.ticks.append(now)
+    return not worker.stop_event.is_set()
+
+def sleep(seconds):
+    """Sleep in a worker loop, waking early when the worker is stopped; returns False if it was."""
+    worker = getattr(_local, "worker", None)
+    if worker is None:
+        time.sleep(seconds)
+        return True
+    worker.last_heartbeat = time.time()
+    return not worker.stop_event.wait(seconds)
@@ -0,0 +1,219 @@
+# session_recorder.py
+"""
+Append-only session log of everything the pipeline detects.
+
+Events are queued by the detection threads and written by a background writer in batches.
+Each batch is stored as one column block: a 4-byte little-endian length followed by a
+zlib-compressed JSON object {"ts": [...], "type": [codes], "types": [names], "fields": {name: [...]}}.
+Missing values in a field column are null. Files live in SESSIONS_DIR, one per run.
+
+    python session_recorder.py summary [files...]
+"""
+import glob
+import json
+import os
+import queue
+import struct
+import sys
+import threading
+import time
+import zlib
+from collections import Counter, defaultdict
+
+from utils import log
+
+SESSIONS_DIR = "sessions"
+FILE_MAGIC = b"WTLOG1\n"
+FLUSH_INTERVAL = 2.0
+BATCH_SIZE = 500
+QUEUE_SIZE = 20000
+
+_queue = queue.Queue(maxsize=QUEUE_SIZE)
+_stop_event = threading.Event()
+_writer_thread = None
+_session_path = None
+_context = {"map": None}
+_subscribers = []
+# Source of event timestamps; the video pipeline swaps in the position in the recording
+_clock = time.time
+dropped_events = 0
+
+def set_clock(clock):
+    """Timestamp events with clock() instead of wall time (None restores time.time)."""
+    global _clock
+    _clock = clock or time.time
+
+def subscribe(callback):
+    """Call callback(timestamp, event_type, fields) synchronously for every recorded event. Keep it O(1)."""
+    _subscribers.append(callback)
+
+def record(event_type, **fields):
+    """Queue an event for the session log. Never blocks; drops the event if the queue is full."""
+    global dropped_events
+    if event_type == "map":
+        _context["map"] = fields.get("map")
+    fields.setdefault("map", _context["map"])
+    timestamp = _clock()
+    for callback in _subscribers:
+        try:
+            callback(timestamp, event_type, fields)
+        except Exception as e:
+            log(f"Session event subscriber failed: {e}", level="ERROR", tag="PROCESS")
+    try:
+        _queue.put_nowait((timestamp, event_type, fields))
+    except queue.Full:
+        dropped_events += 1
+
+def _encode_block(events):
+    types = []
+    type_codes = {}
+    fields = defaultdict(lambda: [None] * len(events))
+    ts = []
+    codes = []
+    for i, (timestamp, event_type, event_fields) in enumerate(events):
+        ts.append(round(timestamp, 3))
+        if event_type not in type_codes:
+            type_codes[event_type] = len(types)
+            types.append(event_type)
+        codes.append(type_codes[event_type])
+        for name, value in event_fields.items():
+            fields[name][i] = value
+    block = {"ts": ts, "type": codes, "types": types, "fields": dict(fields)}
+    payload = zlib.compress(json.dumps(block, separators=(",", ":"), default=str).encode("utf-8"), 6)
+    return struct.pack("<I", len(payload)) + payload
+
+def _write_batch(events):
+    with open(_session_path, "ab") as f:
+        if f.tell() == 0:
+            f.write(FILE_MAGIC)
+        f.write(_encode_block(events))
+
+def _writer_loop():
+    batch = []
+    last_flush = time.time()
+    while True:
+        try:
+            batch.append(_queue.get(timeout=0.5))
+        except queue.Empty:
+            pass
+        stopping = _stop_event.is_set()
+        if batch and (len(batch) >= BATCH_SIZE or time.time() - last_flush >= FLUSH_INTERVAL or stopping):
+            # Drain whatever is already queued into the same block.
+            while len(batch) < BATCH_SIZE:
+                try:
+                    batch.append(_queue.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                _write_batch(batch)
+            except OSError as e:
+                log(f"Failed to write session log: {e}", level="ERROR", tag="PROCESS")
+            batch = []
+            last_flush = time.time()
+        if stopping and not batch and _queue.empty():
+            return
+
+def start_recorder(path=None):
+    """Open a new session file (or path) and start the background writer."""
+    global _writer_thread, _session_path
+    if _writer_thread is not None and _writer_thread.is_alive():
+        return _session_path
+    _session_path = path or os.path.join(SESSIONS_DIR, f"session_{time.strftime('%Y%m%d_%H%M%S')}.wtlog")
+    if os.path.dirname(_session_path):
+        os.makedirs(os.path.dirname(_session_path), exist_ok=True)
+    _stop_event.clear()
+    _writer_thread = threading.Thread(target=_writer_loop, name="session-recorder", daemon=True)
+    _writer_thread.start()
+    log(f"Recording session to {_session_path}", level="INFO", tag="PROCESS")
+    return _session_path
+
+def stop_recorder(timeout=5.0):
+    """Flush queued events and stop the writer."""
+    _stop_event.set()
+    if _writer_thread is not None:
+        _writer_thread.join(timeout)
+
+# -----------------------------------------------------------
+# Reading and querying
+# -----------------------------------------------------------
+def read_blocks(path):
+    """Yield decoded column blocks from a session file."""
+    with open(path, "rb") as f:
+        if f.read(len(FILE_MAGIC)) != FILE_MAGIC:
+            raise ValueError(f"{path} is not a session log")
+        while True:
+            header = f.read(4)
+            if len(header) < 4:
+                return
+            (length,) = struct.unpack("<I", header)
+            payload = f.read(length)
+            if len(payload) < length:
+                # Truncated final block (e.g. the process was killed mid-write).
+                return
+            yield json.loads(zlib.decompress(payload))
+
+def read_events(path, types=None):
+    """Yield events from a session file as dicts with "ts", "type" and their fields."""
+    for block in read_blocks(path):
+        names = block["types"]
+        wanted = None if types is None else {i for i, name in enumerate(names) if name in types}
+        columns = block["fields"].items()
+        for i, (ts, code) in enumerate(zip(block["ts"], block["type"])):
+            if wanted is not None and code not in wanted:
+                continue
+            event = {"ts": ts, "type": names[code]}
+            for name, column in columns:
+                if column[i] is not None:
+                    event[name] = column[i]
+            yield event
+
+def session_files(directory=SESSIONS_DIR):
+    return sorted(glob.glob(os.path.join(directory, "*.wtlog")))
+
+def summarize(paths=None):
+    """
+    Per-match and per-map event counts over one or more session files.
+    A match runs from the state becoming "In Game" until it returns to "In Menu".
+    """
+    matches = []
+    per_map = defaultdict(Counter)
+    for path in paths or session_files():
+        current = None
+        for event in read_events(path):
+            if event["type"] == "state":
+                if event.get("state") == "In Game" and current is None:
+                    current = {"file": os.path.basename(path), "start": event["ts"], "end": event["ts"],
+                               "map": event.get("map"), "counts": Counter()}
+                    matches.append(current)
+                elif event.get("state") == "In Menu" and current is not None:
+                    current["end"] = event["ts"]
+                    current = None
+                continue
+            if current is None:
+                continue
+            current["end"] = event["ts"]
+            if event.get("map"):
+                current["map"] = event["map"]
+            if event["type"] == "map":
+                continue
+            for key in event.get("counters") or [event["type"]]:
+                current["counts"][key] += 1
+    for match in matches:
+        per_map[match["map"] or "Unknown"].update(match["counts"])
+    return matches, per_map
+
+def _print_summary(paths):
+    matches, per_map = summarize(paths)
+    for i, match in enumerate(matches, 1):
+        duration = match["end"] - match["start"]
+        counts = ", ".join(f"{k}={v}" for k, v in sorted(match["counts"].items()))
+        print(f"Match {i} [{match['file']}] {match['map'] or 'Unknown'} ({duration:.0f}s): {counts}")
+    print()
+    for map_name, counts in sorted(per_map.items()):
+        print(f"{map_name}: " + ", ".join(f"{k}={v}" for k, v in sorted(counts.items())))
+
+if __name__ == "__main__":
+    if len(sys.argv) >= 2 and sys.argv[1] == "summary":
+        _print_summary(sys.argv[2:] or None)
+    else:
+        print(__doc__)
@@ -1,5 +1,10 @@
 # state.py
-log_store = []
+from collections import deque
+
+LOG_STORE_SIZE = 1000
+log_store = deque(maxlen=LOG_STORE_SIZE)
+# Total number of log lines ever written (log_store itself is capped)
+log_count = 0
 game_state = "Unknown"
 last_event_result = ""
 last_modules_result = ""
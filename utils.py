@@ -1,15 +1,11 @@
 import time
 import subprocess
 import psutil
-import win32gui
-import win32process
-import screeninfo
-from screeninfo import get_monitors
-import sys
 from colorama import init, Fore, Style
 
 init(autoreset=True)
 
+import state
 from state import log_store
 
 LEVEL_COLORS = {
@@ -51,8 +47,7 @@ def log(message, level="INFO", tag=None):
 
     plain_message = f"{plain_header} {message}"
     log_store.append(plain_message)
-    if len(log_store) > 1000:
-        log_store.pop(0)
+    state.log_count += 1
 
 def fuzzy_contains(text, fragments):
     """Return True if any of the fragments is found in the text."""
@@ -79,6 +74,9 @@ def is_aces_running():
 
 def get_foreground_process():
     """Gets the process name of the currently focused window."""
+    # Imported here so the modules shared with the headless video pipeline also load off Windows.
+    import win32gui
+    import win32process
     hwnd = win32gui.GetForegroundWindow()
     if hwnd:
         _, pid = win32process.GetWindowThreadProcessId(hwnd)
@@ -92,18 +90,6 @@ def is_aces_in_focus():
     active_process = get_foreground_process()
     return active_process == "aces.exe"
 
-def check_resolution():
-    """Check if the player's resolution is Full HD (1920x1080)."""
-    monitors = get_monitors()
-    for monitor in monitors:
-        if monitor.width == 1920 and monitor.height == 1080:
-            log("Resolution is 1920x1080. Proceeding...", level="INFO", tag="PROCESS")
-            return True
-
-    resolutions = ", ".join(f"{m.width}x{m.height}" for m in monitors) if monitors else "unknown"
-    log(f"Your screen resolution: {resolutions} doesn't match the supported resolution (1920x1080). The program cannot continue.", level="ERROR", tag="PROCESS")
-    sys.exit(1)
-
 def wait_for_aces():
     """Wait for aces.exe to start and gain focus."""
     log("Waiting for aces.exe to start...", level="INFO", tag="PROCESS")
@@ -0,0 +1,136 @@
+# versioned.py
+import json
+import os
+import threading
+import time
+
+from flask import Response, request
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+MSGPACK_MIMETYPE = "application/msgpack"
+# Longest a client may hold a long-poll request open (seconds).
+MAX_WAIT = 30.0
+# How often the long-poll that checks for changes re-reads the fingerprint (seconds).
+WAIT_POLL_INTERVAL = 0.1
+# Concurrent long-polls across all documents; each holds one web server thread
+MAX_LONG_POLLS = 4
+
+# Distinguishes ETags across restarts, since versions start from zero again.
+_BOOT_ID = f"{os.getpid():x}{int(time.time()):x}"
+
+_long_polls = threading.BoundedSemaphore(MAX_LONG_POLLS)
+
+class VersionedDocument:
+    """
+    A JSON document that is rebuilt only when its fingerprint changes.
+    Each rebuild bumps `version`; encoded bodies are cached per version.
+
+    Long-polls wait on a condition that every rebuild notifies. Only one of them at a time
+    re-reads the fingerprint every WAIT_POLL_INTERVAL; the others sleep until a rebuild.
+    """
+
+    def __init__(self, name, fingerprint, build):
+        self.name = name
+        self._fingerprint = fingerprint
+        self._build = build
+        self._lock = threading.Lock()
+        self._fp = object()
+        self._doc = None
+        self._bodies = {}
+        self._changed = threading.Condition()
+        self._poller = None
+        self.version = 0
+
+    def current(self):
+        """Return (version, document), rebuilding the document if the fingerprint changed."""
+        fp = self._fingerprint()
+        with self._lock:
+            rebuilt = fp != self._fp
+            if rebuilt:
+                self._doc = self._build()
+                self._fp = fp
+                self._bodies = {}
+                self.version += 1
+            version, doc = self.version, self._doc
+        if rebuilt:
+            with self._changed:
+                self._changed.notify_all()
+        return version, doc
+
+    def body(self, fmt):
+        version, doc = self.current()
+        with self._lock:
+            if version == self.version and fmt in self._bodies:
+                return version, self._bodies[fmt]
+            payload = dict(doc, version=version)
+            if fmt == "msgpack":
+                data = msgpack.packb(payload, use_bin_type=True)
+            else:
+                data = json.dumps(payload, separators=(",", ":")).encode("utf-8")
+            if version == self.version:
+                self._bodies[fmt] = data
+            return version, data
+
+    def etag(self, version, fmt):
+        return f'W/"{self.name}-{_BOOT_ID}-{version}-{fmt}"'
+
+    def wait_for(self, since, timeout):
+        """Block until the version exceeds `since` or `timeout` expires; return the latest version."""
+        deadline = time.time() + min(timeout, MAX_WAIT)
+        ident = threading.get_ident()
+        version, _ = self.current()
+        try:
+            while version <= since:
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    break
+                with self._changed:
+                    if self._poller is None:
+                        self._poller = ident
+                    polling = self._poller == ident
+                    # Checked under the condition so a rebuild between the check and the wait is not missed.
+                    if self.version <= since:
+                        self._changed.wait(min(WAIT_POLL_INTERVAL, remaining) if polling else remaining)
+                version = self.current()[0] if polling else self.version
+        finally:
+            with self._changed:
+                if self._poller == ident:
+                    # Hand the fingerprint checks over to another waiting long-poll.
+                    self._poller = None
+                    self._changed.notify_all()
+        return version
+
+def _wants_msgpack():
+    if msgpack is None:
+        return False
+    if request.args.get("format", "").lower() == "msgpack":
+        return True
+    return request.accept_mimetypes.best_match(["application/json", MSGPACK_MIMETYPE]) == MSGPACK_MIMETYPE
+
+def versioned_response(document):
+    """
+    Serve a VersionedDocument with ETag/If-None-Match (304 when unchanged), optional long-polling
+    via ?since=<version>&wait=<seconds>, and optional msgpack encoding (?format=msgpack or Accept).
+    """
+    fmt = "msgpack" if _wants_msgpack() else "json"
+    since = request.args.get("since", type=int)
+    if since is not None:
+        if not _long_polls.acquire(blocking=False):
+            return Response(json.dumps({"error": f"at most {MAX_LONG_POLLS} long-polls at a time"}),
+                            status=503, mimetype="application/json", headers={"Retry-After": "5"})
+        try:
+            document.wait_for(since, request.args.get("wait", default=MAX_WAIT, type=float))
+        finally:
+            _long_polls.release()
+
+    version, data = document.body(fmt)
+    etag = document.etag(version, fmt)
+    headers = {"ETag": etag, "Cache-Control": "no-cache", "X-Version": str(version), "Vary": "Accept"}
+    if etag in [tag.strip() for tag in request.headers.get("If-None-Match", "").split(",")]:
+        return Response(status=304, headers=headers)
+    mimetype = MSGPACK_MIMETYPE if fmt == "msgpack" else "application/json"
+    return Response(data, mimetype=mimetype, headers=headers)
@@ -0,0 +1,403 @@
+# video_pipeline.py
+"""
+Headless pipeline over a recorded gameplay video.
+
+Runs the live app's game-state detection, kill-feed reading and analysis, module analysis, map
+recognition and minimap range tracking on frames decoded with OpenCV instead of screen
+captures, as fast as the CPU allows. There is no window, focus check, web server or Windows API
+involved, so it runs on Linux servers:
+
+    python video_pipeline.py match.mp4 [--out sessions/match.wtlog] [--workers N] [--report timing.json]
+                             [--hud-interval 0.5] [--minimap-interval 0.1]
+
+HUD regions are OCR'd every --hud-interval and the minimap is tracked every --minimap-interval
+seconds of video; frames in between are skipped without being decoded. Events go to a session
+log (`python session_recorder.py summary <file>` works on it) timestamped in seconds from the
+start of the video, and a timing report of the time spent per stage is printed (and written as
+JSON with --report).
+
+With --workers N the video is split into N chunks analysed in parallel processes and their logs
+are joined in order. Each chunk after the first starts WARMUP_S early and records only from its
+own first frame, so the game state, map and feed-line consensus have settled by then; the state
+and map are recorded again at that point, which session summaries treat as a continuation.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+
+import cv2
+import numpy as np
+from PIL import Image
+
+import session_recorder
+from analysis import analyze_text, analyze_modules_text
+from feed_lines import FeedLineReader
+from grid_calibration import GridCalibrator
+from image_processing import BAD_FRAME_CONFIDENCE, ocr_image
+from map_config_store import config_store
+from ocr_consensus import LineConsensus
+from ocr_pipeline import PIPELINES, ocr_region, extract_modules_result_from_image
+from range_engine import RangeEngine, measure_blob
+from rangefinder_logic import FrameBuffers, GRID_WIDTH, GRID_HEIGHT, RANGE_RECORD_INTERVAL, detect_markers
+from screen_layout import ScreenLayout
+from session_recorder import record
+from utils import fuzzy_contains, log
+
+# Seconds of video between HUD OCR passes (the live detection loop runs about twice a second)
+HUD_INTERVAL = 0.5
+# Seconds of video between minimap tracking passes (the live loop runs at about 10 Hz)
+MINIMAP_INTERVAL = 0.1
+# Seconds between map-name OCR passes while not in the menu
+MAP_INTERVAL = 2.0
+# Seconds each chunk after the first starts early to settle state before it records
+WARMUP_S = 15.0
+# The live loop ignores the gear region this long after seeing "To Battle!"
+BATTLE_HOLDOFF_S = 10.0
+GEAR_KEYWORDS = ["gear", "rpm", "spd", "km/h", "n"]
+MAIN_MENU_KEYWORDS = ["usa", "germany", "ussr", "great britain", "japan", "china", "italy", "france", "sweden", "israel"]
+
+class VideoLayout(ScreenLayout):
+    """ScreenLayout whose captures are crops of the current video frame."""
+
+    def __init__(self):
+        super().__init__()
+        self.frame = None
+
+    def set_frame(self, frame_bgr):
+        self.frame = cv2.cvtColor(frame_bgr, cv2.COLOR_BGR2RGB, dst=self.frame)
+        size = (frame_bgr.shape[1], frame_bgr.shape[0])
+        if size != self.screen_size:
+            self.refresh(screen_size=size)
+
+    def capture(self, rect):
+        x, y, w, h = rect
+        return Image.fromarray(self.frame[y:y + h, x:x + w])
+
+class Timings:
+    """Wall time spent per pipeline stage."""
+
+    def __init__(self):
+        self.totals = defaultdict(float)
+        self.calls = defaultdict(int)
+
+    @contextmanager
+    def stage(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.totals[name] += time.perf_counter() - start
+            self.calls[name] += 1
+
+    def merge(self, totals, calls):
+        for name, total in totals.items():
+            self.totals[name] += total
+            self.calls[name] += calls[name]
+
+class VideoSession:
+    """Per-process analysis state: what the live loops keep in module globals, clocked by video time."""
+
+    def __init__(self, record_from=0.0):
+        self.layout = VideoLayout()
+        self.timings = Timings()
+        self.record_from = record_from
+        self.now = 0.0
+        self.game_state = "Unknown"
+        self.current_map = None
+        self.last_battle_time = None
+        self.feed_reader = FeedLineReader()
+        self.feed_consensus = LineConsensus()
+        self.range_engine = RangeEngine()
+        self.grid_calibrator = GridCalibrator()
+        self.buffers = FrameBuffers(GRID_HEIGHT, GRID_WIDTH)
+        # Last state and map written to the log; the live state can change during warm-up.
+        self._recorded_state = None
+        self._recorded_map = None
+        self._last_range_record = float("-inf")
+        self._next_map = 0.0
+
+    @property
+    def recording(self):
+        return self.now >= self.record_from
+
+    def _sync_log(self):
+        if not self.recording:
+            return
+        if self.current_map is not None and self.current_map != self._recorded_map:
+            record("map", map=self.current_map)
+            self._recorded_map = self.current_map
+        if self.game_state != self._recorded_state:
+            record("state", state=self.game_state, previous=self._recorded_state)
+            self._recorded_state = self.game_state
+
+    def process(self, frame, timestamp, hud=True, minimap=True):
+        self.now = timestamp
+        with self.timings.stage("convert"):
+            self.layout.set_frame(frame)
+        if hud:
+            self._detect_state()
+            if self.game_state == "In Game":
+                self._read_feed()
+            if self.game_state != "In Menu" and timestamp >= self._next_map:
+                self._next_map = timestamp + MAP_INTERVAL
+                self._read_map()
+            self._sync_log()
+        if minimap and self.game_state == "In Game":
+            self._track_minimap()
+
+    def _detect_state(self):
+        with self.timings.stage("state"):
+            battle_text = ocr_region("battle", self.layout.grab("battle")).text.lower()
+            if "to battle" in battle_text:
+                self.last_battle_time = self.now
+                self.game_state = "In Menu"
+                self.current_map = None
+                self.feed_consensus.reset()
+                self.feed_reader.reset()
+                self.range_engine.reset()
+                return
+            if self.last_battle_time is not None and self.now - self.last_battle_time <= BATTLE_HOLDOFF_S:
+                return
+            gear_text = ocr_region("gear", self.layout.grab("gear")).text.lower()
+            if not fuzzy_contains(gear_text, GEAR_KEYWORDS):
+                self.game_state = "Unknown"
+                return
+            main_menu_text = ocr_region("main_menu", self.layout.grab("main_menu")).text.lower()
+            if any(keyword in main_menu_text for keyword in MAIN_MENU_KEYWORDS):
+                self.game_state = "In Menu"
+            else:
+                self.game_state = "In Game"
+
+    def _read_feed(self):
+        with self.timings.stage("feed"):
+            feed_result = self.feed_reader.read(self.layout.grab("feed"), self.now,
+                                                confirmed=self.feed_consensus.is_confirmed)
+            if feed_result.words and feed_result.confidence < BAD_FRAME_CONFIDENCE:
+                return
+            new_lines = self.feed_consensus.add(feed_result, self.now)
+        if not new_lines or not self.recording:
+            return
+        with self.timings.stage("analysis"):
+            self._sync_log()
+            results = [r for r in (analyze_text(line.text, line.words) for line in new_lines)
+                       if "no significant events detected" not in r.lower()]
+        if not results:
+            return
+        with self.timings.stage("modules"):
+            modules_ocr = extract_modules_result_from_image(self.layout.grab("modules"))
+            modules_result = analyze_modules_text(modules_ocr.text, modules_ocr.words)
+            if "no significant modules detected" not in modules_result.lower():
+                record("modules", modules=modules_result.split("; "))
+
+    def _read_map(self):
+        with self.timings.stage("map"):
+            pipeline = PIPELINES["map_name"]
+            try:
+                processed = pipeline.run(self.layout.grab("map_name"))
+                map_text = ocr_image(processed, config=pipeline.config, preprocess=pipeline.name).text.strip()
+            except Exception as e:
+                log(f"Map name OCR failed at {self.now:.1f}s: {e}", level="ERROR", tag="OCR")
+                return
+            map_name, _ = config_store.lookup(map_text)
+            if map_name is not None:
+                self.current_map = map_name
+
+    def _track_minimap(self):
+        with self.timings.stage("minimap"):
+            buffers = self.buffers
+            grid = np.asarray(self.layout.grab("grid"))
+            img = cv2.cvtColor(grid, cv2.COLOR_RGB2BGR, dst=buffers.frame)
+            gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY, dst=buffers.gray)
+            fit = self.grid_calibrator.update(self.current_map or "Unknown", gray)
+            config = config_store.configs.get(self.current_map) if self.current_map else None
+            if config is None or "cell_size_m" not in config:
+                return
+            mask, player_blobs, ping_mask, ping_blobs, enemy_mask, enemy_blobs = detect_markers(img, buffers)
+            if not player_blobs:
+                return
+            # No jump rejection here: the live loop's hold-last-fix logic exists for the overlay.
+            player_fix = measure_blob(gray, mask, player_blobs[0])
+            fixes = [("ping", measure_blob(gray, ping_mask, blob)) for blob in ping_blobs]
+            fixes += [("enemy", measure_blob(gray, enemy_mask, blob)) for blob in enemy_blobs]
+            if not fixes:
+                return
+            cell_block = fit["cell_block"] if fit is not None else config["cell_block"]
+            targets = self.range_engine.update(player_fix, fixes, self.current_map, cell_block, config["cell_size_m"],
+                                               calibrated=fit is not None, timestamp=self.now)
+        if targets and self.recording and self.now - self._last_range_record >= RANGE_RECORD_INTERVAL:
+            self._last_range_record = self.now
+            for target in targets:
+                record("range", kind=target["kind"], range_m=target["range_m"], sigma_m=target["sigma_m"])
+
+def _open(path):
+    capture = cv2.VideoCapture(path)
+    if not capture.isOpened():
+        raise IOError(f"Cannot open video {path}")
+    fps = capture.get(cv2.CAP_PROP_FPS) or 30.0
+    frames = int(capture.get(cv2.CAP_PROP_FRAME_COUNT))
+    return capture, fps, frames
+
+def run_chunk(path, out_path, start_frame=0, end_frame=None, warmup_frames=0,
+              hud_interval=HUD_INTERVAL, minimap_interval=MINIMAP_INTERVAL):
+    """Analyse frames [start_frame, end_frame) of a video into a session log; returns timing data."""
+    capture, fps, frames = _open(path)
+    end_frame = frames if end_frame is None or end_frame <= 0 else min(end_frame, frames or end_frame)
+    first = max(start_frame - warmup_frames, 0)
+    session = VideoSession(record_from=start_frame / fps)
+    session_recorder.set_clock(lambda: session.now)
+    session_recorder.start_recorder(out_path)
+    if first:
+        capture.set(cv2.CAP_PROP_POS_FRAMES, first)
+    next_hud = next_minimap = first / fps
+    decoded = analysed = warmup_analysed = 0
+    dropped = session_recorder.dropped_events
+    # Warm-up frames overlap the previous chunk: their work is timed apart and left out of the counts.
+    timings, warmup = session.timings, Timings()
+    started = recording_started = time.perf_counter()
+    try:
+        index = first
+        while not end_frame or index < end_frame:
+            timestamp = index / fps
+            if index == start_frame:
+                recording_started = time.perf_counter()
+            session.timings = timings if index >= start_frame else warmup
+            hud, minimap = timestamp >= next_hud, timestamp >= next_minimap
+            with session.timings.stage("decode"):
+                # grab() demuxes without decoding; only frames a stage is due on are retrieved.
+                ok = capture.grab()
+                if ok and (hud or minimap):
+                    ok, frame = capture.retrieve()
+            if not ok:
+                break
+            if hud or minimap:
+                if index >= start_frame:
+                    analysed += 1
+                else:
+                    warmup_analysed += 1
+                if hud:
+                    next_hud = timestamp + hud_interval
+                if minimap:
+                    next_minimap = timestamp + minimap_interval
+                session.process(frame, timestamp, hud=hud, minimap=minimap)
+            if index >= start_frame:
+                decoded += 1
+            index += 1
+    finally:
+        capture.release()
+        session_recorder.stop_recorder(timeout=None)
+        session_recorder.set_clock(None)
+    return {
+        "frames": decoded,
+        "analysed": analysed,
+        "video_s": decoded / fps,
+        "wall_s": time.perf_counter() - recording_started,
+        "warmup_analysed": warmup_analysed,
+        "warmup_s": recording_started - started,
+        "totals": dict(timings.totals),
+        "calls": dict(timings.calls),
+        "dropped_events": session_recorder.dropped_events - dropped,
+        "feed_lines": session.feed_reader.stats(),
+    }
+
+def _join_logs(parts, out_path):
+    """Concatenate chunk logs (in order) into one session file and delete them."""
+    magic = session_recorder.FILE_MAGIC
+    with open(out_path, "wb") as out:
+        out.write(magic)
+        for part in parts:
+            if not os.path.exists(part):
+                continue
+            with open(part, "rb") as f:
+                if f.read(len(magic)) == magic:
+                    out.write(f.read())
+            os.remove(part)
+
+def run_video(path, out_path, workers=1, hud_interval=HUD_INTERVAL, minimap_interval=MINIMAP_INTERVAL):
+    """Analyse a whole video, split across `workers` processes; returns the timing report."""
+    capture, fps, frames = _open(path)
+    capture.release()
+    started = time.perf_counter()
+    if workers <= 1 or frames <= 0:
+        chunks = [run_chunk(path, out_path, hud_interval=hud_interval, minimap_interval=minimap_interval)]
+    else:
+        bounds = np.linspace(0, frames, workers + 1).astype(int)
+        parts = [f"{out_path}.part{i}" for i in range(workers)]
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = [pool.submit(run_chunk, path, part, int(start), int(end), int(WARMUP_S * fps) if start else 0,
+                                   hud_interval, minimap_interval)
+                       for part, start, end in zip(parts, bounds[:-1], bounds[1:])]
+            chunks = [future.result() for future in futures]
+        _join_logs(parts, out_path)
+    return _report(path, out_path, fps, workers, chunks, time.perf_counter() - started)
+
+def _report(path, out_path, fps, workers, chunks, wall_s):
+    timings = Timings()
+    for chunk in chunks:
+        timings.merge(chunk["totals"], chunk["calls"])
+    video_s = sum(chunk["video_s"] for chunk in chunks)
+    cpu_s = sum(chunk["wall_s"] for chunk in chunks)
+    return {
+        "video": path,
+        "session_log": out_path,
+        "workers": workers,
+        "fps": round(fps, 3),
+        "frames": sum(chunk["frames"] for chunk in chunks),
+        "frames_analysed": sum(chunk["analysed"] for chunk in chunks),
+        "warmup_frames_analysed": sum(chunk["warmup_analysed"] for chunk in chunks),
+        "warmup_s": round(sum(chunk["warmup_s"] for chunk in chunks), 1),
+        "video_s": round(video_s, 1),
+        "wall_s": round(wall_s, 1),
+        "realtime_factor": round(video_s / wall_s, 2) if wall_s else None,
+        "dropped_events": sum(chunk["dropped_events"] for chunk in chunks),
+        "stages": {
+            name: {"calls": timings.calls[name], "total_s": round(total, 2),
+                   "mean_ms": round(1000 * total / timings.calls[name], 2),
+                   "share": round(total / cpu_s, 3) if cpu_s else None}
+            for name, total in sorted(timings.totals.items(), key=lambda item: -item[1])
+        },
+    }
+
+def _print_report(report):
+    print(f"{report['video']}: {report['frames']} frames ({report['video_s']:.0f} s of video, "
+          f"{report['frames_analysed']} analysed) in {report['wall_s']:.0f} s with {report['workers']} worker(s) "
+          f"= {report['realtime_factor']}x real time")
+    for name, stage in report["stages"].items():
+        print(f"  {name:10s} {stage['calls']:8d} calls  {stage['total_s']:9.2f} s  {stage['mean_ms']:8.2f} ms/call  "
+              f"{100 * (stage['share'] or 0):5.1f}%")
+    if report["warmup_frames_analysed"]:
+        print(f"  warm-up: {report['warmup_frames_analysed']} frames re-analysed before chunk starts in "
+              f"{report['warmup_s']:.1f} s (not included above)")
+    if report["dropped_events"]:
+        print(f"  {report['dropped_events']} events dropped (session queue full)")
+    print(f"Session log: {report['session_log']}")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run the analysis pipeline over a recorded gameplay video.")
+    parser.add_argument("video")
+    parser.add_argument("--out", help="session log to write (default: sessions/<video name>.wtlog)")
+    parser.add_argument("--workers", type=int, default=1, help="processes to split the video across")
+    parser.add_argument("--hud-interval", type=float, default=HUD_INTERVAL, help="seconds of video between HUD OCR passes")
+    parser.add_argument("--minimap-interval", type=float, default=MINIMAP_INTERVAL,
+                        help="seconds of video between minimap tracking passes")
+    parser.add_argument("--report", help="also write the timing report to this JSON file")
+    args = parser.parse_args(argv)
+
+    out_path = args.out or os.path.join(session_recorder.SESSIONS_DIR,
+                                        os.path.splitext(os.path.basename(args.video))[0] + ".wtlog")
+    if os.path.exists(out_path):
+        os.remove(out_path)
+    log(f"Analysing {args.video} with {args.workers} worker(s) -> {out_path}", level="INFO", tag="PROCESS")
+    report = run_video(args.video, out_path, args.workers, args.hud_interval, args.minimap_interval)
+    _print_report(report)
+    if args.report:
+        with open(args.report, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())